@@ -12,7 +12,7 @@ class MessageError(Exception):
 
 class CommandMessage:
 
-    def __init__(self, home_client: home.Home, message):
+    def __init__(self, home_client: 'home.Home', message):
         self.home_client = home_client
         self.message = message
         self.instructions = None
@@ -57,6 +57,12 @@ class CommandMessage:
     def check_in(self):
         self.home_client.log('here', log_type='check-in')
 
+    def publish_counters(self):
+        self.home_client.log(json.dumps(self.home_client.publish_counters()), log_type='publish-counters')
+
+    def reload_config(self):
+        self.home_client.reload_config()
+
     def update_host(self):
         new_host = self.instructions.get("host")
         if new_host is not None:
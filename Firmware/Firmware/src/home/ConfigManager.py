@@ -1,4 +1,6 @@
+import hashlib
 import json
+import os
 import urequests
 import home.Home as home
 import sys
@@ -34,6 +36,8 @@ class FTPConfig:
 class ConfigManager:
     start_up_settings_path = '/config.json'
     last_run_config_path = '/last-run-config.json'
+    last_run_etag_path = '/last-run-config.etag'
+    publish_spill_path = '/publish-spill.txt'
     start_up_settings = None
     wifi_ssid = None
     wifi_password = None
@@ -48,15 +52,50 @@ class ConfigManager:
     ftp = None
     led_on_after_connect = True
     use_ping = True
+    server_discovery = False
+    device_discovery = False
+    cache_first = True
+    spill_publishes = False
+    # state publish coalescing window in ms, 0 publishes straight away
+    coalesce_ms = 0
+    json_state = False
+    needs_revalidation = False
+    last_run_hash = None
+    last_run_etag = None
 
-    def __save_last_run_config(self):
-        with open(self.last_run_config_path, 'w') as f:
-            json.dump(self.home_device, f)
+    def __save_last_run_config(self, text, etag=None):
+        # only touch flash when the contents actually changed
+        digest = hashlib.sha256(text.encode()).digest()
+        if digest != self.last_run_hash:
+            with open(self.last_run_config_path, 'w') as f:
+                f.write(text)
+            self.last_run_hash = digest
+        if etag != self.last_run_etag:
+            if etag is not None:
+                with open(self.last_run_etag_path, 'w') as f:
+                    f.write(etag)
+            else:
+                try:
+                    os.remove(self.last_run_etag_path)
+                except OSError:
+                    pass
+            self.last_run_etag = etag
+
+    def __load_last_run_etag(self):
+        try:
+            with open(self.last_run_etag_path, 'r') as f:
+                self.last_run_etag = f.read().strip() or None
+        except OSError:
+            self.last_run_etag = None
+        return self.last_run_etag
 
     def __load_last_run_config(self):
         try:
             with open(self.last_run_config_path, 'r') as f:
-                return json.load(f)
+                text = f.read()
+            config = json.loads(text)
+            self.last_run_hash = hashlib.sha256(text.encode()).digest()
+            return config
         except Exception as e:
             print("load last run config error: ", e)
             return None
@@ -77,7 +116,7 @@ class ConfigManager:
             print("load startup settings error: ", e)
             return None
 
-    def __init__(self, home_client: home.Home):
+    def __init__(self, home_client: 'home.Home'):
         self.home_client = home_client
         self.device_id = ubinascii.hexlify(machine.unique_id()).decode()
         self.platform = sys.platform
@@ -87,15 +126,41 @@ class ConfigManager:
         self.host = self.start_up_settings.get('host')
         self.wifi_ssid = self.start_up_settings.get('wifi_ssid')
         self.wifi_password = self.start_up_settings.get('wifi_password')
+        cache_first = self.start_up_settings.get('cache_first')
+        self.cache_first = cache_first if cache_first is not None else self.cache_first
+        # keep log messages that overflow the publish queue on flash until the broker is back
+        self.spill_publishes = self.start_up_settings.get('spill_publishes') is True
 
     def request_device_config(self):
-        url = f'{self.host}/api/home/devices/{self.device_id}'
+        url = f'{self.host}/api/home/devices/{self.device_id}/boot'
         print(f'requesting settings from: {url}')
 
-        response = urequests.get(url)
-        if response.status_code == 200:
-            print(f'received settings')
-            self.home_device = response.json()
+        headers = {}
+        cached = self.home_device
+        etag = self.__load_last_run_etag()
+        if etag is not None:
+            if cached is None:
+                cached = self.__load_last_run_config()
+            if cached is not None:
+                headers['If-None-Match'] = etag
+
+        response = urequests.get(url, headers=headers)
+        try:
+            if response.status_code == 304:
+                print('settings unchanged')
+                self.home_device = cached
+            elif response.status_code == 200:
+                print(f'received settings')
+                text = response.text
+                self.home_device = json.loads(text)
+                if self.home_device is not None:
+                    self.__save_last_run_config(text, response.headers.get('ETag'))
+            else:
+                # an error page says nothing about the config, so treat the server as unreachable
+                print(f'settings request failed: {response.status_code}')
+                self.home_device = None
+        finally:
+            response.close()
 
     def announce_device_to_home_server(self):
         response = urequests.post(f'{self.host}/api/home/devices/add', json={
@@ -114,11 +179,38 @@ class ConfigManager:
             print("device added")
             self.home_device = data['device']
 
+    def parse_boot_profile(self):
+        profile = self.home_device
+        self.name = profile.get('n')
+        self.device_info = profile.get('i')
+        self.sensors = profile.get('s')
+        self.server_discovery = profile.get('d') == 1
+        self.device_discovery = profile.get('dd') == 1
+
+        led_on = profile.get('l')
+        self.led_on_after_connect = led_on if led_on is not None else self.led_on_after_connect
+        use_ping = profile.get('p')
+        self.use_ping = use_ping if use_ping is not None else self.use_ping
+        self.coalesce_ms = profile.get('c') or 0
+        self.json_state = profile.get('j') == 1
+
+        mqtt_config = profile.get('m')
+        ftp_config = profile.get('f')
+        self.mqtt = MQTTConfig(None, mqtt_config[0], mqtt_config[1], mqtt_config[2], mqtt_config[3], None) \
+            if mqtt_config is not None else None
+        self.ftp = FTPConfig(None, ftp_config[0], ftp_config[1], ftp_config[2], None) \
+            if ftp_config is not None else None
+
     def parse_config(self):
+        if self.home_device.get('v') is not None:
+            self.parse_boot_profile()
+            return
         self.name = self.home_device.get('display_name')
         self.device_config = self.home_device.get('config')
         self.device_info = self.home_device.get('device_info')
-        self.sensors = self.device_config.get('sensors')
+        sensors = self.device_config.get('sensors')
+        self.sensors = [[s.get('sensor_type'), s.get('name'), s.get('sensor_config')] for s in sensors] \
+            if sensors is not None else None
 
         device_settings = self.device_config.get('device_settings')
         if device_settings is not None:
@@ -126,6 +218,8 @@ class ConfigManager:
             self.led_on_after_connect = led_on if led_on is not None else self.led_on_after_connect
             use_ping = device_settings.get('use_ping')
             self.use_ping = use_ping if use_ping is not None else self.use_ping
+            self.coalesce_ms = device_settings.get('coalesce_ms') or 0
+            self.json_state = device_settings.get('json_state') is True
 
         wifi_config = self.device_config.get('wifi_network')
         mqtt_config = self.device_config.get('mqtt_broker')
@@ -135,16 +229,45 @@ class ConfigManager:
         self.ftp = FTPConfig(**ftp_config) if ftp_config is not None else None
 
     def obtain_config(self):
-        self.request_device_config()
-        if self.home_device is not None:
-            self.__save_last_run_config()
+        if self.cache_first:
+            self.home_device = self.__load_last_run_config()
+            if self.home_device is not None:
+                # boot now and check with the server once everything is running
+                print('booting from last run config')
+                self.needs_revalidation = True
+                return
+        try:
+            self.request_device_config()
+        except OSError as e:
+            print("settings request error: ", e)
+            self.home_device = None
         if self.home_device is None:
-            self.__load_last_run_config()
+            self.home_device = self.__load_last_run_config()
         if self.home_device is None:
             self.announce_device_to_home_server()
         if self.home_device is None:
             raise ConfigError('Unable to locate device configs')
 
+    def revalidate_config(self):
+        """
+        Checks the config the device booted from against the server.
+
+        :return: True if the server's config differs, False if it is unchanged, None if the server couldn't be reached.
+        """
+        previous = self.home_device
+        previous_hash = self.last_run_hash
+        try:
+            self.request_device_config()
+        except Exception as e:
+            print("config revalidation error: ", e)
+            self.home_device = previous
+            return None
+        if self.home_device is None:
+            self.home_device = previous
+            return None
+        self.needs_revalidation = False
+        return self.last_run_hash != previous_hash
+
     def update_host(self, new_host):
         self.host = new_host
         has_host = self.host is not None and self.host
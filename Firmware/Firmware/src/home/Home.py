@@ -3,12 +3,14 @@ import machine
 import json
 from .WiFiManager import WiFiManager
 from .MQTTManager import MQTTManager
+from .PublishQueue import PublishQueue
+from .PublishCoalescer import PublishCoalescer
 from .UpdateManager import UpdateManager
 from .sensors.StatusLED import StatusLED
 from .SensorManager import SensorManager
 from .ConfigManager import ConfigManager
 from .CommandMessage import CommandMessage, MessageError
-from .Timer import Timer
+from .Timer import Timer, asyncio_module
 
 
 class HomeError(Exception):
@@ -18,6 +20,7 @@ class HomeError(Exception):
 class Home:
     wifi_manager: WiFiManager = None
     mqtt_manager: MQTTManager = None
+    coalescer: PublishCoalescer = None
     update_manager: UpdateManager = None
     sensor_manager: SensorManager = None
     device_info = None
@@ -47,7 +50,8 @@ class Home:
 
     def log(self, log_message, log_type='info'):
         print(log_message)
-        if self.mqtt_manager is not None and self.mqtt_manager.is_connected:
+        if self.mqtt_manager is not None:
+            # queued while disconnected and sent after the reconnect
             self.publish(self.log_topic, json.dumps({
                 "unit_id": self.config_manager.device_id,
                 "display_name": self.config_manager.name,
@@ -68,8 +72,13 @@ class Home:
 
         self.command_topic = f"command/#"
         self.log_topic = f"z-home/log/{self.device_id}"
+        self.json_state_topic = f"z-home/state/{self.device_id}"
         self.timer = None
         self.sensors = []
+        self.next_config_check = None
+        # raw topic bytes -> handler(msg), see add_handler
+        self.handlers = {}
+        self.command_handler_topics = []
         print("\nPlatform: ", self.config_manager.platform, "\nUnit: ", self.device_id)
 
     def connect_wifi(self, ssid, password):
@@ -80,13 +89,31 @@ class Home:
     def connect_mqtt(self):
         if self.config_manager.mqtt is None:
             raise HomeError("no mqtt connection details found")
+        spill_path = self.config_manager.publish_spill_path if self.config_manager.spill_publishes else None
+        queue = PublishQueue(spill_path=spill_path)
+        # every log message matters, state topics only need their latest value
+        queue.set_policy(self.log_topic, PublishQueue.FIFO)
         self.mqtt_manager = MQTTManager(unit_id=self.config_manager.device_id,
                                         server=self.config_manager.mqtt.host,
                                         port=self.config_manager.mqtt.port,
                                         username=self.config_manager.mqtt.username,
-                                        password=self.config_manager.mqtt.password)
+                                        password=self.config_manager.mqtt.password,
+                                        on_reconnect=self.on_mqtt_reconnect,
+                                        queue=queue)
         print("\nconnecting MQTT")
         self.mqtt_manager.connect_mqtt()
+        self.setup_coalescing()
+
+    def setup_coalescing(self):
+        config_manager = self.config_manager
+        if not config_manager.coalesce_ms and not config_manager.json_state:
+            return
+        self.coalescer = PublishCoalescer(self.mqtt_manager.publish,
+                                          window_ms=config_manager.coalesce_ms or PublishCoalescer.DEFAULT_WINDOW_MS,
+                                          json_topic=self.json_state_topic if config_manager.json_state else None)
+
+    def publish_settings(self):
+        return self.config_manager.coalesce_ms, self.config_manager.json_state
 
     def connect_ftp(self):
         if self.config_manager.ftp is not None:
@@ -104,12 +131,42 @@ class Home:
             self.wifi_manager.connect_wifi()
             self.log("Reconnected Wifi")
         if not self.mqtt_manager.is_connected:
-            self.mqtt_manager.connect_mqtt()
-            self.setup_subscriptions()
-            self.log("Reconnected MQTT")
-        else:
-            if self.config_manager.use_ping:
-                self.mqtt_ping()
+            # returns straight away while the reconnect backoff is running
+            self.mqtt_manager.reconnect()
+        elif self.config_manager.use_ping:
+            self.mqtt_ping()
+
+    async def check_connections_async(self):
+        """
+        Same checks as check_connections, for the async runtime: the Wi-Fi reconnect yields while it waits.
+        """
+        if not self.wifi_manager.is_connected():
+            print('Lost Wi-Fi connection. Reconnecting...')
+            await self.wifi_manager.connect_wifi_async()
+            if not self.wifi_manager.is_connected():
+                return
+            self.log("Reconnected Wifi")
+        if not self.mqtt_manager.is_connected:
+            self.mqtt_manager.reconnect()
+        elif self.config_manager.use_ping:
+            self.mqtt_ping()
+
+    async def supervise_connections(self, period_ms=5000):
+        asyncio = asyncio_module()
+        while True:
+            await asyncio.sleep(period_ms / 1000)
+            await self.check_connections_async()
+
+    async def receive_messages(self, period_ms=50):
+        asyncio = asyncio_module()
+        while True:
+            self.check_msg()
+            self.check_config()
+            await asyncio.sleep(period_ms / 1000)
+
+    def on_mqtt_reconnect(self):
+        # the MQTT manager has already restored the callback and subscriptions and sent the queued publishes
+        self.log(f"Reconnected MQTT - publish counters: {self.publish_counters()}")
 
     def set_connection_check_timer(self):
         self.timer = Timer(timer_number=0, period=5000, mode=machine.Timer.PERIODIC, callback=self.check_connections)
@@ -123,59 +180,186 @@ class Home:
     def setup_subscriptions(self):
         self.set_callback(self.on_message)
         self.subscribe(self.command_topic)
+        self.set_command_handlers()
         if self.sensor_manager is not None:
             self.sensor_manager.subscribe_sensors()
 
     def start_sequence(self):
         self.config_manager.get_startup_settings()
         self.connect_wifi(self.config_manager.wifi_ssid, self.config_manager.wifi_password)
+        self.start_services()
+        self.set_connection_check_timer()
+
+    async def start_sequence_async(self):
+        """
+        start_sequence for the async runtime. Connections are then supervised by the
+        supervise_connections task instead of a hardware timer.
+        """
+        self.config_manager.get_startup_settings()
+        self.wifi_manager = WiFiManager(self.config_manager.wifi_ssid, self.config_manager.wifi_password)
+        print("\nconnecting Wi-Fi")
+        await self.wifi_manager.connect_wifi_async()
+        self.start_services()
+
+    def start_services(self):
         self.config_manager.obtain_config()
         self.config_manager.parse_config()
         self.connect_mqtt()
         self.connect_ftp()
 
-        connected = self.wifi_manager.is_connected() and self.mqtt_manager.is_connected
-        if not connected:
-            raise HomeError("Wi-Fi and MQTT Connection Error")
-        self.log("Connected to Wifi and MQTT\n")
+        if not self.wifi_manager.is_connected():
+            raise HomeError("Wi-Fi Connection Error")
+        if self.mqtt_manager.is_connected:
+            self.log("Connected to Wifi and MQTT\n")
+        else:
+            # the sensors come up anyway; the connection check retries the broker with backoff, and publishes
+            # and subscriptions wait in the MQTT manager until it connects
+            self.log("Connected to Wifi, MQTT broker unreachable - retrying\n", log_type='error')
 
-        self.set_connection_check_timer()
         self.setup_sensors()
         self.setup_subscriptions()
-        print(self.sensor_manager.sensors)
+        if self.sensor_manager is not None:
+            print(self.sensor_manager.sensors)
 
         self.status_led_blink()
         if self.config_manager.led_on_after_connect:
             self.status_led_on()
 
-    def on_message(self, topic, msg):
+    def check_config(self):
+        """
+        Revalidates a config loaded from the last run once the device is up, from the main loop.
+        Applies it like reload_config when the server's config has changed, and retries later when the server
+        is unreachable.
+        """
+        if not self.config_manager.needs_revalidation:
+            return
+        now = utime.ticks_ms()
+        if self.next_config_check is not None and utime.ticks_diff(now, self.next_config_check) < 0:
+            return
+        self.reload_config(retry_ms=60000)
+
+    @staticmethod
+    def connection_details(config):
+        if config is None:
+            return None
+        return config.host, getattr(config, 'port', None), config.username, config.password
+
+    def reload_config(self, retry_ms=None):
+        """
+        Fetches the config from the server and applies it without restarting. Only sensors that were added,
+        removed or changed are touched; a changed MQTT broker still restarts the device.
+
+        :param retry_ms: When the server can't be reached, check again after this long instead of logging an error.
+        """
+        config_manager = self.config_manager
+        mqtt_details = self.connection_details(config_manager.mqtt)
+        ftp_details = self.connection_details(config_manager.ftp)
+        publish_settings = self.publish_settings()
+        changed = config_manager.revalidate_config()
+        if changed is None:
+            if retry_ms is not None:
+                self.next_config_check = utime.ticks_add(utime.ticks_ms(), retry_ms)
+            else:
+                self.log("Unable to reload config", log_type='error')
+            return
+        if not changed:
+            print("config unchanged")
+            return
+
+        config_manager.parse_config()
+        # the display name may have changed
+        self.set_command_handlers()
+        if self.connection_details(config_manager.mqtt) != mqtt_details:
+            self.log("MQTT broker changed - Restarting", log_type='restart')
+            self.restart_device(delay_seconds=1)
+            return
+        if self.publish_settings() != publish_settings:
+            # every entity's discovery has to be republished for the new state topics
+            self.log("Publish settings changed - Restarting", log_type='restart')
+            self.restart_device(delay_seconds=1)
+            return
+        if self.connection_details(config_manager.ftp) != ftp_details:
+            self.connect_ftp()
+
+        if config_manager.sensors is not None:
+            if self.sensor_manager is None:
+                self.sensor_manager = SensorManager(self)
+            self.sensor_manager.device_info = config_manager.device_info
+            self.sensor_manager.update_sensors(config_manager.sensors)
+        elif self.sensor_manager is not None:
+            self.sensor_manager.update_sensors([])
+
+        if config_manager.led_on_after_connect:
+            self.status_led_on()
+        else:
+            self.status_led_off()
+        self.log("Config reloaded")
 
-        self.sensor_manager.on_message(topic, msg)
+    def add_handler(self, topic, handler):
+        """
+        Subscribes to a topic and routes its messages to a handler.
 
-        def should_respond():
-            t = topic.decode('utf-8')
-            to_unit_id = t == f'command/{self.config_manager.device_id}'
-            to_all_units = t == 'command/all-units'
-            to_display_name = t == f'command/{self.config_manager.name}'
-            return to_unit_id or to_all_units or to_display_name
+        :param topic: (str) The topic to subscribe to.
+        :param handler: Called with the raw message bytes.
+        """
+        self.handlers[topic.encode()] = handler
+        self.subscribe(topic)
 
-        if should_respond():
-            try:
-                command = CommandMessage(self, msg)
-                command.execute_command()
-            except MessageError as e:
-                self.log(f'MessageError: {e.args}', log_type='error')
-            except Exception as e:
-                self.log(f"Error in Home.on_message: {e}", log_type='error')
+    def remove_handler(self, topic):
+        """
+        Drops a topic's handler and unsubscribes from it if it was subscribed through add_handler.
+        """
+        self.handlers.pop(topic.encode(), None)
+        self.mqtt_manager.unsubscribe(topic)
+
+    def set_command_handlers(self):
+        # command/# is subscribed once; only these topics are acted on
+        for topic in self.command_handler_topics:
+            self.remove_handler(topic)
+        self.command_handler_topics = [f'command/{self.config_manager.device_id}', 'command/all-units']
+        if self.config_manager.name:
+            self.command_handler_topics.append(f'command/{self.config_manager.name}')
+        for topic in self.command_handler_topics:
+            self.handlers[topic.encode()] = self.on_command
 
-    def publish(self, topic, message, **kwargs):
+    def on_message(self, topic, msg):
+        # topic arrives as bytes and is looked up as-is; nothing is decoded unless a handler matches
+        handler = self.handlers.get(topic)
+        if handler is not None:
+            handler(msg)
+
+    def on_command(self, msg):
+        try:
+            command = CommandMessage(self, msg)
+            command.execute_command()
+        except MessageError as e:
+            self.log(f'MessageError: {e.args}', log_type='error')
+        except Exception as e:
+            self.log(f"Error in Home.on_message: {e}", log_type='error')
+
+    def publish(self, topic, message, retain=False):
         """
-        Publishes a message to a specific topic on the MQTT broker.
+        Publishes a message to a specific topic on the MQTT broker. With coalescing on, state publishes
+        (not retained, and latest-value-wins in the publish queue) are held briefly and sent together.
 
         :param topic: The topic to publish the message to.
         :param message: The message to be published.
+        :param retain: Publish as a retained message.
+        """
+        if self.coalescer is not None and not retain \
+                and self.mqtt_manager.queue.policy(topic) == PublishQueue.KEEP_LATEST:
+            self.coalescer.put(topic, message)
+            return
+        self.mqtt_manager.publish(topic, message, retain)
+
+    def publish_counters(self):
+        """
+        :return: Publish queue counters, and the coalescing counters when coalescing is on.
         """
-        self.mqtt_manager.publish(topic, message, **kwargs)
+        counters = self.mqtt_manager.queue.counters()
+        if self.coalescer is not None:
+            counters["coalesced"] = self.coalescer.counters()
+        return counters
 
     def subscribe(self, topic):
         """
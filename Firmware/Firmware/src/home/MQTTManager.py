@@ -1,13 +1,40 @@
 from .lib.umqtt.simple import MQTTClient, MQTTException
+from .PublishQueue import PublishQueue
+import struct
 import utime
 
 
+def unsubscribe(client, topic):
+    """
+    Unsubscribes the client from a topic. umqtt.simple has no unsubscribe, so the UNSUBSCRIBE packet is
+    written the way its subscribe() writes SUBSCRIBE, and the UNSUBACK is read back before returning.
+    """
+    if hasattr(client, 'unsubscribe'):
+        client.unsubscribe(topic)
+        return
+    pkt = bytearray(b"\xa2\0\0\0")
+    client.pid += 1
+    struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic), client.pid)
+    client.sock.write(pkt)
+    client._send_str(topic)
+    while True:
+        if client.wait_msg() == 0xb0:
+            client.sock.read(3)
+            return
+
+
 class MQTTManager:
     """
     MQTTManager class helps to manage the MQTT client of the device.
     """
 
-    def __init__(self, unit_id, server, port, username, password):
+    # connection states
+    DISCONNECTED = 0
+    CONNECTED = 1
+    BACKOFF = 2
+
+    def __init__(self, unit_id, server, port, username, password,
+                 backoff_base_ms=1000, backoff_max_ms=60000, on_reconnect=None, queue=None):
         """
         Initializes MQTTManager with provided parameters.
 
@@ -17,6 +44,10 @@ class MQTTManager:
         :param port: (int) The port number of the MQTT broker server.
         :param username: (str) The username for the MQTT broker server.
         :param password: (str) The password for the MQTT broker server.
+        :param backoff_base_ms: (int) Delay before the first reconnect attempt, doubled after every failed attempt.
+        :param backoff_max_ms: (int) Upper bound for the reconnect delay.
+        :param on_reconnect: Called without arguments after a reconnect, once the subscriptions are restored.
+        :param queue: (PublishQueue) Holds publishes made while disconnected. Defaults to a 32 slot queue.
         """
         self.unit_id = unit_id
         self.server = server
@@ -24,47 +55,199 @@ class MQTTManager:
         self.username = username
         self.password = password
         self.mqtt_client = None
+        self.state = MQTTManager.DISCONNECTED
+        self.is_connected = False
+        self.backoff_base_ms = backoff_base_ms
+        self.backoff_max_ms = backoff_max_ms
+        self.on_reconnect = on_reconnect
+        self.failures = 0
+        self.next_attempt = None
+        self.has_connected = False
+        # replayed on every new connection, the clean session drops them on the broker
+        self.callback = None
+        self.subscriptions = []
+        self._jitter = self._jitter_seed(unit_id)
+        self.queue = queue if queue is not None else PublishQueue()
+
+    @staticmethod
+    def _jitter_seed(unit_id):
+        seed = 0
+        for c in str(unit_id).encode():
+            seed = (seed * 31 + c) & 0xffffffff
+        return seed or 1
+
+    def _random(self):
+        # xorshift32, seeded per device so a fleet doesn't retry in lockstep after a broker restart
+        x = self._jitter
+        x ^= (x << 13) & 0xffffffff
+        x ^= x >> 17
+        x ^= (x << 5) & 0xffffffff
+        self._jitter = x
+        return x
+
+    def backoff_delay_ms(self):
+        """
+        Capped exponential backoff with equal jitter: half of the delay is fixed, the other half random.
+
+        :return: (int) The delay before the next connection attempt in milliseconds.
+        """
+        delay = min(self.backoff_max_ms, self.backoff_base_ms << min(self.failures - 1, 16))
+        half = delay // 2
+        return half + self._random() % (half + 1)
+
+    def _schedule_reconnect(self):
+        self.state = MQTTManager.BACKOFF
         self.is_connected = False
+        self.failures += 1
+        delay = self.backoff_delay_ms()
+        self.next_attempt = utime.ticks_add(utime.ticks_ms(), delay)
+        print(f"MQTT reconnect in {delay} ms")
+
+    def _connection_lost(self):
+        print("OSError - possibly lost connection to broker")
+        try:
+            self.mqtt_client.sock.close()
+        except Exception:
+            pass
+        self.mqtt_client = None
+        self._schedule_reconnect()
 
     def connect_mqtt(self, clean_session=True):
         """
-        Connects to the MQTT broker with provided server, port, username, and password.
+        Makes one attempt to connect to the MQTT broker. A failed attempt schedules the next one
+        instead of sleeping; see reconnect().
+
+        :return: (bool) True when connected.
         """
         self.mqtt_client = MQTTClient(self.unit_id, self.server, self.port, self.username, self.password, keepalive=60)
         try:
+            # returns once the broker's CONNACK has been read
             self.mqtt_client.connect(clean_session)
-            self.is_connected = True
-            print('Connected to MQTT broker:', self.server)
         except MQTTException:
             print("MQTTException - Try checking connection configs")
-            self.is_connected = False
-            utime.sleep(5)
+            self.mqtt_client = None
+            self._schedule_reconnect()
+            return False
         except OSError:
             print("MQTT Connection Error")
-            self.is_connected = False
-            utime.sleep(10)
+            self.mqtt_client = None
+            self._schedule_reconnect()
+            return False
+        print('Connected to MQTT broker:', self.server)
+        self.state = MQTTManager.CONNECTED
+        self.is_connected = True
+        self.failures = 0
+        self.next_attempt = None
+        reconnected = self.has_connected
+        self.has_connected = True
+        if not self._restore_subscriptions() or not self.flush():
+            return False
+        if reconnected and self.on_reconnect is not None:
+            self.on_reconnect()
+        return True
+
+    def _restore_subscriptions(self):
+        if self.callback is not None:
+            self.mqtt_client.set_callback(self.callback)
+        try:
+            for topic in self.subscriptions:
+                self.mqtt_client.subscribe(topic)
+        except OSError:
+            self._connection_lost()
+            return False
+        return True
 
-    def publish(self, topic, message, **kwargs):
+    def reconnect(self):
         """
-        Publishes a message to a specific topic on the MQTT broker.
+        Advances the reconnect state machine without blocking: connects when the backoff delay has passed,
+        and otherwise returns straight away.
+
+        :return: (bool) True when connected.
+        """
+        if self.state == MQTTManager.CONNECTED:
+            return True
+        if self.next_attempt is not None and utime.ticks_diff(utime.ticks_ms(), self.next_attempt) < 0:
+            return False
+        return self.connect_mqtt()
+
+    def publish(self, topic, message, retain=False):
+        """
+        Publishes a message to a specific topic on the MQTT broker. While disconnected, or while older
+        messages are still waiting, the message is queued and sent in order after the reconnect.
 
         :param topic: The topic to publish the message to.
         :param message: The message to be published.
+        :param retain: Publish as a retained message.
         """
+        if self.state != MQTTManager.CONNECTED or len(self.queue):
+            self.queue.put(topic, message, retain)
+            self.flush()
+            return
+        try:
+            self.mqtt_client.publish(topic, message, retain)
+        except OSError:
+            self.queue.put(topic, message, retain)
+            self._connection_lost()
+
+    def _publish_spilled(self, topic, message, retain):
         try:
-            self.mqtt_client.publish(topic, message, **kwargs)
+            self.mqtt_client.publish(topic, message, retain)
+            return True
         except OSError:
-            print("OSError - possibly lost connection to broker")
-            self.is_connected = False
-            utime.sleep(3)
+            self._connection_lost()
+            return False
+
+    def flush(self):
+        """
+        Sends the queued publishes in order, starting with the ones spilled to flash.
+
+        :return: (bool) True when everything was sent, False if the connection is down.
+        """
+        if self.state != MQTTManager.CONNECTED:
+            return False
+        queue = self.queue
+        if not queue.drain_spill(self._publish_spilled):
+            return False
+        while len(queue):
+            i = queue.peek()
+            try:
+                self.mqtt_client.publish(queue.topics[i], queue.messages[i], queue.retained[i])
+            except OSError:
+                self._connection_lost()
+                return False
+            queue.pop()
+        return True
 
     def subscribe(self, topic: str):
         """
-        Subscribes to a specific topic on the MQTT broker.
+        Subscribes to a specific topic on the MQTT broker. The subscription is restored after every reconnect.
 
         :param topic: The topic to subscribe to.
         """
-        self.mqtt_client.subscribe(topic)
+        if topic not in self.subscriptions:
+            self.subscriptions.append(topic)
+        if self.state != MQTTManager.CONNECTED:
+            return
+        try:
+            self.mqtt_client.subscribe(topic)
+        except OSError:
+            self._connection_lost()
+
+    def unsubscribe(self, topic: str):
+        """
+        Unsubscribes from a topic and stops restoring it after reconnects.
+
+        :param topic: The topic to unsubscribe from.
+        """
+        if topic not in self.subscriptions:
+            return
+        self.subscriptions.remove(topic)
+        if self.state != MQTTManager.CONNECTED:
+            return
+        try:
+            unsubscribe(self.mqtt_client, topic)
+        except OSError:
+            self._connection_lost()
 
     def set_callback(self, callback_function):
         """
@@ -72,23 +255,27 @@ class MQTTManager:
 
         :param callback_function: The callback function.
         """
-        self.mqtt_client.set_callback(callback_function)
+        self.callback = callback_function
+        if self.mqtt_client is not None:
+            self.mqtt_client.set_callback(callback_function)
 
     def check_msg(self):
         """
-        Checks for any incoming messages on the subscribed topics.
+        Checks for any incoming messages on the subscribed topics. While disconnected this steps the
+        reconnect state machine instead.
         """
+        if self.state != MQTTManager.CONNECTED:
+            self.reconnect()
+            return
         try:
             self.mqtt_client.check_msg()
         except OSError:
-            print("OSError - possibly lost connection to broker")
-            self.is_connected = False
-            utime.sleep(3)
+            self._connection_lost()
 
     def ping(self):
+        if self.state != MQTTManager.CONNECTED:
+            return
         try:
             self.mqtt_client.ping()
         except OSError:
-            print("OSError - possibly lost connection to broker")
-            self.is_connected = False
-            utime.sleep(3)
+            self._connection_lost()
@@ -0,0 +1,129 @@
+import json
+from .Timer import Timer
+
+# discovery keys that point an entity at a state topic, and the template key that reads its value
+# out of the packed JSON state message; light and fan use state_value_template for their on/off state
+STATE_TEMPLATE_KEYS = {
+    "state_topic": "value_template",
+    "brightness_state_topic": "brightness_value_template",
+    "percentage_state_topic": "percentage_value_template",
+}
+STATE_VALUE_TEMPLATE_PLATFORMS = ("light", "fan")
+
+
+def json_state_config(platform, config, json_topic):
+    """
+    Points an entity's discovery config at the packed JSON state message: each state topic becomes
+    json_topic, with a template that picks the entity's value by its original topic. The add-on renders the
+    same configs with its copy in FlaskApp/discovery.py, so a change here has to be made there too; the add-on's
+    Test_Discovery checks that the two agree.
+
+    :param platform: Home Assistant platform of the entity, e.g. "light".
+    :param config: The discovery config, changed in place.
+    :param json_topic: Topic of the packed state message.
+    :return: The config.
+    """
+    for key, template_key in STATE_TEMPLATE_KEYS.items():
+        topic = config.get(key)
+        if topic is None:
+            continue
+        if key == "state_topic" and platform in STATE_VALUE_TEMPLATE_PLATFORMS:
+            template_key = "state_value_template"
+        config[key] = json_topic
+        config[template_key] = "{{ value_json['" + topic + "'] }}"
+    return config
+
+
+def state_topics(config):
+    return [config[key] for key in STATE_TEMPLATE_KEYS if config.get(key) is not None]
+
+
+class PublishCoalescer:
+    """
+    Holds state publishes for a short window and sends them together in one pass. Within the window a
+    topic keeps only its latest value, so back-to-back state and brightness publishes or a run of slider
+    steps each go out once.
+
+    With a json_topic the pass sends a single message instead, a JSON object of every state topic's
+    latest value, which entities read through the templates from json_state_config.
+    """
+    DEFAULT_WINDOW_MS = 50
+
+    def __init__(self, publish, window_ms=DEFAULT_WINDOW_MS, json_topic=None):
+        """
+        :param publish: Called as publish(topic, message) to send a message.
+        :param window_ms: How long a state is held for newer values before it is sent.
+        :param json_topic: Topic of the packed state message, None to send each topic on its own.
+        """
+        self.publish = publish
+        self.window_ms = window_ms
+        self.json_topic = json_topic
+        self.pending = {}
+        # latest value of every state topic, packed into each JSON state message
+        self.states = {}
+        # topic -> [publishes requested, publishes saved]
+        self.topic_counters = {}
+        self.sent = 0
+        self.timer = Timer(timer_number=0,
+                           mode=Timer.ONE_SHOT,
+                           period=window_ms,
+                           callback=self.flush,
+                           autostart=False)
+
+    def put(self, topic, message):
+        counter = self.topic_counters.get(topic)
+        if counter is None:
+            counter = self.topic_counters[topic] = [0, 0]
+        counter[0] += 1
+        if topic in self.pending:
+            # the value it replaces is never sent
+            counter[1] += 1
+        self.pending[topic] = message
+        if not self.timer.active:
+            self.timer.start()
+
+    def flush(self):
+        """
+        Sends everything held in the window.
+        """
+        self.timer.stop()
+        if not self.pending:
+            return
+        pending = self.pending
+        self.pending = {}
+        if self.json_topic is not None:
+            first = True
+            for topic, message in pending.items():
+                self.states[topic] = message
+                if first:
+                    # the state message stands in for the first topic's own publish
+                    first = False
+                else:
+                    # packed into that message instead of its own
+                    self.topic_counters[topic][1] += 1
+            self.publish(self.json_topic, json.dumps(self.states))
+            self.sent += 1
+            return
+        for topic, message in pending.items():
+            self.publish(topic, message)
+            self.sent += 1
+
+    def discard(self, topic):
+        """
+        Forgets a topic whose entity was removed, so it's no longer part of the JSON state message.
+        """
+        self.pending.pop(topic, None)
+        self.states.pop(topic, None)
+        self.topic_counters.pop(topic, None)
+
+    def counters(self):
+        """
+        :return: {"sent": messages sent, "saved": publishes that didn't need a message of their own,
+            "topics": {topic: [publishes requested, publishes saved]}}
+        """
+        return {"sent": self.sent,
+                "saved": sum(saved for _, saved in self.topic_counters.values()),
+                "topics": self.topic_counters}
+
+    def deinit(self):
+        self.timer.deinit()
@@ -0,0 +1,164 @@
+import json
+import os
+
+
+class PublishQueue:
+    """
+    Fixed-size ring buffer of publishes waiting for the MQTT connection. The slots are allocated once,
+    so queueing a message only stores references.
+
+    Each topic has a policy: KEEP_LATEST holds one slot per topic and overwrites it in place, which suits
+    state topics where only the newest value matters; FIFO keeps every message in order, for logs.
+    When the buffer is full the oldest message is dropped, or written to the spill file when that is
+    enabled and the message is FIFO.
+    """
+    KEEP_LATEST = 0
+    FIFO = 1
+
+    def __init__(self, size=32, spill_path=None, spill_max_bytes=4096):
+        """
+        :param size: (int) Number of slots.
+        :param spill_path: (str) Flash file for FIFO messages that don't fit in the buffer, None to drop them.
+        :param spill_max_bytes: (int) Size limit of the spill file; messages are dropped beyond it.
+        """
+        self.size = size
+        self.topics = [None] * size
+        self.messages = [None] * size
+        self.retained = [False] * size
+        self.head = 0
+        self.count = 0
+        self.policies = {}
+        self.default_policy = PublishQueue.KEEP_LATEST
+        self.spill_path = spill_path
+        self.spill_max_bytes = spill_max_bytes
+        self.spill_bytes = self._spill_size()
+        # counters since boot
+        self.dropped = 0
+        self.replaced = 0
+        self.spilled = 0
+
+    def __len__(self):
+        return self.count
+
+    def set_policy(self, topic, policy):
+        self.policies[topic] = policy
+
+    def policy(self, topic):
+        return self.policies.get(topic, self.default_policy)
+
+    def counters(self):
+        return {"queued": self.count, "dropped": self.dropped, "replaced": self.replaced, "spilled": self.spilled}
+
+    def _find(self, topic):
+        for n in range(self.count):
+            i = (self.head + n) % self.size
+            if self.topics[i] == topic:
+                return i
+        return None
+
+    def put(self, topic, message, retain=False):
+        """
+        Queues a publish.
+
+        :param topic: The topic to publish the message to.
+        :param message: The message to be published.
+        :param retain: Publish as a retained message.
+        """
+        if self.policy(topic) == PublishQueue.KEEP_LATEST:
+            i = self._find(topic)
+            if i is not None:
+                self.messages[i] = message
+                self.retained[i] = retain
+                self.replaced += 1
+                return
+        if self.count == self.size:
+            self._evict()
+        i = (self.head + self.count) % self.size
+        self.topics[i] = topic
+        self.messages[i] = message
+        self.retained[i] = retain
+        self.count += 1
+
+    def peek(self):
+        """
+        :return: The slot index of the oldest queued publish, or None when the queue is empty.
+        """
+        return self.head if self.count else None
+
+    def pop(self):
+        i = self.head
+        self.topics[i] = None
+        self.messages[i] = None
+        self.retained[i] = False
+        self.head = (i + 1) % self.size
+        self.count -= 1
+
+    def _evict(self):
+        i = self.head
+        if self.spill_path is not None and self.policy(self.topics[i]) == PublishQueue.FIFO:
+            if self._spill(self.topics[i], self.messages[i], self.retained[i]):
+                self.spilled += 1
+                self.pop()
+                return
+        self.dropped += 1
+        self.pop()
+
+    def _spill_size(self):
+        if self.spill_path is None:
+            return 0
+        try:
+            return os.stat(self.spill_path)[6]
+        except OSError:
+            return 0
+
+    def _spill(self, topic, message, retain):
+        if isinstance(message, bytes):
+            message = message.decode()
+        line = json.dumps([topic, message, retain]) + '\n'
+        if self.spill_bytes + len(line) > self.spill_max_bytes:
+            return False
+        try:
+            with open(self.spill_path, 'a') as f:
+                f.write(line)
+        except OSError:
+            return False
+        self.spill_bytes += len(line)
+        return True
+
+    def drain_spill(self, publish):
+        """
+        Publishes the spilled messages, which are older than anything in the buffer, in the order they were spilled.
+
+        :param publish: Called as publish(topic, message, retain) and returns False when the publish failed.
+        :return: (bool) True when the spill file is empty, False if a publish failed; the rest stays on flash.
+        """
+        if self.spill_path is None or self.spill_bytes == 0:
+            return True
+        try:
+            with open(self.spill_path, 'r') as f:
+                lines = f.readlines()
+        except OSError:
+            lines = []
+        for n, line in enumerate(lines):
+            try:
+                topic, message, retain = json.loads(line)
+            except ValueError:
+                continue
+            if not publish(topic, message, retain):
+                self._rewrite_spill(lines[n:])
+                return False
+        self._rewrite_spill([])
+        return True
+
+    def _rewrite_spill(self, lines):
+        if lines:
+            with open(self.spill_path, 'w') as f:
+                for line in lines:
+                    f.write(line)
+            self.spill_bytes = sum(len(line) for line in lines)
+            return
+        try:
+            os.remove(self.spill_path)
+        except OSError:
+            pass
+        self.spill_bytes = 0
@@ -1,47 +1,183 @@
+import json
 import home.Home
+from .PublishCoalescer import json_state_config, state_topics
 from .sensors import HomeMotionSensor, HomeWeatherSensor, HomeLEDDimmer, HomeFan
 
 
 class SensorManager:
 
-    def __init__(self, home_client: home.Home):
+    def __init__(self, home_client: 'home.Home'):
         self.home_client = home_client
         self.sensor_configs = self.home_client.config_manager.sensors
         self.device_info = self.home_client.config_manager.device_info
         self.sensors = []
+        # (sensor_type, name) -> (sensor_config, sensor_index, sensor) for every running sensor
+        self.running = {}
 
     def create_sensors(self):
-        for i in self.sensor_configs:
-            sensor_type = i.get('sensor_type')
-            name = i.get('name')
-            sensor_config = i.get('sensor_config')
-            topics = sensor_config.get('topics') if sensor_config is not None else None
-            sensor_index = self.sensor_configs.index(i) + 1
-            if sensor_type == "motion":
-                self.create_motion_sensor(name, sensor_config, topics, sensor_index)
-            elif sensor_type == "led":
-                self.create_led_dimmer(name, sensor_config, topics, sensor_index)
-            elif sensor_type == "fan":
-                self.create_fan(name, sensor_config, topics, sensor_index)
-            elif sensor_type == "weather":
-                self.create_weather_sensor(name, sensor_config, topics, sensor_index)
+        # sensor configs are [sensor_type, name, sensor_config] as parsed by ConfigManager
+        for sensor_index, (sensor_type, name, sensor_config) in enumerate(self.sensor_configs, 1):
+            self.create_sensor(sensor_type, name, sensor_config, sensor_index)
+        if self.publishes_device_discovery():
+            self.publish_device_discovery()
+
+    def create_sensor(self, sensor_type, name, sensor_config, sensor_index):
+        topics = sensor_config.get('topics') if sensor_config is not None else None
+        count = len(self.sensors)
+        if sensor_type == "motion":
+            self.create_motion_sensor(name, sensor_config, topics, sensor_index)
+        elif sensor_type == "led":
+            self.create_led_dimmer(name, sensor_config, topics, sensor_index)
+        elif sensor_type == "fan":
+            self.create_fan(name, sensor_config, topics, sensor_index)
+        elif sensor_type == "weather":
+            self.create_weather_sensor(name, sensor_config, topics, sensor_index)
+        if len(self.sensors) == count:
+            return None
+        sensor = self.sensors[-1]
+        self.running[(sensor_type, name)] = (sensor_config, sensor_index, sensor)
+        return sensor
+
+    def remove_sensor(self, key, clear_discovery=True):
+        """
+        Stops a running sensor and releases its pins and timers.
+
+        :param key: The (sensor_type, name) of the sensor.
+        :param clear_discovery: Remove the sensor's entities from Home Assistant when this device publishes discovery.
+        :return: The sensor's discovery components.
+        """
+        _, _, sensor = self.running.pop(key)
+        self.sensors.remove(sensor)
+        for topic in getattr(sensor, 'command_handlers', ()):
+            self.home_client.remove_handler(topic)
+        if hasattr(sensor, 'deinit'):
+            sensor.deinit()
+        coalescer = self.home_client.coalescer
+        components = sensor.discovery_components(self.device_info)
+        if coalescer is not None:
+            for _, _, _, config in components:
+                for topic in state_topics(config):
+                    coalescer.discard(topic)
+        if clear_discovery:
+            self.clear_discovery(topic for topic, _, _, _ in components)
+        return components
+
+    def clear_discovery(self, topics):
+        # only per-entity discovery published by the device itself leaves retained topics behind
+        config_manager = self.home_client.config_manager
+        if not config_manager.server_discovery and not config_manager.device_discovery:
+            for topic in topics:
+                self.home_client.publish(topic, '', retain=True)
+
+    def move_sensor(self, key, sensor_index):
+        """
+        Gives a running sensor its new position in the profile. Weather sensors' unique ids follow the index,
+        so their discovery is republished.
+        """
+        sensor_config, _, sensor = self.running[key]
+        self.running[key] = (sensor_config, sensor_index, sensor)
+        if hasattr(sensor, 'sensor_index'):
+            sensor.sensor_index = sensor_index
+            self.publish_discovery(sensor)
+
+    def update_sensors(self, sensor_configs):
+        """
+        Applies a new sensor list to the running sensors. Sensors are matched by (sensor_type, name);
+        only the ones that were added, removed or whose config changed are torn down or created.
+
+        :param sensor_configs: The new [sensor_type, name, sensor_config] list.
+        :return: The sensors that were created.
+        """
+        # sensors are indexed by their position in the profile, like the add-on numbers them
+        wanted = {}
+        for sensor_index, (sensor_type, name, sensor_config) in enumerate(sensor_configs, 1):
+            wanted[(sensor_type, name)] = (sensor_config, sensor_index)
+        # discovery topics of reconfigured sensors; the ones their replacements no longer use are cleared
+        replaced = {}
+        for key in list(self.running):
+            if key not in wanted:
+                self.remove_sensor(key)
+            elif wanted[key][0] != self.running[key][0]:
+                replaced[key] = [topic for topic, _, _, _ in self.remove_sensor(key, clear_discovery=False)]
+
+        created = []
+        for key, (sensor_config, sensor_index) in wanted.items():
+            if key in self.running:
+                if self.running[key][1] != sensor_index:
+                    self.move_sensor(key, sensor_index)
+                continue
+            sensor_type, name = key
+            sensor = self.create_sensor(sensor_type, name, sensor_config, sensor_index)
+            current = []
+            if sensor is not None:
+                created.append(sensor)
+                self.subscribe_sensor(sensor)
+                current = [topic for topic, _, _, _ in sensor.discovery_components(self.device_info)]
+            self.clear_discovery(topic for topic in replaced.get(key, ()) if topic not in current)
+        self.sensor_configs = sensor_configs
+        if self.publishes_device_discovery():
+            self.publish_device_discovery()
+        return created
+
+    def publishes_device_discovery(self):
+        config_manager = self.home_client.config_manager
+        return config_manager.device_discovery and not config_manager.server_discovery
+
+    def publish_discovery(self, sensor):
+        # the add-on publishes discovery itself when the boot profile says so,
+        # and in device discovery mode all sensors go out together once they are created
+        config_manager = self.home_client.config_manager
+        if not config_manager.server_discovery and not config_manager.device_discovery:
+            if not config_manager.json_state:
+                sensor.publish_discovery(self.device_info)
+                return
+            for topic, _, _, config in self.discovery_components(sensor):
+                config["device"] = self.device_info
+                self.home_client.publish(topic, json.dumps(config), retain=True)
+
+    def discovery_components(self, sensor):
+        """
+        The sensor's discovery components, pointed at the device's packed state message in JSON state mode.
+        """
+        components = sensor.discovery_components(self.device_info)
+        if self.home_client.config_manager.json_state:
+            for _, platform, _, config in components:
+                json_state_config(platform, config, self.home_client.json_state_topic)
+        return components
+
+    def publish_device_discovery(self):
+        """
+        Publishes one Home Assistant device-based discovery message listing the entities of every sensor.
+        """
+        components = {}
+        for s in self.sensors:
+            for _, platform, object_id, config in self.discovery_components(s):
+                config["p"] = platform
+                components[object_id] = config
+        topic = f"homeassistant/device/{self.home_client.device_id}/config"
+        print("Device Discovery Topic: ", topic)
+        self.home_client.publish(topic, json.dumps({
+            "dev": self.device_info,
+            "o": {"name": "zHome"},
+            "cmps": components
+        }), retain=True)
 
     def create_motion_sensor(self, name, sensor_config, topics, sensor_index):
         motion = HomeMotionSensor(self.home_client, name, sensor_config, topics, sensor_index)
-        motion.publish_discovery(self.device_info)
+        self.publish_discovery(motion)
         motion.enable_interrupt()
         self.sensors.append(motion)
 
     def create_led_dimmer(self, name, sensor_config, topics, sensor_index):
         led = HomeLEDDimmer(self.home_client, name, sensor_config, topics, sensor_index)
-        led.publish_discovery(self.device_info)
+        self.publish_discovery(led)
         led.publish_brightness()
         led.publish_state()
         self.sensors.append(led)
 
     def create_fan(self, name, sensor_config, topics, sensor_index):
         fan = HomeFan(self.home_client, name, sensor_config, topics, sensor_index)
-        fan.publish_discovery(self.device_info)
+        self.publish_discovery(fan)
         fan.publish_percentage()
         fan.publish_state()
         self.sensors.append(fan)
@@ -49,22 +185,20 @@ class SensorManager:
     def create_weather_sensor(self, name, sensor_config, topics, sensor_index):
         measurement_interval_ms = sensor_config.get('measurement_interval_ms')
         weather = HomeWeatherSensor(self.home_client, name, sensor_config, topics, sensor_index)
-        weather.publish_discovery(self.device_info)
+        self.publish_discovery(weather)
         weather.enable_interrupt(measurement_interval_ms)
         self.sensors.append(weather)
 
     def subscribe_sensors(self):
         for s in self.sensors:
-            print("\nsubscribing sensor: ", s)
-            if hasattr(s, 'subscribe_to'):
-                for t in s.subscribe_to:
-                    print("\tsubscribed to: ", t)
-                    self.home_client.subscribe(t)
+            self.subscribe_sensor(s)
 
-    def on_message(self, topic, msg):
-        for s in self.sensors:
-            if hasattr(s, 'on_message'):
-                s.on_message(topic, msg)
+    def subscribe_sensor(self, s):
+        print("\nsubscribing sensor: ", s)
+        if hasattr(s, 'command_handlers'):
+            for t, handler in s.command_handlers.items():
+                print("\tsubscribed to: ", t)
+                self.home_client.add_handler(t, handler)
 
 
 
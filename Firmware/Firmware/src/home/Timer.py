@@ -1,35 +1,255 @@
 import machine
+import micropython
 import sys
+import utime
+
+
+def asyncio_module():
+    try:
+        import uasyncio as asyncio
+    except ImportError:
+        import asyncio
+    return asyncio
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel that runs every Timer from one hardware timer. The hardware tick only schedules
+    run() with micropython.schedule, so callbacks execute outside IRQ context.
+
+    Timers are their own wheel entries: each slot is a doubly linked list threaded through the Timer
+    objects, so insert and cancel are O(1) and nothing is allocated per start or stop.
+    """
+    instance = None
+
+    @classmethod
+    def get(cls):
+        if cls.instance is None:
+            cls.instance = TimerWheel()
+        return cls.instance
+
+    def __init__(self, tick_ms=10, slots=64, hardware_timer=0):
+        """
+        :param tick_ms: Resolution of the wheel; periods are rounded up to whole ticks.
+        :param slots: Number of slots, a power of two.
+        :param hardware_timer: Hardware timer number on ESP32, the only one the firmware uses.
+        """
+        self.tick_ms = tick_ms
+        self.mask = slots - 1
+        self.heads = [None] * slots
+        self.tick = 0
+        self.started = utime.ticks_ms()
+        self.pending = False
+        # set while the main program links or unlinks a timer; a tick landing then is skipped
+        self.mutating = False
+        self._run = self.run
+        platform = sys.platform
+        if platform == "rp2":
+            self._timer = machine.Timer(mode=machine.Timer.PERIODIC, period=tick_ms, callback=self._irq)
+        elif platform == "esp32":
+            self._timer = machine.Timer(hardware_timer)
+            self._timer.init(mode=machine.Timer.PERIODIC, period=tick_ms, callback=self._irq)
+        else:
+            raise Exception(f"Unsupported platform: {platform}")
+
+    def _irq(self, _):
+        if self.pending:
+            return
+        self.pending = True
+        try:
+            micropython.schedule(self._run, None)
+        except RuntimeError:
+            # schedule queue full, try again next tick
+            self.pending = False
+
+    def now_tick(self):
+        return utime.ticks_diff(utime.ticks_ms(), self.started) // self.tick_ms
+
+    def period_ticks(self, period_ms):
+        return max(1, (period_ms + self.tick_ms - 1) // self.tick_ms)
+
+    def _link(self, timer):
+        slot = timer._expires & self.mask
+        head = self.heads[slot]
+        timer._slot = slot
+        timer._prev = None
+        timer._next = head
+        if head is not None:
+            head._prev = timer
+        self.heads[slot] = timer
+
+    def _unlink(self, timer):
+        if timer._prev is None:
+            self.heads[timer._slot] = timer._next
+        else:
+            timer._prev._next = timer._next
+        if timer._next is not None:
+            timer._next._prev = timer._prev
+        timer._slot = None
+        timer._prev = None
+        timer._next = None
+
+    def insert(self, timer):
+        self.mutating = True
+        if timer._slot is not None and timer._slot >= 0:
+            self._unlink(timer)
+        timer._expires = self.now_tick() + self.period_ticks(timer.period)
+        timer._active = True
+        self._link(timer)
+        self.mutating = False
+
+    def cancel(self, timer):
+        self.mutating = True
+        timer._active = False
+        if timer._slot is not None and timer._slot >= 0:
+            self._unlink(timer)
+        timer._slot = None
+        self.mutating = False
+
+    def run(self, _=None):
+        self.pending = False
+        if self.mutating:
+            return
+        target = self.now_tick()
+        # after a long stall one pass over every slot catches up with everything that is due
+        if target - self.tick > self.mask + 1:
+            self.tick = target - self.mask - 1
+        while self.tick < target:
+            self.tick += 1
+            self._expire(self.tick)
+
+    def _expire(self, tick):
+        slot = tick & self.mask
+        # unlink everything due first, marked with slot -1; callbacks may then start or stop any timer,
+        # and a due timer that was stopped or restarted in the meantime is skipped
+        due = None
+        timer = self.heads[slot]
+        while timer is not None:
+            following = timer._next
+            if timer._expires <= tick:
+                self._unlink(timer)
+                timer._slot = -1
+                timer._due_next = due
+                due = timer
+            timer = following
+        while due is not None:
+            timer = due
+            due = timer._due_next
+            timer._due_next = None
+            if timer._slot != -1:
+                continue
+            timer._slot = None
+            if timer.mode == Timer.PERIODIC:
+                timer._expires += self.period_ticks(timer.period)
+                if timer._expires <= tick:
+                    timer._expires = tick + 1
+                self._link(timer)
+            else:
+                timer._active = False
+            try:
+                timer.callback()
+            except Exception as e:
+                print(f"Timer {timer.timer_number} callback error: {e}")
 
 
 class Timer:
     PERIODIC = machine.Timer.PERIODIC
     ONE_SHOT = machine.Timer.ONE_SHOT
+    # set by Timer.use_asyncio(); timers then run as uasyncio tasks instead of on the timer wheel
+    asyncio = None
+
+    @classmethod
+    def use_asyncio(cls):
+        cls.asyncio = asyncio_module()
 
-    def __init__(self, timer_number, mode, period, callback):
-        self._platform = sys.platform
+    def __init__(self, timer_number, mode, period, callback, autostart=True):
+        """
+        :param timer_number: Identifies the timer in error messages. All timers share the wheel's hardware timer.
+        :param mode: Timer.PERIODIC or Timer.ONE_SHOT.
+        :param period: Period in milliseconds.
+        :param callback: Called without arguments, outside IRQ context.
+        :param autostart: Start right away; otherwise the timer is preallocated and armed later with start().
+        """
         self.timer_number = timer_number
         self.mode = mode
         self.period = period
         self.callback = callback
-        self._timer = None
-        self.start()
+        # asyncio runtime
+        self._task = None
+        self._armed = None
+        self._deadline = None
+        self._sleeping_until = None
+        # wheel entry
+        self._active = False
+        self._expires = 0
+        self._slot = None
+        self._prev = None
+        self._next = None
+        self._due_next = None
+        if autostart:
+            self.start()
 
-    def _do_callback(self, _):
-        self.callback()
+    async def _run_task(self):
+        # one task for the timer's lifetime: it sleeps until the deadline start() sets and waits on the
+        # event while the timer is stopped, so re-arming from a scheduled callback allocates nothing
+        asyncio = Timer.asyncio
+        while True:
+            if self._deadline is None:
+                self._sleeping_until = None
+                await self._armed.wait()
+                self._armed.clear()
+                continue
+            self._sleeping_until = self._deadline
+            remaining = utime.ticks_diff(self._deadline, utime.ticks_ms())
+            if remaining > 0:
+                await asyncio.sleep(remaining / 1000)
+                continue
+            if self.mode == Timer.PERIODIC:
+                self._deadline = utime.ticks_add(self._deadline, self.period)
+                if utime.ticks_diff(self._deadline, utime.ticks_ms()) <= 0:
+                    self._deadline = utime.ticks_add(utime.ticks_ms(), self.period)
+            else:
+                self._deadline = None
+            try:
+                self.callback()
+            except Exception as e:
+                print(f"Timer {self.timer_number} callback error: {e}")
+
+    @property
+    def active(self):
+        return self._deadline is not None or self._active
 
     def start(self):
-        if self._platform == "rp2":
-            self._timer = machine.Timer(mode=self.mode, period=self.period, callback=self._do_callback)
-        elif self._platform == 'esp32':
-            tn = self.timer_number
-            if tn > 0:
-                tn = tn * -1
-            self._timer = machine.Timer(tn)
-            self._timer.init(mode=self.mode, period=self.period, callback=self._do_callback)
+        """
+        Starts the timer; a running timer is restarted from now.
+        """
+        if Timer.asyncio is not None:
+            self._deadline = utime.ticks_add(utime.ticks_ms(), self.period)
+            if self._task is None:
+                self._armed = Timer.asyncio.Event()
+                self._task = Timer.asyncio.create_task(self._run_task())
+            elif (self._sleeping_until is not None
+                  and utime.ticks_diff(self._deadline, self._sleeping_until) < 0):
+                # the period was shortened while the task sleeps towards a later deadline
+                self._task.cancel()
+                self._sleeping_until = None
+                self._task = Timer.asyncio.create_task(self._run_task())
+            else:
+                self._armed.set()
         else:
-            raise Exception(f"Unsupported platform: {self._platform}")
+            TimerWheel.get().insert(self)
 
     def stop(self):
-        if self._timer is not None:
-            self._timer.deinit()
+        self._deadline = None
+        if self._active:
+            TimerWheel.get().cancel(self)
+
+    def deinit(self):
+        """
+        Stops the timer for good and ends its task; start() afterwards creates a new one.
+        """
+        self.stop()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._sleeping_until = None
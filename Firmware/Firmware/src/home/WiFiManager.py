@@ -2,6 +2,7 @@ import network
 import utime
 import machine
 import sys
+from .Timer import asyncio_module
 
 
 class WiFiManager:
@@ -46,6 +47,31 @@ class WiFiManager:
         print('Connected to Wi-Fi:', self.ssid)
         print('IP address:', self.wlan.ifconfig()[0])
 
+    async def connect_wifi_async(self, poll_ms=250):
+        """
+        Connects like connect_wifi, but yields to other tasks while waiting for the connection.
+
+        Returns:
+        None
+        """
+        asyncio = asyncio_module()
+        self.wlan = network.WLAN(network.STA_IF)
+        self.wlan.active(True)
+        retry_counter = 0
+        while not self.wlan.isconnected():
+            if retry_counter >= self.max_retries:
+                print('Failed to connect to WiFi after', self.max_retries, 'attempts.')
+                return
+            print('Connecting to', self.ssid)
+            self.wlan.connect(self.ssid, self.password)
+            waited_ms = 0
+            while not self.wlan.isconnected() and waited_ms < self.retry_delay * 1000:
+                await asyncio.sleep(poll_ms / 1000)
+                waited_ms += poll_ms
+            retry_counter += 1
+        print('Connected to Wi-Fi:', self.ssid)
+        print('IP address:', self.wlan.ifconfig()[0])
+
     def is_connected(self):
         return self.wlan.isconnected()
 
@@ -1,4 +1,6 @@
 from .Home import Home
+from .Timer import Timer, asyncio_module
+import json
 import utime
 
 __version__ = '0.0.10'
@@ -14,6 +16,7 @@ def run():
             home_client.log("---listening for messages---")
             while True:
                 home_client.check_msg()
+                home_client.check_config()
                 utime.sleep_ms(100)
 
         except KeyboardInterrupt:
@@ -21,3 +24,41 @@ def run():
             raise KeyboardInterrupt
         except Exception as e:
             home_client.restart_on_error(f'Main Loop Error: \n\t{e}')
+
+
+async def run_tasks(home_client):
+    asyncio = asyncio_module()
+    print('Home Version: ', __version__)
+    await home_client.start_sequence_async()
+    home_client.log("---listening for messages---")
+    await asyncio.gather(home_client.receive_messages(), home_client.supervise_connections())
+
+
+def run_async():
+    """
+    Runs Home on uasyncio: message receive and connection supervision are tasks, and sensor timers
+    (sampling, motion retrigger, fades) run as tasks instead of hardware timers.
+    """
+    asyncio = asyncio_module()
+    Timer.use_asyncio()
+    home_client = Home()
+    try:
+        asyncio.run(run_tasks(home_client))
+    except KeyboardInterrupt:
+        Home.status_led_off()
+        raise KeyboardInterrupt
+    except Exception as e:
+        home_client.restart_on_error(f'Main Loop Error: \n\t{e}')
+
+
+def main(settings_path='/config.json'):
+    # "runtime": "asyncio" in the startup settings selects the async runtime
+    try:
+        with open(settings_path, 'r') as f:
+            runtime = json.load(f).get('runtime')
+    except Exception:
+        runtime = None
+    if runtime == 'asyncio':
+        run_async()
+    else:
+        run()
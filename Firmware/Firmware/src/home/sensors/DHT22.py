@@ -2,8 +2,15 @@ import machine
 # import sys
 import dht
 import json
+import utime
 from ..Timer import Timer
 
+# plausible DHT22 readings; anything outside is a glitch read and is dropped
+TEMPERATURE_RANGE = (-40.0, 80.0)
+HUMIDITY_RANGE = (0.0, 100.0)
+# the DHT22 needs two seconds between reads
+MIN_SAMPLE_INTERVAL_MS = 2000
+
 
 class DHT22Sensor:
 
@@ -21,12 +28,110 @@ class DHT22Sensor:
         return self.sensor.humidity()
 
 
+class SampleFilter:
+    """
+    Median of the last few samples, smoothed with an exponential moving average. The median rejects
+    single glitch reads, the average evens out the sensor's jitter. The ring and the scratch list used
+    for the median are allocated once.
+    """
+
+    def __init__(self, size=5, alpha=0.5):
+        """
+        :param size: Number of samples in the median window.
+        :param alpha: Weight of the newest median in the average, 0 < alpha <= 1; 1 disables smoothing.
+        """
+        self.size = size
+        self.alpha = alpha
+        self.samples = [0.0] * size
+        self.scratch = [0.0] * size
+        self.index = 0
+        self.count = 0
+        self.value = None
+
+    def median(self):
+        n = self.count
+        scratch = self.scratch
+        # insertion sort of the filled part of the ring
+        for i in range(n):
+            sample = self.samples[i]
+            j = i - 1
+            while j >= 0 and scratch[j] > sample:
+                scratch[j + 1] = scratch[j]
+                j -= 1
+            scratch[j + 1] = sample
+        if n % 2:
+            return scratch[n // 2]
+        return (scratch[n // 2 - 1] + scratch[n // 2]) / 2
+
+    def add(self, sample):
+        """
+        :param sample: The new reading.
+        :return: The filtered value.
+        """
+        self.samples[self.index] = sample
+        self.index = (self.index + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+        median = self.median()
+        if self.value is None:
+            self.value = median
+        else:
+            self.value += self.alpha * (median - self.value)
+        return self.value
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+        self.value = None
+
+
+class Reading:
+    """
+    Publish-on-change state of one value: it's published when it moves by at least the deadband
+    from the last published value, or when nothing was published for heartbeat_ms.
+    """
+
+    def __init__(self, topic, deadband, heartbeat_ms):
+        self.topic = topic
+        self.deadband = deadband
+        self.heartbeat_ms = heartbeat_ms
+        self.published = None
+        self.published_at = 0
+
+    def due(self, value, now):
+        if self.published is None:
+            return True
+        if abs(value - self.published) >= self.deadband:
+            return True
+        return utime.ticks_diff(now, self.published_at) >= self.heartbeat_ms
+
+    def mark(self, value, now):
+        self.published = value
+        self.published_at = now
+
+
 class MQTTDHT22Sensor:
     def __init__(self, dht22_sensor: DHT22Sensor, mqtt_client, name_temp=None, name_humidity=None, timer_n=1,
                  temp_topic=None,
                  temp_discovery_topic=None,
                  humidity_topic=None,
-                 humidity_discovery_topic=None):
+                 humidity_discovery_topic=None,
+                 filter_size=5,
+                 ema_alpha=0.5,
+                 temperature_deadband=0.2,
+                 humidity_deadband=1.0,
+                 heartbeat_ms=300000):
+        """
+        The timer samples the sensor filter_size times per measurement interval, as often as the DHT22 allows;
+        each sample goes through a SampleFilter. Once per measurement interval a filtered value is published if it
+        moved past its deadband or its heartbeat expired.
+
+        :param filter_size: Samples in the median window.
+        :param ema_alpha: Smoothing of the filtered value, 1 for the plain median.
+        :param temperature_deadband: Change in degrees Celsius that is published right away.
+        :param humidity_deadband: Change in percent relative humidity that is published right away.
+        :param heartbeat_ms: Longest time a value goes unpublished, so Home Assistant sees the sensor is alive.
+        """
         self.dht22_sensor = dht22_sensor
         self.mqtt_client = mqtt_client
         self.sensor_index = timer_n
@@ -43,8 +148,17 @@ class MQTTDHT22Sensor:
         # self.humidity_topic = f"{self.base_topic}/{self.name_humidity.lower().replace(' ', '_')}"
         # self.humidity_discovery_topic = f"{self.humidity_topic}/config"
 
+        self.temperature_filter = SampleFilter(filter_size, ema_alpha)
+        self.humidity_filter = SampleFilter(filter_size, ema_alpha)
+        self.temperature = Reading(temp_topic, temperature_deadband, heartbeat_ms)
+        self.humidity = Reading(humidity_topic, humidity_deadband, heartbeat_ms)
+
         self.timer = None
+        # samples taken per measurement interval, set by enable_interrupt
+        self.samples_per_publish = 1
+        self.samples_taken = 0
         self.measurement_errors = 0
+        self.rejected_samples = 0
         self.active = True
 
     def measure(self):
@@ -52,7 +166,10 @@ class MQTTDHT22Sensor:
             self.dht22_sensor.measure()
             temperature = self.dht22_sensor.temperature()
             humidity = self.dht22_sensor.humidity()
-            # self.publish_measurement(temperature, humidity)
+            if not (TEMPERATURE_RANGE[0] <= temperature <= TEMPERATURE_RANGE[1]
+                    and HUMIDITY_RANGE[0] <= humidity <= HUMIDITY_RANGE[1]):
+                self.rejected_samples += 1
+                return None, None
             self.measurement_errors = 0
             self.active = True
             return temperature, humidity
@@ -68,51 +185,86 @@ class MQTTDHT22Sensor:
                     self.active = False
             return None, None
 
-    def publish_measurement(self, temperature, humidity):
-        """Publish the last measurement to the MQTT topic."""
-        self.mqtt_client.publish(self.temp_topic, str(temperature))
-        self.mqtt_client.publish(self.humidity_topic, str(humidity))
+    def publish_reading(self, reading, value, now):
+        value = round(value, 1)
+        self.mqtt_client.publish(reading.topic, str(value))
+        reading.mark(value, now)
 
     def measure_and_publish(self):
+        """
+        Takes one sample, and on every samples_per_publish-th sample publishes the filtered values that are due.
+        Runs from the timer wheel, which calls it in scheduled context rather than from the timer interrupt.
+        """
         temperature, humidity = self.measure()
         if temperature is not None and humidity is not None:
-            print(f"Temperature: {temperature}    Humidity: {humidity}%")
-            self.publish_measurement(temperature, humidity)
+            self.temperature_filter.add(temperature)
+            self.humidity_filter.add(humidity)
+        self.samples_taken += 1
+        if self.samples_taken < self.samples_per_publish:
+            return
+        self.samples_taken = 0
+        temperature = self.temperature_filter.value
+        humidity = self.humidity_filter.value
+        if temperature is None or humidity is None:
+            return
+        now = utime.ticks_ms()
+        if self.temperature.due(temperature, now):
+            self.publish_reading(self.temperature, temperature, now)
+        if self.humidity.due(humidity, now):
+            self.publish_reading(self.humidity, humidity, now)
 
     def enable_interrupt(self, measurement_interval_ms):
-        """Enable timer for regular measurements."""
+        """
+        Enable timer for regular measurements. The median window fills within one measurement interval, unless
+        that would read the sensor more often than every MIN_SAMPLE_INTERVAL_MS.
+        """
+        sample_interval_ms = max(measurement_interval_ms // self.temperature_filter.size, MIN_SAMPLE_INTERVAL_MS)
+        sample_interval_ms = min(sample_interval_ms, measurement_interval_ms)
+        self.samples_per_publish = measurement_interval_ms // sample_interval_ms
+        self.samples_taken = 0
         print(f"Weather Timer Started")
         self.timer = Timer(timer_number=self.sensor_index,
                            mode=Timer.PERIODIC,
-                           period=measurement_interval_ms,
+                           period=sample_interval_ms,
                            callback=self.measure_and_publish)
 
-    def publish_discovery(self, device_info):
-        print(f"\n{self.name_temp} Discovery Topic: {self.temp_discovery_topic}")
-        print(f"{self.name_temp} State Topic: {self.temp_topic}\n")
-        print(f"\n{self.name_humidity} Discovery Topic: {self.humidity_discovery_topic}")
-        print(f"{self.name_humidity} State Topic: {self.humidity_topic}\n")
+    def discovery_components(self, device_info):
+        """
+        Home Assistant entities of this sensor, one for temperature and one for humidity.
 
-        config_temp = {
+        :param device_info: The device block shared by the device's entities.
+        :return: A list of (discovery_topic, platform, object_id, config) tuples.
+        """
+        return [(self.temp_discovery_topic, "sensor", str(self.name_temp).lower().replace(' ', '_'), {
             "name": self.name_temp,
             "device_class": "temperature",
             "unit_of_measurement": chr(176) + "C",
             "state_topic": self.temp_topic,
-            "device": device_info,
             "unique_id": f"{self.mqtt_client.device_id}-{self.sensor_index}_temp",
-        }
-
-        config_humidity = {
+        }), (self.humidity_discovery_topic, "sensor", str(self.name_humidity).lower().replace(' ', '_'), {
             "name": self.name_humidity,
             "device_class": "humidity",
             "unit_of_measurement": "%",
             "state_topic": self.humidity_topic,
-            "device": device_info,
             "unique_id": f"{self.mqtt_client.device_id}-{self.sensor_index}_humidity",
-        }
+        })]
+
+    def deinit(self):
+        """Stop the measurement timer."""
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+        self.active = False
+
+    def publish_discovery(self, device_info):
+        print(f"\n{self.name_temp} Discovery Topic: {self.temp_discovery_topic}")
+        print(f"{self.name_temp} State Topic: {self.temp_topic}\n")
+        print(f"\n{self.name_humidity} Discovery Topic: {self.humidity_discovery_topic}")
+        print(f"{self.name_humidity} State Topic: {self.humidity_topic}\n")
 
-        self.mqtt_client.publish(self.temp_discovery_topic, json.dumps(config_temp).encode("utf-8"), retain=True)
-        self.mqtt_client.publish(self.humidity_discovery_topic, json.dumps(config_humidity), retain=True)
+        for topic, _, _, config in self.discovery_components(device_info):
+            config["device"] = device_info
+            self.mqtt_client.publish(topic, json.dumps(config), retain=True)
 
 
 class HomeWeatherSensor(MQTTDHT22Sensor):
@@ -129,7 +281,12 @@ class HomeWeatherSensor(MQTTDHT22Sensor):
                          name_humidity=name_humidity,
                          humidity_topic=topics.get('humidity_topic'),
                          humidity_discovery_topic=topics.get('humidity_discovery'),
-                         timer_n=sensor_index)
+                         timer_n=sensor_index,
+                         filter_size=sensor_config.get('filter_size', 5),
+                         ema_alpha=sensor_config.get('ema_alpha', 0.5),
+                         temperature_deadband=sensor_config.get('temperature_deadband', 0.2),
+                         humidity_deadband=sensor_config.get('humidity_deadband', 1.0),
+                         heartbeat_ms=sensor_config.get('heartbeat_ms', 300000))
 
     def __repr__(self):
         return f"<HomeWeatherSensor| {self.name} | pin:{self.pin}>"
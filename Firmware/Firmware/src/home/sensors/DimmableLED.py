@@ -1,30 +1,72 @@
-import machine
-import sys
+import utime
 import json
+from ..Timer import Timer
+from .PWMOutput import PWMOutput
 
+# easing curves map fade progress 0..EASING_SCALE to eased progress 0..EASING_SCALE in integer math;
+# the scale keeps every intermediate product a small int, so a fade tick doesn't allocate
+EASING_SCALE = 256
 
-class DimmableLight:
-    def __init__(self, pin: int, freq: int = 300, timer_n=1, fade_time_ms=4, brightness_scale=100):
-        self._platform = sys.platform
-        if self._platform not in ['rp2', 'esp32']:
-            raise ValueError(f"Unsupported platform: {self._platform}")
 
+def linear(p):
+    return p
+
+
+def ease_in(p):
+    return p * p // EASING_SCALE
+
+
+def ease_out(p):
+    return p * (2 * EASING_SCALE - p) // EASING_SCALE
+
+
+def ease_in_out(p):
+    # smoothstep: p^2 * (3 - 2p)
+    return p * p * (3 * EASING_SCALE - 2 * p) // (EASING_SCALE * EASING_SCALE)
+
+
+EASINGS = {
+    "linear": linear,
+    "ease-in": ease_in,
+    "ease-out": ease_out,
+    "ease-in-out": ease_in_out,
+}
+
+
+class DimmableLight:
+    def __init__(self, pin: int, freq: int = 300, timer_n=1, fade_time_ms=4, brightness_scale=100,
+                 fade_duration_ms=None, easing="linear", fade_tick_ms=20, curve="gamma"):
+        """
+        :param fade_time_ms: Time per brightness step; a full-range fade takes fade_time_ms * brightness_scale
+            unless fade_duration_ms is given.
+        :param fade_duration_ms: How long every fade takes, however far the brightness changes.
+        :param easing: One of "linear", "ease-in", "ease-out" or "ease-in-out".
+        :param fade_tick_ms: Period of the fade timer.
+        :param curve: Brightness to duty mapping, "gamma" for perceptually even steps or "linear".
+        """
         self.pin = pin
-        self.pwm = machine.Pin(self.pin)
         self.freq = freq
         self.timer_n = timer_n
         self.fade_time_ms = fade_time_ms
         self.brightness_scale = brightness_scale
+        self.fade_duration_ms = fade_duration_ms if fade_duration_ms else fade_time_ms * brightness_scale
+        self.easing = EASINGS.get(easing, linear)
+        self.fade_tick_ms = fade_tick_ms
 
-        if self._platform == "rp2":
-            self.light = machine.PWM(self.pwm)
-            self.light.freq(freq)
-        elif self._platform == "esp32":
-            self.light = machine.PWM(self.pwm, freq=self.freq)
+        self.output = PWMOutput(pin, freq, scale=brightness_scale, curve=curve)
+        # bound once for the fade timer
+        self._set_output = self.output.set
 
+        # one periodic timer per light, created on the first fade and restarted for later ones
+        self.fade_timer = None
+        self.fading = False
+        self.fade_from = 0
+        self.fade_to = 0
+        self.fade_start = 0
+        self._fade_step_callback = self._fade_step
         self.current_brightness = 0
         self.target_brightness = 0
-        self.prev_brightness = 255
+        self.prev_brightness = brightness_scale
         self.state = "OFF"
         self.set_brightness(0)
 
@@ -39,50 +81,64 @@ class DimmableLight:
             self.prev_brightness = self.current_brightness
         self.target_brightness = 0
 
-    def platform_timer(self, **kwargs):
-        if sys.platform == 'rp2':
-            t = machine.Timer(**kwargs)
+    def fade(self):
+        """
+        Fades from the current brightness to target_brightness over fade_duration_ms. Called again mid-fade,
+        the fade restarts from wherever the light is now.
+        """
+        self.fade_from = self.current_brightness
+        self.fade_to = self.target_brightness
+        self.fade_start = utime.ticks_ms()
+        if self.fade_from == self.fade_to:
+            self._stop_fade()
+            return
+        if self.fade_timer is None:
+            self.fade_timer = Timer(timer_number=self.timer_n,
+                                    mode=Timer.PERIODIC,
+                                    period=self.fade_tick_ms,
+                                    callback=self._fade_step_callback)
+        elif not self.fading:
+            self.fade_timer.start()
+        self.fading = True
+
+    def _fade_step(self):
+        elapsed = utime.ticks_diff(utime.ticks_ms(), self.fade_start)
+        if elapsed >= self.fade_duration_ms:
+            brightness = self.fade_to
         else:
-            t = machine.Timer(self.timer_n * -1)
-            t.init(**kwargs)
-        return t
+            eased = self.easing(elapsed * EASING_SCALE // self.fade_duration_ms)
+            brightness = self.fade_from + (self.fade_to - self.fade_from) * eased // EASING_SCALE
+        if brightness != self.current_brightness:
+            self.current_brightness = brightness
+            # always within 0..brightness_scale here, so the output is written without a range check
+            self._set_output(brightness)
+        if brightness == self.fade_to:
+            self._stop_fade()
 
-    def fade(self):
-        keep_fading = False
-        if self.current_brightness < self.target_brightness:
-            self.current_brightness += 1
-            keep_fading = True
-        elif self.current_brightness > self.target_brightness:
-            self.current_brightness -= 1
-            keep_fading = True
-        elif self.current_brightness == self.target_brightness:
+    def _stop_fade(self):
+        if self.fading:
+            self.fade_timer.stop()
+            self.fading = False
             print("done fading - brightness: ", self.current_brightness)
 
-        self.set_brightness(self.current_brightness)
-        if keep_fading:
-            self.platform_timer(period=self.fade_time_ms,
-                                mode=machine.Timer.ONE_SHOT,
-                                callback=lambda t: self.fade())
+    def deinit(self):
+        """Stop fading, switch the light off and release the PWM output."""
+        if self.fade_timer is not None:
+            self.fade_timer.deinit()
+            self.fade_timer = None
+        self.fading = False
+        self.output.deinit()
 
     def convert_to_duty(self, value: int) -> int:
-        if self._platform == "rp2":
-            return round((65535 / self.brightness_scale) * value)
-        elif self._platform == "esp32":
-            return round((1023 / self.brightness_scale) * value)
-        else:
-            return value
+        return self.output.table[value]
 
     def set_duty(self, value: int):
-        if self._platform == "rp2":
-            self.light.duty_u16(value)
-        elif self._platform == "esp32":
-            self.light.duty(value)
+        self.output.set_duty(value)
 
     def set_brightness(self, brightness: int):
         if not 0 <= brightness <= self.brightness_scale:
-            raise ValueError("Brightness must be a value between 0 and 255")
-        duty = self.convert_to_duty(brightness)
-        self.set_duty(duty)
+            raise ValueError(f"Brightness must be a value between 0 and {self.brightness_scale}")
+        self.output.set(brightness)
 
 
 class MQTTDimmableLight:
@@ -102,7 +158,9 @@ class MQTTDimmableLight:
         # self.command_topic = f"{self.topic}/set"
         # self.brightness_state_topic = f"{self.topic}/dim"
         # self.brightness_command_topic = f"{self.topic}/dim/set"
-        self.subscribe_to = [self.command_topic, self.brightness_command_topic]
+        # topic -> handler, registered in Home's dispatch table at subscribe time
+        self.command_handlers = {self.command_topic: self.on_command,
+                                 self.brightness_command_topic: self.on_brightness_command}
 
     def publish_state(self):
         self.mqtt_client.publish(self.state_topic, str(self.light.state))
@@ -115,50 +173,62 @@ class MQTTDimmableLight:
     def set_name(self, name):
         self.name = name
 
-    def publish_discovery(self, device_info):
-        # discovery_topic = f"{self.topic}/config"
-        print(f"{self.name} Discovery Topic: ", self.discovery_topic)
-        print(f"{self.name} State Topic: ", self.state_topic)
-        config = {
+    def deinit(self):
+        self.light.deinit()
+
+    def discovery_components(self, device_info):
+        """
+        Home Assistant entities of this light.
+
+        :param device_info: The device block shared by the device's entities.
+        :return: A list of (discovery_topic, platform, object_id, config) tuples.
+        """
+        return [(self.discovery_topic, "light", self.name.lower().replace(' ', '_'), {
             "name": self.name,
             "device_class": "light",
             "state_topic": self.state_topic,
             "command_topic": self.command_topic,
             "brightness_state_topic": self.brightness_state_topic,
             "brightness_command_topic": self.brightness_command_topic,
+            # Home Assistant otherwise sends brightness on a 0..255 scale
+            "brightness_scale": self.light.brightness_scale,
             "payload_on": "ON",
             "payload_off": "OFF",
             "optimistic": False,
-            "device": device_info,
             "unique_id": f"{self.mqtt_client.config_manager.name}-{self.name}",
+        })]
+
+    def publish_discovery(self, device_info):
+        # discovery_topic = f"{self.topic}/config"
+        print(f"{self.name} Discovery Topic: ", self.discovery_topic)
+        print(f"{self.name} State Topic: ", self.state_topic)
+        for topic, _, _, config in self.discovery_components(device_info):
+            config["device"] = device_info
+            self.mqtt_client.publish(topic, json.dumps(config), retain=True)
+
+    def on_brightness_command(self, msg):
+        print(f"\nReceived Brightness Command: {msg}")
+        try:
+            brightness = int(msg.decode('utf-8'))
+            # discovery gives Home Assistant the light's brightness_scale; this only guards against other senders
+            self.light.target_brightness = min(max(brightness, 0), self.light.brightness_scale)
+            self.publish_brightness()
+        except ValueError:
+            print(f"Invalid brightness value received: {msg}")
+
+    def on_command(self, msg):
+        print(f"\nReceived Command: {msg}")
+        if msg == b"ON":
+            self.light.on()
+            self.light.fade()
+            self.publish_brightness()
+            self.publish_state()
 
-        }
-        self.mqtt_client.publish(self.discovery_topic, json.dumps(config), retain=True)
-
-    def on_message(self, topic, msg):
-        topic = topic.decode('utf-8')
-        msg = msg.decode('utf-8')
-
-        print(f"\nReceived Command:\n\tTopic: {topic}\n\tMessage: {msg}")
-        if topic == self.brightness_command_topic:
-            try:
-                brightness = int(msg)
-                self.light.target_brightness = brightness
-                self.publish_brightness()
-            except ValueError:
-                print(f"Invalid brightness value received: {msg}")
-        elif topic == self.command_topic:
-            if msg == "ON":
-                self.light.on()
-                self.light.fade()
-                self.publish_brightness()
-                self.publish_state()
-
-            elif msg == "OFF":
-                self.light.off()
-                self.light.fade()
-                self.publish_brightness()
-                self.publish_state()
+        elif msg == b"OFF":
+            self.light.off()
+            self.light.fade()
+            self.publish_brightness()
+            self.publish_state()
 
 
 class HomeLEDDimmer(MQTTDimmableLight):
@@ -168,6 +238,9 @@ class HomeLEDDimmer(MQTTDimmableLight):
         freq = sensor_config.get('freq')
         fade_time_ms = sensor_config.get('fade_time_ms')
         brightness_scale = sensor_config.get('brightness_scale')
+        fade_duration_ms = sensor_config.get('fade_duration_ms')
+        easing = sensor_config.get('easing', "linear")
+        curve = sensor_config.get('curve', "gamma")
 
         super().__init__(mqtt_client=home_client,
                          name=name,
@@ -180,7 +253,10 @@ class HomeLEDDimmer(MQTTDimmableLight):
                                              freq=freq,
                                              timer_n=sensor_index,
                                              fade_time_ms=fade_time_ms,
-                                             brightness_scale=brightness_scale))
+                                             brightness_scale=brightness_scale,
+                                             fade_duration_ms=fade_duration_ms,
+                                             easing=easing,
+                                             curve=curve))
 
     def __repr__(self):
         return f"<HomeLEDDimmer| {self.name} | pin:{self.pin}>"
@@ -1,25 +1,18 @@
 import machine
-import sys
 import json
+from .PWMOutput import PWMOutput
 
 
 class Fan:
 
-    def __init__(self, enable_pin, pwm_pin, freq):
-        self._platform = sys.platform
-
-        if self._platform not in ['rp2', 'esp32']:
-            raise ValueError(f"Unsupported platform: {self._platform}")
-
-        if self._platform == "rp2":
-            self.pwm_pin = machine.PWM(machine.Pin(pwm_pin))
-            self.pwm_pin.freq(freq)
-        elif self._platform == "esp32":
-            self.pwm_pin = machine.PWM(machine.Pin(pwm_pin), freq=freq)
-
-        self.enable_pin = machine.Pin(enable_pin, machine.Pin.OUT)
-        # self.pwm_pin = machine.PWM(machine.Pin(pwm_pin))
+    def __init__(self, enable_pin, pwm_pin, freq, min_power=0):
+        """
+        :param min_power: Duty, in percent, that the lowest non-zero power maps to, so the fan doesn't stall
+            at low percentages.
+        """
         self.power_scale = 100
+        self.pwm_pin = PWMOutput(pwm_pin, freq, scale=self.power_scale, min_percent=min_power)
+        self.enable_pin = machine.Pin(enable_pin, machine.Pin.OUT)
         self.state = "OFF"
         self.percentage = 50
 
@@ -31,30 +24,29 @@ class Fan:
         self.state = "OFF"
         self.enable_pin.off()
 
+    def deinit(self):
+        """Switch the fan off and release the PWM output."""
+        self.off()
+        self.pwm_pin.deinit()
+
     def set_duty_cycle(self, duty_cycle):
-        if self._platform == "rp2":
-            self.pwm_pin.duty_u16(duty_cycle)
-        elif self._platform == "esp32":
-            self.pwm_pin.duty(duty_cycle)
+        self.pwm_pin.set_duty(duty_cycle)
 
     def set_freq(self, freq):
         self.pwm_pin.freq(freq)
 
     def set_power_scale(self, power_scale):
         self.power_scale = power_scale
+        self.pwm_pin.set_scale(power_scale)
 
     def convert_to_duty(self, value: int) -> int:
-        if self._platform == "rp2":
-            return round((65535 / self.power_scale) * value)
-        elif self._platform == "esp32":
-            return round((1023 / self.power_scale) * value)
-        else:
-            return value
+        return self.pwm_pin.table[value]
 
     def set_power(self, power):
+        if not 0 <= power <= self.power_scale:
+            raise ValueError(f"Power must be a value between 0 and {self.power_scale}")
         self.percentage = power
-        duty = self.convert_to_duty(power)
-        self.set_duty_cycle(duty)
+        self.pwm_pin.set(power)
         print(f'setting power to: {self.percentage}')
 
 
@@ -71,7 +63,9 @@ class MQTTFan:
         self.percentage_state_topic = percentage_state_topic
         self.percentage_command_topic = percentage_command_topic
         self.discovery_topic = discovery_topic
-        self.subscribe_to = [self.command_topic, self.percentage_command_topic]
+        # topic -> handler, registered in Home's dispatch table at subscribe time
+        self.command_handlers = {self.command_topic: self.on_command,
+                                 self.percentage_command_topic: self.on_percentage_command}
 
     def publish_state(self):
         self.mqtt_client.publish(self.state_topic, str(self.fan.state))
@@ -84,11 +78,17 @@ class MQTTFan:
     def set_name(self, name):
         self.name = name
 
-    def publish_discovery(self, device_info):
-        # discovery_topic = f"{self.topic}/config"
-        print(f"{self.name} Discovery Topic: ", self.discovery_topic)
-        print(f"{self.name} State Topic: ", self.state_topic)
-        config = {
+    def deinit(self):
+        self.fan.deinit()
+
+    def discovery_components(self, device_info):
+        """
+        Home Assistant entities of this fan.
+
+        :param device_info: The device block shared by the device's entities.
+        :return: A list of (discovery_topic, platform, object_id, config) tuples.
+        """
+        return [(self.discovery_topic, "fan", self.name.lower().replace(' ', '_'), {
             "name": self.name,
             "device_class": "fan",
             "state_topic": self.state_topic,
@@ -98,35 +98,38 @@ class MQTTFan:
             "payload_on": "ON",
             "payload_off": "OFF",
             "optimistic": False,
-            "device": device_info,
             "unique_id": f"{self.mqtt_client.config_manager.name}-{self.name}",
+        })]
 
-        }
-        self.mqtt_client.publish(self.discovery_topic, json.dumps(config), retain=True)
-
-    def on_message(self, topic, msg):
-        topic = topic.decode('utf-8')
-        msg = msg.decode('utf-8')
-
-        print(f"\nReceived Command:\n\tTopic: {topic}\n\tMessage: {msg}")
-        if topic == self.percentage_command_topic:
-            try:
-                percentage = int(msg)
-                self.fan.percentage = percentage
-                self.fan.set_power(percentage)
-                # self.publish_percentage()
-            except ValueError:
-                print(f"Invalid brightness value received: {msg}")
-        elif topic == self.command_topic:
-            if msg == "ON":
-                self.fan.on()
-                # self.publish_percentage()
-                self.publish_state()
-
-            elif msg == "OFF":
-                self.fan.off()
-                # self.publish_percentage()
-                self.publish_state()
+    def publish_discovery(self, device_info):
+        # discovery_topic = f"{self.topic}/config"
+        print(f"{self.name} Discovery Topic: ", self.discovery_topic)
+        print(f"{self.name} State Topic: ", self.state_topic)
+        for topic, _, _, config in self.discovery_components(device_info):
+            config["device"] = device_info
+            self.mqtt_client.publish(topic, json.dumps(config), retain=True)
+
+    def on_percentage_command(self, msg):
+        print(f"\nReceived Percentage Command: {msg}")
+        try:
+            percentage = int(msg.decode('utf-8'))
+            self.fan.percentage = percentage
+            self.fan.set_power(percentage)
+            # self.publish_percentage()
+        except ValueError:
+            print(f"Invalid brightness value received: {msg}")
+
+    def on_command(self, msg):
+        print(f"\nReceived Command: {msg}")
+        if msg == b"ON":
+            self.fan.on()
+            # self.publish_percentage()
+            self.publish_state()
+
+        elif msg == b"OFF":
+            self.fan.off()
+            # self.publish_percentage()
+            self.publish_state()
 
 
 class HomeFan(MQTTFan):
@@ -136,6 +139,7 @@ class HomeFan(MQTTFan):
         self.enable_pin = sensor_config.get('enable_pin')
         self.sensor_index = sensor_index
         freq = sensor_config.get('freq')
+        min_power = sensor_config.get('min_power', 0)
         # brightness_scale = sensor_config.get('brightness_scale')
         # print(f'pin: {self.pin} - enable_pin = {self.enable_pin} - index = {self.sensor_index}')
         super().__init__(mqtt_client=home_client,
@@ -143,9 +147,10 @@ class HomeFan(MQTTFan):
                          state_topic=topics.get('state_topic'),
                          command_topic=topics.get('command_topic'),
                          percentage_state_topic=topics.get('percentage_state_topic'),
-                         percentage_command_topic=topics.get('percentage_state_topic'),
+                         percentage_command_topic=topics.get('percentage_command_topic')
+                         or topics.get('percentage_state_topic'),
                          discovery_topic=topics.get('discovery_topic'),
-                         fan=Fan(pwm_pin=self.pin, enable_pin=self.enable_pin, freq=freq))
+                         fan=Fan(pwm_pin=self.pin, enable_pin=self.enable_pin, freq=freq, min_power=min_power))
 
     def __repr__(self):
         return f"<HomeFan| {self.name} | pin:{self.pin}>"
@@ -1,25 +1,47 @@
 import machine
+import micropython
+import utime
 import json
 from ..Timer import Timer
 
 
 class MotionSensor:
 
-    def __init__(self, pin, retrigger_delay_ms, timer_n=1):
+    def __init__(self, pin, retrigger_delay_ms, timer_n=1, debounce_ms=50):
+        """
+        :param pin: The pin the PIR sensor's output is connected to.
+        :param retrigger_delay_ms: How long after the last edge motion is reported as cleared.
+        :param timer_n: Sensor index, used to label the retrigger timer.
+        :param debounce_ms: Edges closer together than this are ignored.
+        """
         self.pin = machine.Pin(pin, machine.Pin.IN, machine.Pin.PULL_DOWN)
         self.retrigger_delay_ms = retrigger_delay_ms
+        self.debounce_ms = debounce_ms
 
         self.on_motion_detected = None
         self.on_motion_not_detected = None
 
         self.timer_n = timer_n
-        self.timer = None
         self.last_motion = 0
+        # everything the IRQ handler touches is allocated here: it only compares ticks and sets flags
+        self.last_edge = utime.ticks_add(utime.ticks_ms(), -debounce_ms)
+        self.scheduled = False
+        self._handle_motion_ref = self._handle_motion
+        self.timer = Timer(timer_number=self.timer_n,
+                           mode=Timer.ONE_SHOT,
+                           period=self.retrigger_delay_ms,
+                           callback=self._no_motion_detected,
+                           autostart=False)
 
     def enable_interrupt(self):
         """Enable interrupt for motion pin."""
         self.pin.irq(trigger=machine.Pin.IRQ_RISING, handler=self.motion_change)
 
+    def deinit(self):
+        """Disable the interrupt and stop the retrigger timer."""
+        self.pin.irq(handler=None)
+        self.timer.deinit()
+
     def set_on_motion_detected(self, func):
         self.on_motion_detected = func
 
@@ -30,14 +52,25 @@ class MotionSensor:
         self.timer_n = timer_n
 
     def motion_change(self, _):
+        # IRQ context: no allocation and no I/O, the rest happens in _handle_motion
+        now = utime.ticks_ms()
+        if utime.ticks_diff(now, self.last_edge) < self.debounce_ms:
+            return
+        self.last_edge = now
+        if self.scheduled:
+            return
+        self.scheduled = True
+        try:
+            micropython.schedule(self._handle_motion_ref, None)
+        except RuntimeError:
+            # schedule queue full; the next edge tries again
+            self.scheduled = False
+
+    def _handle_motion(self, _):
+        self.scheduled = False
+        # re-arms the one retrigger timer
+        self.timer.start()
         self._motion_detected()
-        if self.timer is not None:
-            self.timer.stop()
-            self.timer = None
-        self.timer = Timer(timer_number=self.timer_n * -1,
-                           mode=Timer.ONE_SHOT,
-                           period=self.retrigger_delay_ms,
-                           callback=self._no_motion_detected)
 
     def _motion_detected(self):
         if not self.last_motion:
@@ -45,7 +78,6 @@ class MotionSensor:
             if self.on_motion_detected is not None:
                 self.on_motion_detected()
 
-    # def _no_motion_detected(self, _):
     def _no_motion_detected(self):
         self.last_motion = 0
         if self.on_motion_not_detected is not None:
@@ -53,7 +85,12 @@ class MotionSensor:
 
 
 class MQTTMotionSensor:
-    def __init__(self, motion_sensor: MotionSensor, mqtt_client, name=None, state_topic=None, discovery_topic=None):
+    def __init__(self, motion_sensor: MotionSensor, mqtt_client, name=None, state_topic=None, discovery_topic=None,
+                 min_publish_interval_ms=1000):
+        """
+        :param min_publish_interval_ms: State changes inside this interval after a publish are held back and the
+            latest state is published once it has passed.
+        """
         self.motion_sensor = motion_sensor
         self.mqtt_client = mqtt_client
         self.sensor_index = self.motion_sensor.timer_n
@@ -61,42 +98,77 @@ class MQTTMotionSensor:
         self.name = name
         self.state_topic = state_topic
         self.discovery_topic = discovery_topic
+        self.min_publish_interval_ms = min_publish_interval_ms
+        self.last_publish = None
+        self.publish_timer = Timer(timer_number=self.sensor_index,
+                                   mode=Timer.ONE_SHOT,
+                                   period=min_publish_interval_ms,
+                                   callback=self._publish_state,
+                                   autostart=False)
         self.motion_sensor.set_on_motion_detected(self.publish_last_motion)
         self.motion_sensor.set_on_motion_not_detected(self.publish_last_motion)
 
     def enable_interrupt(self):
         self.motion_sensor.enable_interrupt()
 
-    def publish_last_motion(self):
-        """Publish the last motion detected to the MQTT topic."""
-        self.mqtt_client.publish(self.state_topic, str(self.motion_sensor.last_motion))
+    def deinit(self):
+        self.motion_sensor.deinit()
+        self.publish_timer.deinit()
 
-    def publish_discovery(self, device_info):
-        print("Motion Sensor Discovery Topic: ", self.discovery_topic)
-        print("Motion Sensor State Topic: ", self.state_topic)
-        config = {
+    def publish_last_motion(self):
+        """Publish the last motion detected to the MQTT topic, at most once per min_publish_interval_ms."""
+        if self.last_publish is not None:
+            wait = self.min_publish_interval_ms - utime.ticks_diff(utime.ticks_ms(), self.last_publish)
+            if wait > 0:
+                if not self.publish_timer.active:
+                    self.publish_timer.period = wait
+                    self.publish_timer.start()
+                return
+        self._publish_state()
+
+    def _publish_state(self):
+        self.last_publish = utime.ticks_ms()
+        self.mqtt_client.publish(self.state_topic, "1" if self.motion_sensor.last_motion else "0")
+
+    def discovery_components(self, device_info):
+        """
+        Home Assistant entities of this sensor.
+
+        :param device_info: The device block shared by the device's entities.
+        :return: A list of (discovery_topic, platform, object_id, config) tuples.
+        """
+        return [(self.discovery_topic, "binary_sensor", self.name.lower().replace(' ', '_'), {
             "name": self.name,
             "device_class": "motion",
-            "device": device_info,
             "unique_id": f"{device_info.get('name')}-{self.name}",
             "payload_off": "0",
             "payload_on": "1",
             "state_topic": self.state_topic
-        }
-        self.mqtt_client.publish(self.discovery_topic, json.dumps(config), retain=True)
+        })]
+
+    def publish_discovery(self, device_info):
+        print("Motion Sensor Discovery Topic: ", self.discovery_topic)
+        print("Motion Sensor State Topic: ", self.state_topic)
+        for topic, _, _, config in self.discovery_components(device_info):
+            config["device"] = device_info
+            self.mqtt_client.publish(topic, json.dumps(config), retain=True)
 
 
 class HomeMotionSensor(MQTTMotionSensor):
     def __init__(self, home_client, name, sensor_config, topics, sensor_index):
         self.pin = sensor_config.get('pin')
         retrigger_delay_ms = sensor_config.get('retrigger_delay_ms')
+        debounce_ms = sensor_config.get('debounce_ms', 50)
+        min_publish_interval_ms = sensor_config.get('min_publish_interval_ms', 1000)
         super().__init__(mqtt_client=home_client,
                          name=name,
                          state_topic=topics.get('state_topic'),
                          discovery_topic=topics.get('discovery_topic'),
+                         min_publish_interval_ms=min_publish_interval_ms,
                          motion_sensor=MotionSensor(pin=self.pin,
                                                     retrigger_delay_ms=retrigger_delay_ms,
-                                                    timer_n=sensor_index))
+                                                    timer_n=sensor_index,
+                                                    debounce_ms=debounce_ms))
 
     def __repr__(self):
         return f"<HomeMotionSensor| {self.name} | pin:{self.pin}>"
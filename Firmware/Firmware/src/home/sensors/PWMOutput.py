@@ -0,0 +1,83 @@
+import machine
+import sys
+from array import array
+
+# full-scale duty per platform, and the name of the PWM method that writes it
+PLATFORM_DUTY = {
+    "rp2": (65535, "duty_u16"),
+    "esp32": (1023, "duty"),
+}
+LED_GAMMA = 2.2
+
+# (platform, scale, curve, min_percent) -> duty table, shared by every output with the same settings
+_duty_tables = {}
+
+
+def curve_value(curve, fraction):
+    if curve == "gamma":
+        return fraction ** LED_GAMMA
+    return fraction
+
+
+def duty_table(platform, scale, curve="linear", min_percent=0):
+    """
+    The duty cycle for every value 0..scale, computed once.
+
+    :param platform: "rp2" or "esp32".
+    :param scale: The highest value, e.g. brightness_scale or 100 for percentages.
+    :param curve: "linear", or "gamma" for perceptually even LED brightness steps.
+    :param min_percent: Duty (in percent of full scale) for the lowest non-zero value, so a fan spins
+        up at 1% instead of stalling; 0 stays off.
+    :return: array('H') with scale + 1 entries.
+    """
+    key = (platform, scale, curve, min_percent)
+    table = _duty_tables.get(key)
+    if table is not None:
+        return table
+    duty_max = PLATFORM_DUTY[platform][0]
+    duty_min = duty_max * min_percent // 100
+    table = array('H', [0] * (scale + 1))
+    for value in range(1, scale + 1):
+        table[value] = duty_min + round((duty_max - duty_min) * curve_value(curve, value / scale))
+    _duty_tables[key] = table
+    return table
+
+
+class PWMOutput:
+    """
+    A PWM pin driven by value (0..scale) through a precomputed duty table. The platform is resolved
+    at construction, so set() is one table lookup and one bound-method call.
+    """
+
+    def __init__(self, pin, freq, scale=100, curve="linear", min_percent=0):
+        self._platform = sys.platform
+        if self._platform not in PLATFORM_DUTY:
+            raise ValueError(f"Unsupported platform: {self._platform}")
+
+        if self._platform == "rp2":
+            self.pwm = machine.PWM(machine.Pin(pin))
+            self.pwm.freq(freq)
+        else:
+            self.pwm = machine.PWM(machine.Pin(pin), freq=freq)
+        self.duty_max, write_name = PLATFORM_DUTY[self._platform]
+        self.write = getattr(self.pwm, write_name)
+        self.curve = curve
+        self.min_percent = min_percent
+        self.set_scale(scale)
+
+    def set_scale(self, scale):
+        self.scale = scale
+        self.table = duty_table(self._platform, scale, self.curve, self.min_percent)
+
+    def set(self, value):
+        self.write(self.table[value])
+
+    def set_duty(self, duty):
+        self.write(duty)
+
+    def freq(self, freq):
+        self.pwm.freq(freq)
+
+    def deinit(self):
+        self.write(0)
+        self.pwm.deinit()
@@ -2,6 +2,6 @@ import home
 
 if __name__ == '__main__':
     try:
-        home.run()
+        home.main()
     except KeyboardInterrupt:
         print('exiting')
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+from home import Home, Timer
+
+DEVICE_ID = stubs.DEVICE_ID
+WEATHER_TOPICS = {
+    "temperature_topic": "homeassistant/sensor/deadbeef/bedroom_temperature",
+    "humidity_topic": "homeassistant/sensor/deadbeef/bedroom_humidity",
+}
+BOOT_PROFILE = stubs.boot_profile([["weather", "Bedroom", {"pin": 4, "measurement_interval_ms": 20, "heartbeat_ms": 0,
+                                                           "topics": WEATHER_TOPICS}]], d=1)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class AsyncRuntimeTestCase(stubs.HomeTestCase):
+    boot_profile = BOOT_PROFILE
+    startup_settings = {"runtime": "asyncio"}
+
+    def setUp(self):
+        super().setUp()
+        Timer.use_asyncio()
+
+    def tearDown(self):
+        Timer.asyncio = None
+
+    def test_periodic_timer_task(self):
+        async def scenario():
+            calls = []
+            timer = Timer(timer_number=1, mode=Timer.PERIODIC, period=10, callback=lambda: calls.append(1))
+            await asyncio.sleep(0.055)
+            timer.stop()
+            count = len(calls)
+            await asyncio.sleep(0.03)
+            return count, len(calls)
+
+        count, after_stop = run(scenario())
+        self.assertGreaterEqual(count, 3)
+        self.assertEqual(count, after_stop)
+        self.assertEqual(stubs.Timer.created, [])
+
+    def test_one_shot_timer_task(self):
+        async def scenario():
+            calls = []
+            timer = Timer(timer_number=1, mode=Timer.ONE_SHOT, period=10, callback=lambda: calls.append(1))
+            await asyncio.sleep(0.05)
+            return calls, timer
+
+        calls, timer = run(scenario())
+        self.assertEqual(calls, [1])
+        self.assertFalse(timer.active)
+
+    def test_restarting_timer_reuses_its_task(self):
+        async def scenario():
+            calls = []
+            timer = Timer(timer_number=1, mode=Timer.ONE_SHOT, period=10, callback=lambda: calls.append(1),
+                          autostart=False)
+            timer.start()
+            task = timer._task
+            # retriggered before it fires, as on every motion edge
+            for _ in range(3):
+                await asyncio.sleep(0.004)
+                timer.start()
+            await asyncio.sleep(0.03)
+            fired_once = list(calls)
+            timer.start()
+            await asyncio.sleep(0.03)
+            same_task = timer._task is task
+            timer.deinit()
+            await asyncio.sleep(0)
+            return fired_once, calls, same_task, task.cancelled(), timer._task
+
+        fired_once, calls, same_task, cancelled, task = run(scenario())
+        self.assertEqual(fired_once, [1])
+        self.assertEqual(calls, [1, 1])
+        self.assertTrue(same_task)
+        self.assertTrue(cancelled)
+        self.assertIsNone(task)
+
+    def test_shortened_period_takes_effect(self):
+        async def scenario():
+            calls = []
+            timer = Timer(timer_number=1, mode=Timer.ONE_SHOT, period=500, callback=lambda: calls.append(1))
+            await asyncio.sleep(0.005)
+            timer.stop()
+            timer.period = 10
+            timer.start()
+            await asyncio.sleep(0.05)
+            timer.deinit()
+            return calls
+
+        self.assertEqual(run(scenario()), [1])
+
+    def test_wifi_connect_yields(self):
+        from home.WiFiManager import WiFiManager
+        stubs.WLAN.polls_to_connect = 3
+
+        async def scenario():
+            ticks = []
+
+            async def ticker():
+                while True:
+                    ticks.append(1)
+                    await asyncio.sleep(0.001)
+
+            task = asyncio.create_task(ticker())
+            wifi = WiFiManager("the_interwebs", "pw")
+            await wifi.connect_wifi_async(poll_ms=5)
+            task.cancel()
+            return wifi.is_connected(), len(ticks)
+
+        connected, ticks = run(scenario())
+        self.assertTrue(connected)
+        self.assertGreater(ticks, 1)
+
+    def test_start_sequence_runs_sensors_as_tasks(self):
+        home_client = Home()
+
+        async def scenario():
+            await home_client.start_sequence_async()
+            await asyncio.sleep(0.07)
+            for sensor in home_client.sensor_manager.sensors:
+                sensor.timer.stop()
+
+        run(scenario())
+        self.assertEqual(stubs.Timer.created, [])
+        published = [topic for topic, _, _ in stubs.MQTTClient.instances[-1].published]
+        self.assertGreaterEqual(published.count(WEATHER_TOPICS['temperature_topic']), 2)
+        self.assertIn("command/#", stubs.MQTTClient.instances[-1].subscribed)
+
+    def test_receive_task_dispatches_commands(self):
+        home_client = Home()
+
+        async def scenario():
+            await home_client.start_sequence_async()
+            client = stubs.MQTTClient.instances[-1]
+            client.incoming.append((f"command/{DEVICE_ID}".encode(), json.dumps({"command": "check-in"}).encode()))
+            receiver = asyncio.create_task(home_client.receive_messages(period_ms=5))
+            await asyncio.sleep(0.03)
+            receiver.cancel()
+            for sensor in home_client.sensor_manager.sensors:
+                sensor.timer.stop()
+            return client
+
+        client = run(scenario())
+        log = [json.loads(msg) for topic, msg, _ in client.published if topic == f"z-home/log/{DEVICE_ID}"]
+        self.assertIn('check-in', [entry['type'] for entry in log])
+
+    def test_supervisor_reconnects_mqtt(self):
+        home_client = Home()
+
+        async def scenario():
+            await home_client.start_sequence_async()
+            home_client.mqtt_manager.backoff_base_ms = 4
+            stubs.MQTTClient.instances[-1].drop()
+            home_client.mqtt_ping()
+            stubs.MQTTClient.fail_connects = 1
+            supervisor = asyncio.create_task(home_client.supervise_connections(period_ms=5))
+            await asyncio.sleep(0.04)
+            supervisor.cancel()
+            for sensor in home_client.sensor_manager.sensors:
+                sensor.timer.stop()
+
+        run(scenario())
+        self.assertTrue(home_client.mqtt_manager.is_connected)
+        self.assertIn("command/#", stubs.MQTTClient.instances[-1].subscribed)
+
+
+if __name__ == '__main__':
+    unittest.main()
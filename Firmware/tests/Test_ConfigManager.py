@@ -0,0 +1,131 @@
+import hashlib
+import json
+import unittest
+import tests.stubs as stubs
+
+REQUESTS = stubs.install()
+
+from home.ConfigManager import ConfigManager
+
+BOOT_URL = stubs.BOOT_URL
+PROFILE = stubs.boot_profile([])
+
+
+class ConfigManagerTestCase(stubs.HomeTestCase):
+
+    def config_manager(self, **settings):
+        with open(ConfigManager.start_up_settings_path, 'w') as f:
+            json.dump({"host": stubs.HOST, "wifi_ssid": "the_interwebs", "wifi_password": "pw", **settings}, f)
+        config_manager = ConfigManager(None)
+        config_manager.get_startup_settings()
+        return config_manager
+
+    def write_cache(self, profile, etag=None):
+        with open(ConfigManager.last_run_config_path, 'w') as f:
+            json.dump(profile, f)
+        if etag is not None:
+            with open(ConfigManager.last_run_etag_path, 'w') as f:
+                f.write(etag)
+
+    def boot_headers(self):
+        return [headers for method, url, headers in REQUESTS.calls if url == BOOT_URL]
+
+    def test_sends_cached_etag(self):
+        self.write_cache(PROFILE, '"v1"')
+        REQUESTS.routes[BOOT_URL] = stubs.Response(200, PROFILE, {"ETag": '"v1"'})
+        self.config_manager(cache_first=False).request_device_config()
+        self.assertEqual(self.boot_headers(), [{"If-None-Match": '"v1"'}])
+
+    def test_no_etag_without_cache(self):
+        with open(ConfigManager.last_run_etag_path, 'w') as f:
+            f.write('"v1"')
+        REQUESTS.routes[BOOT_URL] = stubs.Response(200, PROFILE, {"ETag": '"v2"'})
+        config_manager = self.config_manager(cache_first=False)
+        config_manager.request_device_config()
+        # with no cached body to reuse, a 304 would leave the device without a config
+        self.assertEqual(self.boot_headers(), [{}])
+        self.assertEqual(config_manager.home_device, PROFILE)
+        with open(ConfigManager.last_run_etag_path) as f:
+            self.assertEqual(f.read(), '"v2"')
+
+    def test_304_reuses_cache(self):
+        cached = {**PROFILE, "n": "Cached Device"}
+        self.write_cache(cached, '"v1"')
+        REQUESTS.routes[BOOT_URL] = stubs.Response(304, headers={"ETag": '"v1"'})
+        config_manager = self.config_manager(cache_first=False)
+        config_manager.obtain_config()
+        config_manager.parse_config()
+        self.assertEqual(config_manager.home_device, cached)
+        self.assertEqual(config_manager.name, "Cached Device")
+
+    def test_cache_first_boots_without_request(self):
+        self.write_cache(PROFILE, '"v1"')
+        config_manager = self.config_manager()
+        config_manager.obtain_config()
+        self.assertEqual(config_manager.home_device, PROFILE)
+        self.assertTrue(config_manager.needs_revalidation)
+        self.assertEqual(REQUESTS.calls, [])
+
+    def test_unreachable_server_falls_back_to_cache(self):
+        self.write_cache(PROFILE)
+        REQUESTS.routes[BOOT_URL] = OSError(113)
+        config_manager = self.config_manager(cache_first=False)
+        config_manager.obtain_config()
+        self.assertEqual(config_manager.home_device, PROFILE)
+
+    def test_error_status_falls_back_to_cache(self):
+        self.write_cache(PROFILE)
+        REQUESTS.routes[BOOT_URL] = stubs.Response(500)
+        config_manager = self.config_manager(cache_first=False)
+        config_manager.obtain_config()
+        self.assertEqual(config_manager.home_device, PROFILE)
+
+    def test_unchanged_config_is_not_rewritten(self):
+        self.write_cache(PROFILE)
+        REQUESTS.routes[BOOT_URL] = stubs.Response(200, PROFILE)
+        config_manager = self.config_manager()
+        config_manager.obtain_config()
+        with open(ConfigManager.last_run_config_path, 'w') as f:
+            # a write would put the profile back
+            f.write('rewritten')
+        config_manager.revalidate_config()
+        with open(ConfigManager.last_run_config_path) as f:
+            self.assertEqual(f.read(), 'rewritten')
+        self.assertEqual(config_manager.last_run_hash, hashlib.sha256(json.dumps(PROFILE).encode()).digest())
+
+    def test_revalidate_changed(self):
+        self.write_cache(PROFILE)
+        changed = {**PROFILE, "n": "Renamed"}
+        REQUESTS.routes[BOOT_URL] = stubs.Response(200, changed, {"ETag": '"v2"'})
+        config_manager = self.config_manager()
+        config_manager.obtain_config()
+        self.assertTrue(config_manager.revalidate_config())
+        self.assertEqual(config_manager.home_device, changed)
+        self.assertFalse(config_manager.needs_revalidation)
+        with open(ConfigManager.last_run_config_path) as f:
+            self.assertEqual(json.load(f), changed)
+
+    def test_revalidate_unchanged(self):
+        self.write_cache(PROFILE, '"v1"')
+        REQUESTS.routes[BOOT_URL] = stubs.Response(304, headers={"ETag": '"v1"'})
+        config_manager = self.config_manager()
+        config_manager.obtain_config()
+        self.assertFalse(config_manager.revalidate_config())
+        self.assertEqual(config_manager.home_device, PROFILE)
+        self.assertFalse(config_manager.needs_revalidation)
+
+    def test_revalidate_unreachable(self):
+        self.write_cache(PROFILE, '"v1"')
+        config_manager = self.config_manager()
+        config_manager.obtain_config()
+        for response in (OSError(113), stubs.Response(500), stubs.Response(404)):
+            with self.subTest(response=response):
+                REQUESTS.routes[BOOT_URL] = response
+                self.assertIsNone(config_manager.revalidate_config())
+                # keeps running on the cached config and tries again later
+                self.assertEqual(config_manager.home_device, PROFILE)
+                self.assertTrue(config_manager.needs_revalidation)
+
+
+if __name__ == '__main__':
+    unittest.main()
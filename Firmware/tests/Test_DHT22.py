@@ -0,0 +1,119 @@
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+from home.sensors.DHT22 import MQTTDHT22Sensor, SampleFilter, MIN_SAMPLE_INTERVAL_MS
+
+TEMP_TOPIC = "homeassistant/sensor/deadbeef/bedroom_temperature"
+HUMIDITY_TOPIC = "homeassistant/sensor/deadbeef/bedroom_humidity"
+
+
+class ScriptedDHT22:
+    """Returns the queued (temperature, humidity) readings in order; None raises like a failed read."""
+
+    def __init__(self, readings):
+        self.readings = list(readings)
+        self.reading = None
+
+    def measure(self):
+        self.reading = self.readings.pop(0)
+        if self.reading is None:
+            raise OSError("ETIMEDOUT")
+
+    def temperature(self):
+        return self.reading[0]
+
+    def humidity(self):
+        return self.reading[1]
+
+
+class SampleFilterTestCase(unittest.TestCase):
+
+    def test_median_rejects_glitch(self):
+        sample_filter = SampleFilter(size=5, alpha=1)
+        for sample in (21.0, 21.1, 21.0):
+            sample_filter.add(sample)
+        self.assertEqual(sample_filter.add(60.0), 21.05)
+        self.assertEqual(sample_filter.add(21.1), 21.1)
+
+    def test_ring_keeps_last_samples(self):
+        sample_filter = SampleFilter(size=3, alpha=1)
+        for sample in (1.0, 2.0, 3.0, 10.0, 11.0):
+            value = sample_filter.add(sample)
+        self.assertEqual(value, 10.0)
+        self.assertEqual(len(sample_filter.samples), 3)
+
+    def test_ema_smooths(self):
+        sample_filter = SampleFilter(size=1, alpha=0.5)
+        sample_filter.add(20.0)
+        self.assertEqual(sample_filter.add(22.0), 21.0)
+
+
+class MQTTDHT22SensorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stubs.reset_state()
+        self.publisher = stubs.Publisher()
+
+    def make_sensor(self, readings, **kwargs):
+        return MQTTDHT22Sensor(ScriptedDHT22(readings), self.publisher, name_temp="Bedroom Temperature",
+                               name_humidity="Bedroom Humidity", temp_topic=TEMP_TOPIC, humidity_topic=HUMIDITY_TOPIC,
+                               **kwargs)
+
+    def messages(self, topic):
+        return [message for t, message in self.publisher.published if t == topic]
+
+    def test_publishes_only_past_deadband(self):
+        sensor = self.make_sensor([(21.0, 40.0), (21.1, 40.2), (21.0, 40.4), (21.4, 41.5), (21.5, 41.6)],
+                                  filter_size=1, ema_alpha=1)
+        for _ in range(5):
+            sensor.measure_and_publish()
+        self.assertEqual(self.messages(TEMP_TOPIC), ["21.0", "21.4"])
+        self.assertEqual(self.messages(HUMIDITY_TOPIC), ["40.0", "41.5"])
+
+    def test_heartbeat_republishes(self):
+        sensor = self.make_sensor([(21.0, 40.0)] * 3, heartbeat_ms=60000)
+        sensor.measure_and_publish()
+        stubs.advance(30000)
+        sensor.measure_and_publish()
+        stubs.advance(30000)
+        sensor.measure_and_publish()
+        self.assertEqual(self.messages(TEMP_TOPIC), ["21.0", "21.0"])
+        self.assertEqual(self.messages(HUMIDITY_TOPIC), ["40.0", "40.0"])
+
+    def test_glitch_reads_are_not_published(self):
+        sensor = self.make_sensor([(21.0, 40.0), (21.0, 40.0), (-40.0, 99.9), (21.0, 140.0), None, (21.0, 40.0)])
+        for _ in range(6):
+            sensor.measure_and_publish()
+        self.assertEqual(self.messages(TEMP_TOPIC), ["21.0"])
+        self.assertEqual(self.messages(HUMIDITY_TOPIC), ["40.0"])
+        self.assertEqual(sensor.rejected_samples, 1)
+        self.assertEqual(sensor.measurement_errors, 0)
+
+    def test_samples_filter_size_times_per_interval(self):
+        readings = [(21.0, 40.0), (21.2, 40.0), (60.0, 99.0), (21.1, 40.0), (21.0, 40.0)]
+        sensor = self.make_sensor(readings, filter_size=5, ema_alpha=1)
+        with stubs.platform('rp2'):
+            sensor.enable_interrupt(10000)
+            self.assertEqual(sensor.timer.period, 2000)
+            for _ in range(4):
+                stubs.fire_timers(2000)
+            self.assertEqual(self.publisher.published, [])
+            stubs.fire_timers(2000)
+            # the median of the interval's five samples leaves out the glitch
+            self.assertEqual(self.messages(TEMP_TOPIC), ["21.1"])
+            sensor.deinit()
+
+    def test_sampling_respects_the_sensor_minimum(self):
+        with stubs.platform('rp2'):
+            for interval, period, samples in ((4000, MIN_SAMPLE_INTERVAL_MS, 2), (1000, 1000, 1), (60000, 12000, 5)):
+                with self.subTest(interval=interval):
+                    sensor = self.make_sensor([], filter_size=5)
+                    sensor.enable_interrupt(interval)
+                    self.assertEqual((sensor.timer.period, sensor.samples_per_publish), (period, samples))
+                    sensor.deinit()
+
+
+if __name__ == '__main__':
+    unittest.main()
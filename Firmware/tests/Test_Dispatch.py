@@ -0,0 +1,95 @@
+import json
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+DEVICE_ID = stubs.DEVICE_ID
+LED_TOPICS = {
+    "state_topic": "homeassistant/light/deadbeef/shelf_lights/state",
+    "command_topic": "homeassistant/light/deadbeef/shelf_lights/set",
+    "brightness_state_topic": "homeassistant/light/deadbeef/shelf_lights/dim",
+    "brightness_command_topic": "homeassistant/light/deadbeef/shelf_lights/dim/set",
+}
+BOOT_PROFILE = stubs.boot_profile([["led", "Shelf Lights", {"pin": 15, "freq": 300, "fade_time_ms": 4,
+                                                             "brightness_scale": 100, "topics": LED_TOPICS}]], d=1)
+
+
+class DispatchTestCase(stubs.HomeTestCase):
+    boot_profile = BOOT_PROFILE
+
+    def setUp(self):
+        super().setUp()
+        self.start_home()
+
+    def log_types(self):
+        return [json.loads(msg)['type'] for topic, msg, _ in self.client.published
+                if topic == f"z-home/log/{DEVICE_ID}"]
+
+    def test_dispatch_table(self):
+        self.assertEqual(set(self.home_client.handlers), {
+            b"command/deadbeef", b"command/all-units", b"command/Test Device",
+            LED_TOPICS['command_topic'].encode(), LED_TOPICS['brightness_command_topic'].encode()})
+        self.assertEqual(self.client.subscribed,
+                         ["command/#", LED_TOPICS['command_topic'], LED_TOPICS['brightness_command_topic']])
+
+    def test_commands_by_device_id_all_units_and_name(self):
+        for topic in ("command/deadbeef", "command/all-units", "command/Test Device"):
+            self.receive(topic, json.dumps({"command": "check-in"}))
+        self.assertEqual(self.log_types().count('check-in'), 3)
+
+    def test_other_devices_commands_are_ignored(self):
+        self.receive("command/cafef00d", json.dumps({"command": "check-in"}))
+        self.assertNotIn('check-in', self.log_types())
+
+    def test_sensor_command_routed_to_its_handler(self):
+        light = self.home_client.sensor_manager.sensors[0].light
+        self.receive(LED_TOPICS['brightness_command_topic'], "40")
+        self.receive(LED_TOPICS['command_topic'], "ON")
+        self.assertEqual((light.state, light.target_brightness), ("ON", 40))
+        self.assertIn((LED_TOPICS['state_topic'], "ON", False), self.client.published)
+
+    def test_discovery_sends_brightness_scale(self):
+        led = self.home_client.sensor_manager.sensors[0]
+        _, _, _, config = led.discovery_components(None)[0]
+        self.assertEqual(config["brightness_scale"], 100)
+
+    def test_brightness_is_clamped_to_scale(self):
+        light = self.home_client.sensor_manager.sensors[0].light
+        self.receive(LED_TOPICS['brightness_command_topic'], "255")
+        self.receive(LED_TOPICS['command_topic'], "ON")
+        stubs.fire_timers(1000)
+        self.assertEqual((light.target_brightness, light.current_brightness), (100, 100))
+        self.assertIn((LED_TOPICS['brightness_state_topic'], "100", False), self.client.published)
+        self.receive(LED_TOPICS['brightness_command_topic'], "-5")
+        self.assertEqual(light.target_brightness, 0)
+
+    def test_removed_sensor_is_dropped_from_the_table(self):
+        self.home_client.sensor_manager.update_sensors([])
+        self.assertNotIn(LED_TOPICS['command_topic'].encode(), self.home_client.handlers)
+        self.receive(LED_TOPICS['command_topic'], "ON")
+
+
+class BrokerOutageTestCase(stubs.HomeTestCase):
+    boot_profile = BOOT_PROFILE
+
+    def test_sensors_start_without_the_broker(self):
+        stubs.MQTTClient.fail_connects = 1
+        self.start_home()
+        manager = self.home_client.mqtt_manager
+        self.assertEqual(manager.state, manager.BACKOFF)
+        self.assertEqual(len(self.home_client.sensor_manager.sensors), 1)
+        self.assertIn(LED_TOPICS['command_topic'], manager.subscriptions)
+
+        stubs.advance(manager.backoff_max_ms)
+        self.home_client.check_msg()
+        client = stubs.MQTTClient.instances[-1]
+        self.assertTrue(manager.is_connected)
+        self.assertEqual(client.subscribed,
+                         ["command/#", LED_TOPICS['command_topic'], LED_TOPICS['brightness_command_topic']])
+        # the state published while the broker was down goes out on connect
+        self.assertIn((LED_TOPICS['state_topic'], "OFF", False), client.published)
+
+
+if __name__ == '__main__':
+    unittest.main()
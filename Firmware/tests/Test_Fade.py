@@ -0,0 +1,81 @@
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+from home.sensors.DimmableLED import DimmableLight, EASING_SCALE, EASINGS
+
+
+class FadeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stubs.reset_state()
+        self.platform = stubs.platform('rp2')
+        self.platform.__enter__()
+
+    def tearDown(self):
+        self.platform.__exit__(None, None, None)
+
+    def make_light(self, **kwargs):
+        return DimmableLight(pin=15, brightness_scale=100, fade_duration_ms=1000, **kwargs)
+
+    def tick(self, light, ms):
+        stubs.fire_timers(ms)
+
+    def test_fade_takes_the_configured_duration(self):
+        for target in (100, 10):
+            light = self.make_light()
+            light.target_brightness = target
+            light.fade()
+            self.tick(light, 500)
+            self.assertEqual(light.current_brightness, target // 2)
+            self.tick(light, 500)
+            self.assertEqual(light.current_brightness, target)
+            self.assertFalse(light.fading)
+            self.assertFalse(light.fade_timer.active)
+            self.assertEqual(light.output.pwm.duty_value, light.convert_to_duty(target))
+
+    def test_one_timer_per_light(self):
+        light = self.make_light()
+        light.on()
+        light.target_brightness = 100
+        light.fade()
+        first_timer = light.fade_timer
+        self.tick(light, 1000)
+        light.off()
+        light.fade()
+        self.assertTrue(light.fade_timer.active)
+        self.tick(light, 1000)
+        self.assertEqual(light.current_brightness, 0)
+        self.assertIs(light.fade_timer, first_timer)
+
+    def test_new_target_mid_fade_restarts_from_current(self):
+        light = self.make_light()
+        light.target_brightness = 100
+        light.fade()
+        self.tick(light, 500)
+        light.target_brightness = 0
+        light.fade()
+        self.assertEqual(light.fade_from, 50)
+        self.tick(light, 500)
+        self.assertEqual(light.current_brightness, 25)
+        self.tick(light, 500)
+        self.assertEqual(light.current_brightness, 0)
+
+    def test_easing_curves(self):
+        half, quarter = EASING_SCALE // 2, EASING_SCALE // 4
+        for name, curve in EASINGS.items():
+            self.assertEqual((curve(0), curve(EASING_SCALE)), (0, EASING_SCALE), name)
+        self.assertEqual(EASINGS["ease-in-out"](half), half)
+        self.assertLess(EASINGS["ease-in"](quarter), quarter)
+        self.assertGreater(EASINGS["ease-out"](quarter), quarter)
+
+        light = self.make_light(easing="ease-in")
+        light.target_brightness = 100
+        light.fade()
+        self.tick(light, 500)
+        self.assertEqual(light.current_brightness, 25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+from home.MQTTManager import MQTTManager, unsubscribe
+
+
+def make_manager(unit_id='deadbeef', **kwargs):
+    return MQTTManager(unit_id=unit_id, server="homeassistant.local", port=1883,
+                       username="mqtt-user", password="mqtt-password", **kwargs)
+
+
+class MQTTManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stubs.reset_state()
+
+    def test_failed_connect_schedules_a_retry(self):
+        manager = make_manager()
+        stubs.MQTTClient.fail_connects = 1
+        self.assertFalse(manager.connect_mqtt())
+        self.assertEqual(manager.state, MQTTManager.BACKOFF)
+        # still inside the backoff window: no new connection attempt
+        self.assertFalse(manager.reconnect())
+        self.assertEqual(len(stubs.MQTTClient.instances), 1)
+        stubs.advance(manager.backoff_base_ms)
+        self.assertTrue(manager.reconnect())
+        self.assertEqual(manager.failures, 0)
+        self.assertEqual(len(stubs.MQTTClient.instances), 2)
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        manager = make_manager(backoff_base_ms=1000, backoff_max_ms=8000)
+        for failures, full in ((1, 1000), (2, 2000), (3, 4000), (4, 8000), (9, 8000)):
+            manager.failures = failures
+            delay = manager.backoff_delay_ms()
+            self.assertGreaterEqual(delay, full // 2)
+            self.assertLessEqual(delay, full)
+
+    def test_jitter_is_seeded_per_device(self):
+        def delays(unit_id):
+            manager = make_manager(unit_id, backoff_base_ms=60000, backoff_max_ms=60000)
+            manager.failures = 1
+            return [manager.backoff_delay_ms() for _ in range(5)]
+
+        self.assertEqual(delays('deadbeef'), delays('deadbeef'))
+        self.assertNotEqual(delays('deadbeef'), delays('cafef00d'))
+
+    def test_subscriptions_restored_after_reconnect(self):
+        reconnects = []
+        manager = make_manager(on_reconnect=lambda: reconnects.append(1))
+        manager.connect_mqtt()
+        manager.set_callback(print)
+        manager.subscribe("command/#")
+        self.assertEqual(reconnects, [])
+
+        stubs.MQTTClient.instances[-1].drop()
+        manager.check_msg()
+        self.assertFalse(manager.is_connected)
+        manager.subscribe("homeassistant/light/deadbeef/shelf_lights/set")
+        manager.publish("z-home/log/deadbeef", "queued while disconnected")
+
+        stubs.advance(manager.backoff_base_ms)
+        manager.check_msg()
+        client = stubs.MQTTClient.instances[-1]
+        self.assertTrue(manager.is_connected)
+        self.assertEqual(client.subscribed, ["command/#", "homeassistant/light/deadbeef/shelf_lights/set"])
+        self.assertIs(client.callback, print)
+        self.assertEqual(client.published, [("z-home/log/deadbeef", "queued while disconnected", False)])
+        self.assertEqual(reconnects, [1])
+
+    def test_unsubscribed_topic_is_not_restored(self):
+        manager = make_manager()
+        manager.connect_mqtt()
+        manager.subscribe("command/#")
+        manager.subscribe("homeassistant/light/deadbeef/shelf_lights/set")
+        manager.unsubscribe("homeassistant/light/deadbeef/shelf_lights/set")
+        self.assertEqual(stubs.MQTTClient.instances[-1].subscribed, ["command/#"])
+
+        stubs.MQTTClient.instances[-1].drop()
+        manager.check_msg()
+        manager.unsubscribe("command/#")
+        stubs.advance(manager.backoff_base_ms)
+        manager.check_msg()
+        self.assertTrue(manager.is_connected)
+        self.assertEqual(stubs.MQTTClient.instances[-1].subscribed, [])
+        self.assertEqual(manager.subscriptions, [])
+
+    def test_unsubscribe_without_client_support(self):
+        class Socket:
+            def __init__(self):
+                self.written = b""
+
+            def write(self, data):
+                self.written += bytes(data)
+
+            def read(self, n):
+                return b"\x02\x00\x08"[:n]
+
+        class Client:
+            pid = 7
+
+            def __init__(self):
+                self.sock = Socket()
+                self.ops = [0x30, 0xb0]
+
+            def _send_str(self, s):
+                self.sock.write(len(s).to_bytes(2, "big") + s.encode())
+
+            def wait_msg(self):
+                return self.ops.pop(0)
+
+        client = Client()
+        unsubscribe(client, "a/b")
+        self.assertEqual(client.pid, 8)
+        self.assertEqual(client.sock.written, b"\xa2\x07\x00\x08\x00\x03a/b")
+        self.assertEqual(client.ops, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+from home.sensors.MotionSensor import MotionSensor, MQTTMotionSensor
+
+STATE_TOPIC = "homeassistant/binary_sensor/deadbeef/nook_motion/state"
+
+
+class MotionSensorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stubs.reset_state()
+        self.platform = stubs.platform('rp2')
+        self.platform.__enter__()
+        self.publisher = stubs.Publisher()
+        self.motion = MotionSensor(pin=27, retrigger_delay_ms=500, debounce_ms=50)
+        self.sensor = MQTTMotionSensor(self.motion, self.publisher, name="Nook Motion", state_topic=STATE_TOPIC,
+                                       min_publish_interval_ms=1000)
+        self.sensor.enable_interrupt()
+
+    def tearDown(self):
+        self.platform.__exit__(None, None, None)
+
+    def edge(self):
+        self.motion.pin.handler(self.motion.pin)
+
+    def states(self):
+        return [message for _, message in self.publisher.published]
+
+    def test_irq_only_schedules(self):
+        self.edge()
+        self.assertEqual(self.publisher.published, [])
+        self.assertEqual(len(stubs.SCHEDULED), 1)
+        stubs.run_scheduled()
+        self.assertEqual(self.states(), ["1"])
+
+    def test_chatter_is_debounced(self):
+        for _ in range(10):
+            self.edge()
+            stubs.advance(5)
+        stubs.run_scheduled()
+        self.assertEqual(self.motion.scheduled, False)
+        stubs.advance(60)
+        self.edge()
+        self.assertEqual(len(stubs.SCHEDULED), 1)
+
+    def test_retrigger_timer_is_reused(self):
+        timer = self.motion.timer
+        for _ in range(3):
+            self.edge()
+            stubs.run_scheduled()
+            stubs.fire_timers(300)
+        self.assertIs(self.motion.timer, timer)
+        self.assertEqual(self.motion.last_motion, 1)
+        stubs.fire_timers(300)
+        self.assertEqual(self.motion.last_motion, 0)
+
+    def test_min_publish_interval(self):
+        self.edge()
+        stubs.run_scheduled()
+        stubs.fire_timers(500)
+        # cleared after 500 ms, held back until a second after the first publish
+        self.assertEqual(self.motion.last_motion, 0)
+        self.assertEqual(self.states(), ["1"])
+        stubs.fire_timers(300)
+        self.assertEqual(self.states(), ["1"])
+        stubs.fire_timers(300)
+        self.assertEqual(self.states(), ["1", "0"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+from home.sensors.PWMOutput import PWMOutput, duty_table
+from home.sensors.Fan import Fan
+
+
+class PWMOutputTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.platform = stubs.platform('rp2')
+        self.platform.__enter__()
+
+    def tearDown(self):
+        self.platform.__exit__(None, None, None)
+
+    def test_linear_table(self):
+        table = duty_table("rp2", 100)
+        self.assertEqual(table.typecode, 'H')
+        self.assertEqual((table[0], table[50], table[100]), (0, 32768, 65535))
+        self.assertEqual(duty_table("esp32", 100)[100], 1023)
+
+    def test_gamma_table(self):
+        table = duty_table("rp2", 255, "gamma")
+        self.assertEqual((table[0], table[255]), (0, 65535))
+        self.assertLess(table[128], 65535 // 4)
+        self.assertTrue(all(table[i] <= table[i + 1] for i in range(255)))
+
+    def test_min_spin_offset(self):
+        table = duty_table("rp2", 100, min_percent=30)
+        self.assertEqual(table[0], 0)
+        self.assertGreaterEqual(table[1], 65535 * 30 // 100)
+        self.assertEqual(table[100], 65535)
+
+    def test_tables_are_shared(self):
+        first = PWMOutput(pin=15, freq=300, scale=255, curve="gamma")
+        second = PWMOutput(pin=16, freq=300, scale=255, curve="gamma")
+        self.assertIs(first.table, second.table)
+
+    def test_set_writes_the_table_entry(self):
+        output = PWMOutput(pin=15, freq=300, scale=255, curve="gamma")
+        output.set(200)
+        self.assertEqual(output.pwm.duty_value, output.table[200])
+
+    def test_esp32_writes_ten_bit_duty(self):
+        with stubs.platform('esp32'):
+            output = PWMOutput(pin=15, freq=300)
+        output.set(100)
+        self.assertEqual(output.pwm.duty_value, 1023)
+
+    def test_fan_power(self):
+        fan = Fan(enable_pin=14, pwm_pin=15, freq=25000, min_power=20)
+        fan.set_power(1)
+        self.assertGreaterEqual(fan.pwm_pin.pwm.duty_value, 65535 // 5)
+        with self.assertRaises(ValueError):
+            fan.set_power(101)
+
+
+if __name__ == '__main__':
+    unittest.main()
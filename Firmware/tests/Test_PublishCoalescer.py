@@ -0,0 +1,130 @@
+import json
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+from home.PublishCoalescer import PublishCoalescer, json_state_config
+
+DEVICE_ID = stubs.DEVICE_ID
+LED_TOPICS = {
+    "state_topic": "homeassistant/light/deadbeef/shelf_lights/state",
+    "command_topic": "homeassistant/light/deadbeef/shelf_lights/set",
+    "brightness_state_topic": "homeassistant/light/deadbeef/shelf_lights/dim",
+    "brightness_command_topic": "homeassistant/light/deadbeef/shelf_lights/dim/set",
+    "discovery_topic": "homeassistant/light/deadbeef/shelf_lights/config",
+}
+BOOT_PROFILE = stubs.boot_profile([["led", "Shelf Lights", {"pin": 15, "freq": 300, "fade_time_ms": 4,
+                                                             "brightness_scale": 100, "topics": LED_TOPICS}]],
+                                  c=50)
+
+
+class PublishCoalescerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stubs.reset_state()
+        self.platform = stubs.platform('rp2')
+        self.platform.__enter__()
+        self.published = []
+
+    def tearDown(self):
+        self.platform.__exit__(None, None, None)
+
+    def publish(self, topic, message):
+        self.published.append((topic, message))
+
+    def test_latest_value_wins_within_window(self):
+        coalescer = PublishCoalescer(self.publish, window_ms=50)
+        for brightness in range(10, 60, 10):
+            coalescer.put("light/dim", str(brightness))
+        coalescer.put("light/state", "ON")
+        self.assertEqual(self.published, [])
+        stubs.fire_timers(60)
+        self.assertEqual(self.published, [("light/dim", "50"), ("light/state", "ON")])
+        self.assertEqual(coalescer.counters(), {"sent": 2, "saved": 4,
+                                                "topics": {"light/dim": [5, 4], "light/state": [1, 0]}})
+
+    def test_json_state_packs_every_topic(self):
+        coalescer = PublishCoalescer(self.publish, window_ms=50, json_topic="z-home/state/deadbeef")
+        coalescer.put("light/state", "ON")
+        coalescer.put("light/dim", "40")
+        stubs.fire_timers(60)
+        self.assertEqual(coalescer.counters()["saved"], 1)
+        coalescer.put("light/dim", "80")
+        stubs.fire_timers(60)
+        self.assertEqual(coalescer.counters()["saved"], 1)
+        self.assertEqual([topic for topic, _ in self.published], ["z-home/state/deadbeef"] * 2)
+        self.assertEqual(json.loads(self.published[-1][1]), {"light/state": "ON", "light/dim": "80"})
+        coalescer.discard("light/dim")
+        coalescer.put("light/state", "OFF")
+        stubs.fire_timers(60)
+        self.assertEqual(json.loads(self.published[-1][1]), {"light/state": "OFF"})
+
+    def test_json_state_config_templates(self):
+        config = json_state_config("light", dict(LED_TOPICS), "z-home/state/deadbeef")
+        self.assertEqual(config["state_topic"], "z-home/state/deadbeef")
+        self.assertEqual(config["brightness_state_topic"], "z-home/state/deadbeef")
+        self.assertEqual(config["state_value_template"], "{{ value_json['" + LED_TOPICS["state_topic"] + "'] }}")
+        self.assertIn("brightness_value_template", config)
+        self.assertEqual(config["command_topic"], LED_TOPICS["command_topic"])
+        config = json_state_config("sensor", {"state_topic": "weather/temperature"}, "z-home/state/deadbeef")
+        self.assertEqual(config["value_template"], "{{ value_json['weather/temperature'] }}")
+
+
+class HomeCoalescingTestCase(stubs.HomeTestCase):
+
+    def start(self, profile):
+        self.serve_boot_profile(profile)
+        self.start_home()
+        stubs.fire_timers(60)
+        self.boot_published = list(self.client.published)
+        self.client.published.clear()
+
+    def state_publishes(self):
+        return [(topic, msg) for topic, msg, _ in self.client.published if not topic.startswith("z-home/log")]
+
+    def test_command_publishes_are_coalesced(self):
+        self.start(BOOT_PROFILE)
+        for brightness in (20, 40, 60):
+            self.receive(LED_TOPICS["brightness_command_topic"], str(brightness))
+        self.receive(LED_TOPICS["command_topic"], "ON")
+        self.assertEqual(self.state_publishes(), [])
+        stubs.fire_timers(60)
+        published = self.state_publishes()
+        self.assertEqual(len(published), 2)
+        self.assertEqual(dict(published)[LED_TOPICS["brightness_state_topic"]], "60")
+        counters = self.home_client.publish_counters()["coalesced"]
+        self.assertEqual(counters["topics"][LED_TOPICS["brightness_state_topic"]][1], 3)
+
+    def test_logs_and_discovery_are_not_coalesced(self):
+        self.start(BOOT_PROFILE)
+        self.home_client.log("hello")
+        self.assertEqual([topic for topic, _, _ in self.client.published], [f"z-home/log/{DEVICE_ID}"])
+
+    def test_json_state_mode(self):
+        self.start({**BOOT_PROFILE, "c": None, "j": 1})
+        self.receive(LED_TOPICS["brightness_command_topic"], "30")
+        stubs.fire_timers(60)
+        published = self.state_publishes()
+        self.assertEqual([topic for topic, _ in published], [f"z-home/state/{DEVICE_ID}"])
+        states = json.loads(published[0][1])
+        self.assertEqual(states[LED_TOPICS["brightness_state_topic"]], "30")
+        self.assertIn(LED_TOPICS["state_topic"], states)
+
+    def test_json_state_discovery(self):
+        self.start({**BOOT_PROFILE, "j": 1})
+        discovery = [json.loads(msg) for topic, msg, retain in self.boot_published
+                     if topic == LED_TOPICS["discovery_topic"]]
+        self.assertEqual(discovery[0]["state_topic"], f"z-home/state/{DEVICE_ID}")
+        self.assertIn("state_value_template", discovery[0])
+
+    def test_publish_counters_command(self):
+        self.start(BOOT_PROFILE)
+        self.receive(f"command/{DEVICE_ID}", json.dumps({"command": "publish-counters"}))
+        log = [json.loads(msg) for topic, msg, _ in self.client.published if topic == f"z-home/log/{DEVICE_ID}"]
+        self.assertEqual(log[-1]["type"], "publish-counters")
+        self.assertIn("coalesced", json.loads(log[-1]["message"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
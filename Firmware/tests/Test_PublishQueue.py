@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+from home.PublishQueue import PublishQueue
+
+LOG = "z-home/log/deadbeef"
+STATE = "homeassistant/light/deadbeef/shelf_lights/state"
+
+
+def drain(queue):
+    messages = []
+    while len(queue):
+        i = queue.peek()
+        messages.append((queue.topics[i], queue.messages[i]))
+        queue.pop()
+    return messages
+
+
+class PublishQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.directory.name, 'publish-spill.txt')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_keep_latest_overwrites_in_place(self):
+        queue = PublishQueue(size=4)
+        queue.put(STATE, "ON")
+        queue.put(LOG, "log")
+        queue.put(STATE, "OFF")
+        self.assertEqual(drain(queue), [(STATE, "OFF"), (LOG, "log")])
+        self.assertEqual(queue.replaced, 1)
+
+    def test_fifo_keeps_every_message(self):
+        queue = PublishQueue(size=4)
+        queue.set_policy(LOG, PublishQueue.FIFO)
+        for n in range(3):
+            queue.put(LOG, str(n))
+        self.assertEqual(drain(queue), [(LOG, "0"), (LOG, "1"), (LOG, "2")])
+
+    def test_overflow_drops_the_oldest(self):
+        queue = PublishQueue(size=3)
+        queue.set_policy(LOG, PublishQueue.FIFO)
+        for n in range(5):
+            queue.put(LOG, str(n))
+        self.assertEqual(drain(queue), [(LOG, "2"), (LOG, "3"), (LOG, "4")])
+        self.assertEqual(queue.counters(), {"queued": 0, "dropped": 2, "replaced": 0, "spilled": 0})
+
+    def test_overflow_spills_fifo_messages(self):
+        queue = PublishQueue(size=2, spill_path=self.spill_path)
+        queue.set_policy(LOG, PublishQueue.FIFO)
+        for n in range(5):
+            queue.put(LOG, str(n))
+        self.assertEqual(queue.spilled, 3)
+
+        published = []
+        self.assertTrue(queue.drain_spill(lambda *message: published.append(message) or True))
+        self.assertEqual(published, [(LOG, "0", False), (LOG, "1", False), (LOG, "2", False)])
+        self.assertEqual(drain(queue), [(LOG, "3"), (LOG, "4")])
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_failed_spill_drain_keeps_the_rest(self):
+        queue = PublishQueue(size=1, spill_path=self.spill_path)
+        queue.set_policy(LOG, PublishQueue.FIFO)
+        for n in range(4):
+            queue.put(LOG, str(n))
+        published = []
+
+        def publish(topic, message, retain):
+            if len(published) == 1:
+                return False
+            published.append(message)
+            return True
+
+        self.assertFalse(queue.drain_spill(publish))
+        # the spill file survives a restart
+        restarted = PublishQueue(size=1, spill_path=self.spill_path)
+        remaining = []
+        self.assertTrue(restarted.drain_spill(lambda topic, message, retain: remaining.append(message) or True))
+        self.assertEqual(published + remaining, ["0", "1", "2"])
+
+    def test_spill_limit(self):
+        queue = PublishQueue(size=1, spill_path=self.spill_path, spill_max_bytes=40)
+        queue.set_policy(LOG, PublishQueue.FIFO)
+        for n in range(4):
+            queue.put(LOG, str(n))
+        self.assertEqual((queue.spilled, queue.dropped), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
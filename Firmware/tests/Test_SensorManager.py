@@ -0,0 +1,114 @@
+import json
+import unittest
+import tests.stubs as stubs
+
+REQUESTS = stubs.install()
+
+DEVICE_ID = stubs.DEVICE_ID
+BOOT_URL = stubs.BOOT_URL
+LED_TOPICS = {
+    "state_topic": "homeassistant/light/deadbeef/shelf_lights/state",
+    "command_topic": "homeassistant/light/deadbeef/shelf_lights/set",
+    "brightness_state_topic": "homeassistant/light/deadbeef/shelf_lights/dim",
+    "brightness_command_topic": "homeassistant/light/deadbeef/shelf_lights/dim/set",
+    "discovery_topic": "homeassistant/light/deadbeef/shelf_lights/config",
+}
+WEATHER_TOPICS = {
+    "temperature_topic": "homeassistant/sensor/deadbeef/bedroom_temperature",
+    "temperature_discovery": "homeassistant/sensor/deadbeef/bedroom_temperature/config",
+    "humidity_topic": "homeassistant/sensor/deadbeef/bedroom_humidity",
+    "humidity_discovery": "homeassistant/sensor/deadbeef/bedroom_humidity/config",
+}
+LED = ["led", "Shelf Lights", {"pin": 15, "freq": 300, "fade_time_ms": 4, "brightness_scale": 100,
+                               "topics": LED_TOPICS}]
+WEATHER = ["weather", "Bedroom", {"pin": 2, "measurement_interval_ms": 10000, "name_temp": "Bedroom Temperature",
+                                  "name_humidity": "Bedroom Humidity", "topics": WEATHER_TOPICS}]
+BOOT_PROFILE = stubs.boot_profile([LED, WEATHER])
+
+
+def moved_led(topics):
+    return ["led", "Shelf Lights", {**LED[2], "topics": topics}]
+
+
+class SensorManagerTestCase(stubs.HomeTestCase):
+    boot_profile = BOOT_PROFILE
+
+    def setUp(self):
+        super().setUp()
+        self.start_home()
+        self.sensor_manager = self.home_client.sensor_manager
+        self.client.published.clear()
+
+    def cleared(self):
+        return [topic for topic, msg, retain in self.client.published if msg == '' and retain]
+
+    def discovery(self, topic):
+        return [json.loads(msg) for t, msg, _ in self.client.published if t == topic and msg]
+
+    def indexes(self):
+        return {key: index for key, (_, index, _) in self.sensor_manager.running.items()}
+
+    def test_unchanged_sensors_keep_running(self):
+        sensors = list(self.sensor_manager.sensors)
+        self.assertEqual(self.sensor_manager.update_sensors([LED, WEATHER]), [])
+        self.assertEqual(self.sensor_manager.sensors, sensors)
+        self.assertEqual(self.cleared(), [])
+
+    def test_changed_sensor_is_rebuilt(self):
+        led = self.sensor_manager.running[("led", "Shelf Lights")][2]
+        changed = ["led", "Shelf Lights", {**LED[2], "freq": 500}]
+        created = self.sensor_manager.update_sensors([changed, WEATHER])
+        self.assertEqual(len(created), 1)
+        self.assertIsNot(created[0], led)
+        self.assertNotIn(led, self.sensor_manager.sensors)
+        # same topics, so the entity stays in Home Assistant
+        self.assertEqual(self.cleared(), [])
+        self.assertIn(LED_TOPICS["command_topic"].encode(), self.home_client.handlers)
+
+    def test_removed_sensor_is_torn_down(self):
+        self.sensor_manager.update_sensors([WEATHER])
+        self.assertNotIn(("led", "Shelf Lights"), self.sensor_manager.running)
+        self.assertNotIn(LED_TOPICS["command_topic"].encode(), self.home_client.handlers)
+        self.assertNotIn(LED_TOPICS["command_topic"], self.home_client.mqtt_manager.subscriptions)
+        self.assertNotIn(LED_TOPICS["command_topic"], self.client.subscribed)
+        self.assertEqual(self.cleared(), [LED_TOPICS["discovery_topic"]])
+
+    def test_reconfigured_topics_clear_old_discovery(self):
+        topics = {**LED_TOPICS, "discovery_topic": "homeassistant/light/deadbeef/reading_light/config"}
+        self.sensor_manager.update_sensors([moved_led(topics), WEATHER])
+        self.assertEqual(self.cleared(), [LED_TOPICS["discovery_topic"]])
+        self.assertEqual(len(self.discovery(topics["discovery_topic"])), 1)
+
+    def test_index_is_profile_position(self):
+        self.assertEqual(self.indexes(), {("led", "Shelf Lights"): 1, ("weather", "Bedroom"): 2})
+        self.sensor_manager.update_sensors([WEATHER])
+        self.assertEqual(self.indexes(), {("weather", "Bedroom"): 1})
+        temperature = self.discovery(WEATHER_TOPICS["temperature_discovery"])
+        self.assertEqual(temperature[-1]["unique_id"], f"{DEVICE_ID}-1_temp")
+        self.sensor_manager.update_sensors([WEATHER, LED])
+        self.assertEqual(self.indexes(), {("led", "Shelf Lights"): 2, ("weather", "Bedroom"): 1})
+
+    def test_revalidated_config_is_applied_without_restart(self):
+        # as after booting from the cached config
+        self.home_client.config_manager.needs_revalidation = True
+        REQUESTS.routes[BOOT_URL] = stubs.Response(200, {**BOOT_PROFILE, "s": [WEATHER]})
+        self.home_client.check_config()
+        self.assertEqual(list(self.sensor_manager.running), [("weather", "Bedroom")])
+        self.assertFalse(self.home_client.config_manager.needs_revalidation)
+
+    def test_unreachable_server_is_retried(self):
+        self.home_client.config_manager.needs_revalidation = True
+        REQUESTS.routes[BOOT_URL] = stubs.Response(503)
+        self.home_client.check_config()
+        self.assertIsNotNone(self.home_client.next_config_check)
+        calls = len(REQUESTS.calls)
+        self.home_client.check_config()
+        self.assertEqual(len(REQUESTS.calls), calls)
+        stubs.advance(60000)
+        REQUESTS.routes[BOOT_URL] = stubs.Response(200, {**BOOT_PROFILE, "s": [WEATHER]})
+        self.home_client.check_config()
+        self.assertEqual(list(self.sensor_manager.running), [("weather", "Bedroom")])
+
+
+if __name__ == '__main__':
+    unittest.main()
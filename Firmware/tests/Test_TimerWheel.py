@@ -0,0 +1,92 @@
+import unittest
+import tests.stubs as stubs
+
+stubs.install()
+
+from home.Timer import Timer, TimerWheel
+
+
+class TimerWheelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stubs.reset_state()
+        self.platform = stubs.platform('rp2')
+        self.platform.__enter__()
+
+    def tearDown(self):
+        self.platform.__exit__(None, None, None)
+
+    def test_periodic_and_one_shot(self):
+        calls = []
+        Timer(timer_number=1, mode=Timer.PERIODIC, period=20, callback=lambda: calls.append('periodic'))
+        Timer(timer_number=2, mode=Timer.ONE_SHOT, period=30, callback=lambda: calls.append('one-shot'))
+        for _ in range(10):
+            stubs.fire_timers(10)
+        self.assertEqual(calls.count('periodic'), 5)
+        self.assertEqual(calls.count('one-shot'), 1)
+
+    def test_one_hardware_timer_for_every_timer(self):
+        calls = []
+        timers = [Timer(timer_number=n, mode=Timer.PERIODIC, period=10 * n, callback=lambda n=n: calls.append(n))
+                  for n in range(1, 9)]
+        stubs.fire_timers(80)
+        self.assertEqual(len(stubs.Timer.created), 1)
+        self.assertEqual(sorted(set(calls)), list(range(1, 9)))
+        self.assertTrue(all(timer.active for timer in timers))
+
+    def test_stop_and_restart(self):
+        calls = []
+        timer = Timer(timer_number=1, mode=Timer.ONE_SHOT, period=50, callback=lambda: calls.append(1))
+        stubs.fire_timers(30)
+        timer.start()
+        stubs.fire_timers(30)
+        self.assertEqual(calls, [])
+        stubs.fire_timers(30)
+        self.assertEqual(calls, [1])
+
+        timer.start()
+        timer.stop()
+        stubs.fire_timers(100)
+        self.assertEqual(calls, [1])
+        self.assertFalse(timer.active)
+
+    def test_callback_can_stop_another_due_timer(self):
+        calls = []
+        second = Timer(timer_number=2, mode=Timer.PERIODIC, period=10, callback=lambda: calls.append(2))
+        Timer(timer_number=1, mode=Timer.PERIODIC, period=10, callback=second.stop)
+        stubs.fire_timers(10)
+        stubs.fire_timers(10)
+        self.assertLessEqual(len(calls), 1)
+        self.assertFalse(second.active)
+
+    def test_catches_up_after_a_stall(self):
+        calls = []
+        Timer(timer_number=1, mode=Timer.ONE_SHOT, period=500, callback=lambda: calls.append(1))
+        stubs.fire_timers(5000)
+        self.assertEqual(calls, [1])
+
+    def test_callback_errors_are_contained(self):
+        calls = []
+
+        def broken():
+            raise ValueError("sensor unplugged")
+
+        Timer(timer_number=1, mode=Timer.PERIODIC, period=10, callback=broken)
+        Timer(timer_number=2, mode=Timer.PERIODIC, period=10, callback=lambda: calls.append(2))
+        stubs.fire_timers(10)
+        self.assertEqual(calls, [2])
+
+    def test_tick_skipped_while_the_main_program_links_a_timer(self):
+        calls = []
+        Timer(timer_number=1, mode=Timer.PERIODIC, period=10, callback=lambda: calls.append(1))
+        wheel = TimerWheel.get()
+        wheel.mutating = True
+        stubs.fire_timers(10)
+        self.assertEqual(calls, [])
+        wheel.mutating = False
+        stubs.fire_timers(10)
+        self.assertEqual(calls, [1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
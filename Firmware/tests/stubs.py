@@ -0,0 +1,428 @@
+"""
+Minimal CPython stand-ins for the MicroPython modules the firmware imports, so the ``home``
+package can be imported and exercised off-device. Call ``install()`` before importing ``home``.
+"""
+import binascii
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+import unittest
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'Firmware', 'src'))
+
+
+class DeviceReset(Exception):
+    pass
+
+
+# --------- machine --------- #
+class Timer:
+    PERIODIC = 1
+    ONE_SHOT = 0
+    created = []
+
+    def __init__(self, timer_id=-1, mode=None, period=None, callback=None):
+        self.timer_id = timer_id
+        self.mode = mode
+        self.period = period
+        self.callback = callback
+        self.active = callback is not None
+        Timer.created.append(self)
+
+    def init(self, mode=None, period=None, callback=None):
+        self.mode = mode
+        self.period = period
+        self.callback = callback
+        self.active = True
+
+    def deinit(self):
+        self.active = False
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 4
+    IRQ_FALLING = 8
+
+    def __init__(self, pin_id, mode=None, pull=None):
+        self.pin_id = pin_id
+        self.mode = mode
+        self._value = 0
+        self.handler = None
+
+    def irq(self, trigger=None, handler=None):
+        self.handler = handler
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+
+class PWM:
+    def __init__(self, pin, freq=None):
+        self.pin = pin
+        self._freq = freq
+        self.duty_value = 0
+        self.active = True
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value):
+        self.duty_value = value
+
+    def duty(self, value):
+        self.duty_value = value
+
+    def deinit(self):
+        self.active = False
+
+
+def reset():
+    raise DeviceReset()
+
+
+# --------- micropython --------- #
+SCHEDULED = []
+
+
+def schedule(func, arg):
+    SCHEDULED.append((func, arg))
+
+
+def run_scheduled():
+    while SCHEDULED:
+        func, arg = SCHEDULED.pop(0)
+        func(arg)
+
+
+def fire_timers(ms):
+    """
+    Moves the clock forward by ms and runs the hardware timer callbacks and whatever they scheduled.
+    """
+    advance(ms)
+    for timer in list(Timer.created):
+        if timer.active:
+            timer.callback(timer)
+    run_scheduled()
+
+
+# --------- network --------- #
+class WLAN:
+    # number of isconnected() polls after connect() before the connection comes up
+    polls_to_connect = 0
+    connected = False
+
+    def __init__(self, interface):
+        self.interface = interface
+        self._polls = None
+
+    def active(self, is_active=None):
+        return True
+
+    def connect(self, ssid, password):
+        self._polls = WLAN.polls_to_connect
+
+    def isconnected(self):
+        if not WLAN.connected and self._polls is not None:
+            if self._polls <= 0:
+                WLAN.connected = True
+            self._polls -= 1
+        return WLAN.connected
+
+    def ifconfig(self):
+        return '10.0.0.2', '255.255.255.0', '10.0.0.1', '10.0.0.1'
+
+
+# --------- umqtt.simple --------- #
+class MQTTException(Exception):
+    pass
+
+
+class MQTTClient:
+    fail_connects = 0
+    instances = []
+
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0):
+        self.client_id = client_id
+        self.server = server
+        self.published = []
+        self.subscribed = []
+        self.incoming = []
+        self.callback = None
+        self.pings = 0
+        # set by drop(); every socket operation then fails like a broken connection
+        self.dropped = False
+        MQTTClient.instances.append(self)
+
+    def drop(self):
+        self.dropped = True
+
+    def _check_socket(self):
+        if self.dropped:
+            raise OSError("connection reset")
+
+    def connect(self, clean_session=True):
+        if MQTTClient.fail_connects > 0:
+            MQTTClient.fail_connects -= 1
+            raise OSError("connection refused")
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self._check_socket()
+        self.published.append((topic, msg, retain))
+
+    def subscribe(self, topic, qos=0):
+        self._check_socket()
+        self.subscribed.append(topic)
+
+    def unsubscribe(self, topic):
+        self._check_socket()
+        self.subscribed.remove(topic)
+
+    def set_callback(self, callback):
+        self.callback = callback
+
+    def check_msg(self):
+        self._check_socket()
+        if self.incoming:
+            topic, msg = self.incoming.pop(0)
+            self.callback(topic, msg)
+
+    def ping(self):
+        self._check_socket()
+        self.pings += 1
+
+
+# --------- urequests --------- #
+class Response:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.text = json.dumps(data) if data is not None else ''
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        pass
+
+
+class Requests:
+    def __init__(self):
+        self.routes = {}
+        self.calls = []
+
+    def get(self, url, headers=None):
+        self.calls.append(('GET', url, headers))
+        return self.respond(url)
+
+    def post(self, url, json=None):
+        self.calls.append(('POST', url, json))
+        return self.respond(url)
+
+    def respond(self, url):
+        # a route set to an exception raises it, the way urequests does when the host can't be reached
+        response = self.routes.get(url, Response(404))
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+# --------- dht --------- #
+class DHT22:
+    def __init__(self, pin):
+        self.pin = pin
+
+    def measure(self):
+        pass
+
+    def temperature(self):
+        return 21.5
+
+    def humidity(self):
+        return 40.0
+
+
+# milliseconds added to the monotonic clock, so tests can move utime forward without sleeping
+CLOCK = {"offset": 0}
+
+
+def advance(ms):
+    CLOCK["offset"] += ms
+
+
+def ticks_ms():
+    return int(time.monotonic() * 1000) + CLOCK["offset"]
+
+
+REQUESTS = Requests()
+
+
+def module(name, **attributes):
+    m = types.ModuleType(name)
+    for key, value in attributes.items():
+        setattr(m, key, value)
+    return m
+
+
+def install():
+    """
+    Registers the stub modules and puts the firmware source on ``sys.path``.
+    Returns the stub ``urequests`` so tests can set responses.
+    """
+    if 'urequests' in sys.modules:
+        # already installed by another test module; the firmware keeps the modules it imported first
+        return REQUESTS
+    utime = module('utime',
+                   ticks_ms=ticks_ms,
+                   ticks_diff=lambda a, b: a - b,
+                   ticks_add=lambda a, b: a + b,
+                   sleep=lambda seconds: None,
+                   sleep_ms=lambda ms: None)
+    sys.modules.update({
+        'machine': module('machine', Timer=Timer, Pin=Pin, PWM=PWM, reset=reset,
+                          unique_id=lambda: b'\xde\xad\xbe\xef'),
+        'network': module('network', WLAN=WLAN, STA_IF=0),
+        'utime': utime,
+        'micropython': module('micropython', schedule=schedule),
+        'ubinascii': module('ubinascii', hexlify=binascii.hexlify),
+        'urequests': module('urequests', get=REQUESTS.get, post=REQUESTS.post),
+        'dht': module('dht', DHT22=DHT22),
+        'uos': os,
+        'home.lib': module('home.lib', __path__=[]),
+        'home.lib.ftplib': module('home.lib.ftplib', FTP=object),
+        'home.lib.umqtt': module('home.lib.umqtt', __path__=[]),
+        'home.lib.umqtt.simple': module('home.lib.umqtt.simple', MQTTClient=MQTTClient, MQTTException=MQTTException),
+    })
+    sys.implementation._machine = "Raspberry Pi Pico W with RP2040"
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+    return REQUESTS
+
+
+@contextlib.contextmanager
+def platform(name='rp2'):
+    # the firmware reads sys.platform when Home, ConfigManager and Timer are constructed
+    actual = sys.platform
+    sys.platform = name
+    try:
+        yield
+    finally:
+        sys.platform = actual
+
+
+def reset_state():
+    Timer.created.clear()
+    SCHEDULED.clear()
+    home_timer = sys.modules.get('home.Timer')
+    if home_timer is not None:
+        # a fresh timer wheel, on a fresh hardware timer
+        home_timer.TimerWheel.instance = None
+    WLAN.connected = False
+    WLAN.polls_to_connect = 0
+    MQTTClient.fail_connects = 0
+    MQTTClient.instances.clear()
+
+
+# --------- home client --------- #
+class Publisher:
+    """
+    Stands in for the Home a sensor publishes through, recording (topic, message) pairs and log messages.
+    """
+
+    def __init__(self):
+        self.published = []
+        self.logs = []
+
+    def publish(self, topic, message, **kwargs):
+        self.published.append((topic, message))
+
+    def log(self, message):
+        self.logs.append(message)
+
+
+# --------- device fixture --------- #
+DEVICE_ID = 'deadbeef'
+HOST = 'http://zhome'
+BOOT_URL = f"{HOST}/api/home/devices/{DEVICE_ID}/boot"
+
+
+def boot_profile(sensors, **keys):
+    """
+    A boot profile for the stub device with the given [sensor_type, name, sensor_config] list.
+    Keys override the defaults, e.g. ``d=1`` when the add-on publishes discovery.
+    """
+    return {
+        "v": 1,
+        "n": "Test Device",
+        "i": {"name": "Test Device", "identifiers": DEVICE_ID},
+        "l": False,
+        "p": False,
+        "m": ["homeassistant.local", 1883, "mqtt-user", "mqtt-password"],
+        "s": sensors,
+        **keys,
+    }
+
+
+class HomeTestCase(unittest.TestCase):
+    """
+    Boots ``Home`` against the stubs: ConfigManager's files live in a temporary directory, the startup
+    settings point at HOST and REQUESTS serves ``boot_profile`` for the stub device.
+    """
+    boot_profile = None
+    # added to the startup settings
+    startup_settings = {}
+
+    def setUp(self):
+        from home.ConfigManager import ConfigManager
+        reset_state()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        ConfigManager.start_up_settings_path = os.path.join(self.directory.name, 'config.json')
+        ConfigManager.last_run_config_path = os.path.join(self.directory.name, 'last-run-config.json')
+        ConfigManager.last_run_etag_path = os.path.join(self.directory.name, 'last-run-config.etag')
+        with open(ConfigManager.start_up_settings_path, 'w') as f:
+            json.dump({"host": HOST, "wifi_ssid": "the_interwebs", "wifi_password": "pw", "cache_first": False,
+                       **self.startup_settings}, f)
+        REQUESTS.calls.clear()
+        self.serve_boot_profile(self.boot_profile)
+        rp2 = platform('rp2')
+        rp2.__enter__()
+        self.addCleanup(rp2.__exit__, None, None, None)
+        self.home_client = None
+        self.client = None
+
+    def serve_boot_profile(self, profile):
+        REQUESTS.routes = {BOOT_URL: Response(200, profile)} if profile is not None else {}
+
+    def start_home(self):
+        """
+        Runs the synchronous start sequence; the home is then ``self.home_client`` and its MQTT client ``self.client``.
+        """
+        from home import Home
+        self.home_client = Home()
+        self.home_client.start_sequence()
+        self.client = MQTTClient.instances[-1]
+        return self.home_client
+
+    def receive(self, topic, msg):
+        self.client.incoming.append((topic.encode(), msg.encode()))
+        self.home_client.check_msg()
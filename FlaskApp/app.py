@@ -3,17 +3,40 @@ from blueprints.logs import log_blueprint
 from blueprints.devices import device_blueprint
 from blueprints.sensors import sensor_blueprint
 from blueprints.configs import config_blueprint
+from blueprints.stream import stream_blueprint
 from flask_cors import CORS
 from paho.mqtt import client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 from threading import Thread
-from database import add_log
+from database import data_directory, log_entry_values
+from log_writer import LogWriter
+from log_retention import LogRetention
+from log_stream import broadcaster
+from mqtt import publisher
+from discovery import publish_all_discovery
+import atexit
 import json
 import os
 import requests
+import signal
+import sys
 
 app = Flask(__name__, static_folder='static')
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'X-Last-Id'])
+
+log_writer = LogWriter(spill_path=os.getenv('LOG_SPILL_PATH', os.path.join(data_directory(), 'log_spill.jsonl')),
+                       batch_size=int(os.getenv('LOG_BATCH_SIZE', 500)),
+                       flush_interval_ms=int(os.getenv('LOG_FLUSH_INTERVAL_MS', 250)),
+                       max_queue_size=int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+                       on_written=broadcaster.publish_logs)
+log_writer.start()
+atexit.register(log_writer.stop)
+
+log_retention = LogRetention(retention_days=int(os.getenv('LOG_RETENTION_DAYS', 14)),
+                             max_rows=int(os.getenv('LOG_RETENTION_MAX_ROWS', 200000)),
+                             interval_s=int(os.getenv('LOG_RETENTION_INTERVAL_S', 3600)))
+log_retention.start()
+atexit.register(log_retention.stop)
 
 
 def get_mqtt_details():
@@ -27,6 +50,13 @@ def get_mqtt_details():
                 return req.json()['data']
             except Exception as e:
                 print(e)
+    if os.getenv("MQTT_HOST"):
+        return {
+            "host": os.getenv("MQTT_HOST"),
+            "port": int(os.getenv("MQTT_PORT", 1883)),
+            "username": os.getenv("MQTT_USER"),
+            "password": os.getenv("MQTT_PASSWORD")
+        }
 
 
 def on_connect(client, userdata, flags, rc, props):
@@ -38,17 +68,23 @@ def on_message(client, userdata, msg):
     print(msg.topic + " " + str(msg.payload))
     # Logic to log message to database
     log_mes = json.loads(msg.payload)
-    log = {"log": log_mes, "topic": msg.topic}
-    add_log(log)
+    log_writer.put(log_entry_values(msg.topic, log_mes))
 
 
 def start_mqtt_loop():
     mqtt_details = get_mqtt_details()
+    if mqtt_details is None:
+        print("no mqtt broker details found")
+        return
     un = mqtt_details.get('username')
     pw = mqtt_details.get('password')
     host = mqtt_details.get('host')
     port = mqtt_details.get('port')
 
+    publisher.configure(host=host, port=port, username=un, password=pw)
+    atexit.register(publisher.stop)
+    publish_all_discovery()
+
     mqtt_client = mqtt.Client(CallbackAPIVersion(2))
     mqtt_client.on_connect = on_connect
     mqtt_client.on_message = on_message
@@ -59,9 +95,12 @@ def start_mqtt_loop():
     mqtt_client.loop_forever()
 
 
-thread = Thread(target=start_mqtt_loop)
+thread = Thread(target=start_mqtt_loop, daemon=True)
 thread.start()
 
+# The supervisor stops the add-on with SIGTERM; exit normally so atexit flushes queued logs
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
 
 # Serve React App
 @app.route('/dashboard', defaults={'path': ''})
@@ -77,6 +116,7 @@ app.register_blueprint(log_blueprint, url_prefix='/api/home/logs')
 app.register_blueprint(device_blueprint, url_prefix='/api/home/devices')
 app.register_blueprint(sensor_blueprint, url_prefix='/api/home/sensors')
 app.register_blueprint(config_blueprint, url_prefix='/api/home/configs')
+app.register_blueprint(stream_blueprint, url_prefix='/api/home/stream')
 
 if __name__ == "__main__":
     app.run("0.0.0.0")
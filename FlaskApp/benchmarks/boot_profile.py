@@ -0,0 +1,90 @@
+"""
+Compares the size and parse cost of the full device document (``/api/home/devices/<id>``) with
+the firmware boot profile (``/api/home/devices/<id>/boot``).
+
+Parse time and peak allocation are measured with CPython's ``json`` module, so they are only a
+relative guide to what ``response.json()`` costs on the microcontroller. The sensors in the full
+document carry the same generated topics as the profile, so only the encoding differs.
+
+    python benchmarks/boot_profile.py --sensors 4 --repeat 20000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+BENCH_DIR = tempfile.mkdtemp(prefix='zhome-bench-')
+os.environ.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(BENCH_DIR, 'boot_profile.db')}")
+
+import database
+from blueprints.devices import device_boot_profile
+from discovery import state_topics
+import tests.test_data as td
+
+SENSORS = (td.test_weather_sensor, td.test_led, td.test_motion)
+
+
+def build_device(sensor_count):
+    wifi_id = database.add_wifi_network({"ssid": "the_interwebs", "password": "pw", "is_default": True})['id']
+    ftp_id = database.add_ftp_server({"host_address": "homeassistant.local", "username": "microcontrollers",
+                                      "password": "microcontrollers"})['id']
+    mqtt_id = database.add_mqtt_broker({"host_address": "homeassistant.local", "username": "mqtt-user",
+                                        "password": "mqtt-password"})['id']
+    device_id = td.device_data1['id']
+    database.add_device(td.device_data1)
+    config = database.add_device_config(device_id, wifi_network_id=wifi_id, ftp_server_id=ftp_id,
+                                        mqtt_broker_id=mqtt_id)
+    database.update_device_settings(device_id, {"led_on_after_connect": True, "use_ping": False})
+    for i in range(sensor_count):
+        sensor = SENSORS[i % len(SENSORS)]
+        database.add_sensor({**sensor, "name": f"{sensor['name']} {i + 1}", "device_config_id": config['id']})
+    return database.get_device(device_id)
+
+
+def with_topics(device):
+    config = device['config']
+    sensors = [{**sensor, "sensor_config": {**(sensor['sensor_config'] or {}),
+                                            "topics": state_topics(device['id'], sensor)}}
+               for sensor in config['sensors']]
+    return {**device, "config": {**config, "sensors": sensors}}
+
+
+def measure(payload, repeat):
+    seconds = timeit.timeit(lambda: json.loads(payload), number=repeat)
+    tracemalloc.start()
+    json.loads(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(payload.encode()), seconds / repeat * 1e6, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sensors', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args()
+
+    device = build_device(args.sensors)
+    payloads = {
+        "device document": json.dumps(with_topics(device), separators=(',', ':')),
+        "boot profile": json.dumps(device_boot_profile(device), separators=(',', ':')),
+    }
+
+    print(f"{'payload':<16}{'bytes':>8}{'parse us':>10}{'peak alloc':>12}")
+    results = {}
+    for name, payload in payloads.items():
+        results[name] = measure(payload, args.repeat)
+        size, parse_us, peak = results[name]
+        print(f"{name:<16}{size:>8}{parse_us:>10.1f}{peak:>12}")
+
+    full, profile = results["device document"], results["boot profile"]
+    print(f"\nboot profile is {profile[0] / full[0]:.0%} of the size, parses in {profile[1] / full[1]:.0%} "
+          f"of the time with {profile[2] / full[2]:.0%} of the peak allocation")
+
+
+if __name__ == '__main__':
+    main()
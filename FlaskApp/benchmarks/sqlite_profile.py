@@ -0,0 +1,102 @@
+"""
+Compares concurrent read/write throughput of the ``default`` and ``tuned`` SQLite engine profiles.
+
+Writer threads insert log entries one committed row at a time (like the REST endpoints) while
+reader threads fetch pages of recent logs (like the dashboard). Each profile runs against a
+fresh database file.
+
+    python benchmarks/sqlite_profile.py --writers 4 --readers 8 --seconds 10
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+from threading import Thread, Event
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+BENCH_DIR = tempfile.mkdtemp(prefix='zhome-bench-')
+os.environ.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(BENCH_DIR, 'import.db')}")
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from database.engine import create_engines
+from database.models import ModelBase, LogEntry
+
+
+def run_profile(profile, writers, readers, seconds, seed_rows):
+    uri = f"sqlite:///{os.path.join(BENCH_DIR, f'{profile}.db')}"
+    write_engine, read_engine = create_engines(uri, profile=profile, read_pool_size=readers)
+    ModelBase.metadata.create_all(bind=write_engine)
+    Session = sessionmaker(bind=write_engine)
+    ReadSession = sessionmaker(bind=read_engine)
+
+    now = datetime.datetime.now()
+    with Session() as session:
+        session.execute(insert(LogEntry), [
+            {"topic": f"z-home/log/device-{i % 60}", "log": {"message": "seed", "type": "info"},
+             "device_id": f"device-{i % 60}", "log_type": "info", "time": now}
+            for i in range(seed_rows)
+        ])
+        session.commit()
+
+    stop = Event()
+    counts = {"writes": 0, "reads": 0, "locked": 0}
+
+    def write_loop(n):
+        while not stop.is_set():
+            try:
+                with Session() as session:
+                    session.add(LogEntry(topic=f"z-home/log/device-{n}", log={"message": "bench", "type": "info"},
+                                         device_id=f"device-{n}", log_type="info"))
+                    session.commit()
+                counts["writes"] += 1
+            except OperationalError:
+                counts["locked"] += 1
+
+    def read_loop(n):
+        while not stop.is_set():
+            try:
+                with ReadSession() as session:
+                    (session.query(LogEntry)
+                     .filter(LogEntry.device_id == f"device-{n % 60}")
+                     .order_by(LogEntry.time.desc(), LogEntry.id.desc())
+                     .limit(100)
+                     .all())
+                counts["reads"] += 1
+            except OperationalError:
+                counts["locked"] += 1
+
+    threads = [Thread(target=write_loop, args=(i,)) for i in range(writers)]
+    threads += [Thread(target=read_loop, args=(i,)) for i in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    write_engine.dispose()
+    read_engine.dispose()
+    return {key: value / seconds if key != "locked" else value for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed-rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds}s per profile, {args.seed_rows} seed rows")
+    print(f"{'profile':<10}{'writes/s':>12}{'reads/s':>12}{'lock errors':>14}")
+    for profile in ('default', 'tuned'):
+        result = run_profile(profile, args.writers, args.readers, args.seconds, args.seed_rows)
+        print(f"{profile:<10}{result['writes']:>12.1f}{result['reads']:>12.1f}{result['locked']:>14}")
+
+
+if __name__ == '__main__':
+    main()
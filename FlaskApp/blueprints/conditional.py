@@ -0,0 +1,9 @@
+from flask import request, jsonify
+
+
+def conditional_jsonify(*args, **kwargs):
+    response = jsonify(*args, **kwargs)
+    # strong ETag over the rendered body; clients revalidate with If-None-Match and get a 304 when unchanged
+    response.add_etag()
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
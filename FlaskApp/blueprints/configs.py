@@ -3,15 +3,25 @@ from database import (add_wifi_network, update_wifi_network, delete_wifi_network
                       get_all_wifi_networks, get_wifi_network, add_ftp_server,
                       update_ftp_server, delete_ftp_server, get_ftp_server,
                       get_all_ftp_servers, add_mqtt_broker, update_mqtt_broker,
-                      delete_mqtt_broker, get_mqtt_broker, get_all_mqtt_brokers)
+                      delete_mqtt_broker, get_mqtt_broker, get_all_mqtt_brokers, get_devices)
+from blueprints.conditional import conditional_jsonify
+from mqtt import request_config_reload
 
 config_blueprint = Blueprint('config_blueprint', __name__)
 
 
+def reload_devices_using(connection, connection_id):
+    # devices using a changed FTP server or MQTT broker pick it up without a restart of the add-on
+    for device in get_devices():
+        config = device.get('config') or {}
+        if (config.get(connection) or {}).get('id') == connection_id:
+            request_config_reload(device['id'])
+
+
 @config_blueprint.route('/wifi-networks', methods=['GET'])
 def get_wifi_networks():
     data = get_all_wifi_networks()
-    return jsonify(data)
+    return conditional_jsonify(data)
 
 
 @config_blueprint.route('/wifi-networks', methods=['POST'])
@@ -22,7 +32,7 @@ def add_new_wifi_network():
 
 
 @config_blueprint.route('/wifi-networks/<int:wifi_network_id>', methods=['PUT'])
-def update_wifi_network(wifi_network_id):
+def update_existing_wifi_network(wifi_network_id):
     new_wifi_network = request.json
     update_wifi_network(wifi_network_id, new_wifi_network)
     return jsonify(success=True)
@@ -37,7 +47,7 @@ def remove_wifi_network(wifi_network_id):
 @config_blueprint.route('/ftp-servers', methods=['GET'])
 def get_ftp_servers():
     data = get_all_ftp_servers()
-    return jsonify(data)
+    return conditional_jsonify(data)
 
 
 @config_blueprint.route('/ftp-servers', methods=['POST'])
@@ -48,9 +58,10 @@ def add_new_ftp_server():
 
 
 @config_blueprint.route('/ftp-servers/<int:ftp_server_id>', methods=['PUT'])
-def update_ftp_server(ftp_server_id):
+def update_existing_ftp_server(ftp_server_id):
     new_ftp_server = request.json
     update_ftp_server(ftp_server_id, new_ftp_server)
+    reload_devices_using('ftp_server', ftp_server_id)
     return jsonify(success=True)
 
 
@@ -63,7 +74,7 @@ def remove_ftp_server(ftp_server_id):
 @config_blueprint.route('/mqtt-brokers', methods=['GET'])
 def get_mqtt_brokers():
     data = get_all_mqtt_brokers()
-    return jsonify(data)
+    return conditional_jsonify(data)
 
 
 @config_blueprint.route('/mqtt-brokers', methods=['POST'])
@@ -74,9 +85,10 @@ def add_new_mqtt_broker():
 
 
 @config_blueprint.route('/mqtt-brokers/<int:mqtt_broker_id>', methods=['PUT'])
-def update_mqtt_broker(mqtt_broker_id):
+def update_existing_mqtt_broker(mqtt_broker_id):
     new_mqtt_broker = request.json
     update_mqtt_broker(mqtt_broker_id, new_mqtt_broker)
+    reload_devices_using('mqtt_broker', mqtt_broker_id)
     return jsonify(success=True)
 
 
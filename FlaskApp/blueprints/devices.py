@@ -2,11 +2,15 @@ from flask import Blueprint, request, jsonify
 from database import (get_devices, add_device, update_display_name, delete_device, get_device_config, get_device,
                       update_device_config, delete_device_config, add_device_config, get_device_sensors,
                       get_wifi_network, get_mqtt_broker, get_ftp_server, update_device_settings)
-# from flask_sse import sse
-from mqtt import send_mqtt_message
+from blueprints.conditional import conditional_jsonify
+from mqtt import send_mqtt_message, publisher, request_config_reload
+from discovery import DISCOVERY_MODE, state_topics, publish_device_discovery
+from log_stream import broadcaster
 import json
 
 device_blueprint = Blueprint('device_blueprint', __name__)
+# device settings that change what the device publishes state on
+PUBLISH_SETTINGS = ('coalesce_ms', 'json_state')
 
 
 def create_default_config():
@@ -23,10 +27,38 @@ def create_default_config():
     return default_config
 
 
+def device_boot_profile(device):
+    # only what the firmware reads at boot, with short keys; see reference.md
+    config = device.get('config') or {}
+    settings = config.get('device_settings') or {}
+    mqtt_broker = config.get('mqtt_broker')
+    ftp_server = config.get('ftp_server')
+    profile = {
+        "v": 1,
+        "n": device.get('display_name'),
+        "i": device.get('device_info'),
+        "l": settings.get('led_on_after_connect'),
+        "p": settings.get('use_ping'),
+        "c": settings.get('coalesce_ms') or None,
+        "j": 1 if settings.get('json_state') else None,
+        "m": [mqtt_broker['host_address'], mqtt_broker['port'], mqtt_broker['username'], mqtt_broker['password']]
+        if mqtt_broker else None,
+        "f": [ftp_server['host_address'], ftp_server['username'], ftp_server['password']] if ftp_server else None,
+        "s": [[sensor['sensor_type'], sensor['name'],
+               {**(sensor['sensor_config'] or {}), "topics": state_topics(device['id'], sensor)}]
+              for sensor in config['sensors']]
+        if config.get('sensors') is not None else None,
+        # the add-on publishes Home Assistant discovery for the device
+        "d": 1 if publisher.is_configured else None,
+        "dd": 1 if DISCOVERY_MODE == 'device' else None,
+    }
+    return {key: value for key, value in profile.items() if value is not None}
+
+
 @device_blueprint.route('/')
 def get_all_devices():
     data = get_devices()
-    return jsonify(data)
+    return conditional_jsonify(data)
 
 
 @device_blueprint.route('/add', methods=['POST'])
@@ -35,7 +67,7 @@ def add_new_device():
     new_device = add_device(device_data)
     add_device_config(new_device['id'], **create_default_config())
     device = get_device(new_device['id'])
-    # sse.publish({"message": "New device added", "type": "device", "device": device})
+    broadcaster.publish({"message": "New device added", "type": "device", "device": device})
     return jsonify(success=True, device=device)
 
 
@@ -43,7 +75,14 @@ def add_new_device():
 def get_single_device(device_id):
     data = get_device(device_id)
     # data = data.to_dict() if data is not None else {}
-    return jsonify(data)
+    return conditional_jsonify(data)
+
+
+@device_blueprint.route('/<string:device_id>/boot')
+def get_device_boot_profile(device_id):
+    device = get_device(device_id)
+    data = device_boot_profile(device) if device is not None else None
+    return conditional_jsonify(data)
 
 
 @device_blueprint.route('/<string:device_id>/display_name', methods=['POST'])
@@ -52,6 +91,10 @@ def update_device_display_name(device_id):
     name = new_name.get('display_name')
     if name is not None:
         data = update_display_name(device_id, name)
+        device = get_device(device_id)
+        if device is not None:
+            publish_device_discovery(device)
+            request_config_reload(device_id)
         return jsonify(success=True, device=data)
     return jsonify(success=False, device=None)
 
@@ -80,13 +123,14 @@ def send_message(device_id):
 @device_blueprint.route('/<string:device_id>/config')
 def get_config(device_id):
     config = get_device_config(device_id)
-    return jsonify(config)
+    return conditional_jsonify(config)
 
 
 @device_blueprint.route('/<string:device_id>/config', methods=['POST'])
 def add_config(device_id):
     new_config = request.json
     config = add_device_config(device_id, new_config)
+    request_config_reload(device_id)
     return jsonify(success=True, config=config)
 
 
@@ -94,13 +138,22 @@ def add_config(device_id):
 def update_config(device_id):
     new_config = request.json
     update_device_config(device_id, new_config)
+    request_config_reload(device_id)
     return jsonify(success=True, config=new_config)
 
 
 @device_blueprint.route('/<string:device_id>/settings', methods=['PUT'])
 def update_settings(device_id):
     new_settings = request.json
+    previous = get_device_config(device_id).get('device_settings') or {}
     new_config = update_device_settings(device_id, new_settings)
+    if any((previous.get(key) or None) != ((new_settings or {}).get(key) or None) for key in PUBLISH_SETTINGS):
+        # the entities' state topics change with the publish settings; when the add-on owns discovery the
+        # device won't republish it, so Home Assistant is pointed at the new topics from here
+        device = get_device(device_id)
+        if device is not None:
+            publish_device_discovery(device)
+    request_config_reload(device_id)
     return jsonify(success=True, config=new_config)
 
 
@@ -113,4 +166,4 @@ def delete_config(device_id):
 @device_blueprint.route('/<string:device_id>/sensors')
 def get_sensors(device_id):
     sensors = get_device_sensors(device_id)
-    return jsonify(sensors)
+    return conditional_jsonify(sensors)
@@ -1,23 +1,56 @@
 from flask import Blueprint, request, jsonify
-from database import add_log, get_logs, delete_log
+from database import add_log, get_logs, get_logs_since, delete_log, get_log_rollups
 from mqtt import send_mqtt_message
+from log_stream import broadcaster
+from datetime import datetime
 import json
 
 log_blueprint = Blueprint('log_blueprint', __name__)
 
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+
+
+def log_filters():
+    return {
+        "device_id": request.args.get('device_id'),
+        "topic": request.args.get('topic'),
+        "log_type": request.args.get('type'),
+        "start": request.args.get('start', type=datetime.fromisoformat),
+        "end": request.args.get('end', type=datetime.fromisoformat),
+    }
+
 
 @log_blueprint.route('/')
 def home():
-    data = get_logs()
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    since_id = request.args.get('since_id', type=int)
+    if since_id is not None:
+        data = get_logs_since(since_id, limit=limit, **log_filters())
+    else:
+        data = get_logs(before_id=request.args.get('before_id', type=int), limit=limit, **log_filters())
+
+    response = jsonify(data)
+    if data:
+        if since_id is None and len(data) == limit:
+            response.headers['X-Next-Cursor'] = str(data[0]['id'])
+        response.headers['X-Last-Id'] = str(data[-1]['id'])
+    elif since_id is not None:
+        response.headers['X-Last-Id'] = str(since_id)
+    return response
+
+
+@log_blueprint.route('/rollups')
+def log_rollups():
+    data = get_log_rollups(device_id=request.args.get('device_id'))
     return jsonify(data)
 
 
 @log_blueprint.route('/add', methods=['POST'])
 def add_log_entry():
     log_data = request.json
-    add_log(log_data)
-    # new_log = add_log(log_data)
-    # sse.publish({"message": "New log added", "type": "log", "log": new_log})
+    new_log = add_log(log_data)
+    broadcaster.publish_logs([new_log])
     return jsonify(success=True)
 
 
@@ -1,30 +1,49 @@
 from flask import Blueprint, request, jsonify
 from database import add_sensor, update_sensor_config, delete_sensor, get_sensor
+from discovery import refresh_sensor_discovery, remove_sensor_discovery, find_sensor_device
+from mqtt import request_config_reload
+from blueprints.conditional import conditional_jsonify
 
 sensor_blueprint = Blueprint('sensor_blueprint', __name__)
 
 
+def reload_sensor_device(sensor):
+    device = find_sensor_device(sensor)
+    if device is not None:
+        request_config_reload(device['id'])
+
+
 @sensor_blueprint.route('/<string:sensor_id>')
 def get_sensor_by_id(sensor_id):
     sensor = get_sensor(sensor_id)
-    return jsonify(success=True, sensor=sensor)
+    return conditional_jsonify(success=True, sensor=sensor)
 
 
 @sensor_blueprint.route('/add', methods=['POST'])
 def add_new_sensor():
     sensor_data = request.json
     new_sensor = add_sensor(sensor_data)
+    refresh_sensor_discovery(new_sensor)
+    reload_sensor_device(new_sensor)
     return jsonify(success=True, sensor=new_sensor)
 
 
 @sensor_blueprint.route('/<string:sensor_id>/config', methods=['PUT'])
 def update_sensor(sensor_id):
     new_config = request.json
+    previous = get_sensor(sensor_id)
     update_sensor_config(sensor_id, new_config)
+    if previous:
+        refresh_sensor_discovery({**previous, "sensor_config": new_config}, previous=previous)
+        reload_sensor_device(previous)
     return jsonify(success=True)
 
 
 @sensor_blueprint.route('/<string:sensor_id>', methods=['DELETE'])
 def remove_sensor(sensor_id):
+    sensor = get_sensor(sensor_id)
     delete_sensor(sensor_id)
+    if sensor:
+        remove_sensor_discovery(sensor)
+        reload_sensor_device(sensor)
     return jsonify(success=True)
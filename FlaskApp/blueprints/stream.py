@@ -0,0 +1,16 @@
+from flask import Blueprint, Response, request
+from log_stream import broadcaster
+
+stream_blueprint = Blueprint('stream_blueprint', __name__)
+
+
+@stream_blueprint.route('')
+def event_stream():
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    try:
+        last_event_id = int(last_event_id) if last_event_id is not None else None
+    except ValueError:
+        last_event_id = None
+    return Response(broadcaster.stream(last_event_id),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
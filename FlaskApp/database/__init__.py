@@ -1,56 +1,340 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import inspect, text, insert, update, delete, or_, tuple_, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker, selectinload, joinedload
 from sqlalchemy.exc import NoResultFound
 from .models import (
-    ModelBase, LogEntry, HomeDevice,
+    ModelBase, LogEntry, LogRollup, HomeDevice, CacheVersion, Marker,
     DeviceSensor, DeviceConfig,
     WifiNetwork, FTPServer, MQTTBroker
 )
+from .engine import create_engines
+from .cache import DocumentCache, MISSING
 import os
 
-engine = create_engine(os.getenv('DATABASE_URI'))
+engine, read_engine = create_engines(os.getenv('DATABASE_URI'),
+                                     profile=os.getenv('DATABASE_PROFILE', 'tuned'),
+                                     read_pool_size=int(os.getenv('DATABASE_READ_POOL_SIZE', 8)))
 ModelBase.metadata.create_all(bind=engine)
 Session = sessionmaker(bind=engine)
+ReadSession = sessionmaker(bind=read_engine)
+
+
+def upgrade_schema():
+    # create_all() only creates missing tables, so bring older log tables up to date
+    log_columns = {column['name'] for column in inspect(engine).get_columns(LogEntry.__tablename__)}
+    if 'log_type' not in log_columns:
+        with engine.begin() as connection:
+            connection.execute(text(f'ALTER TABLE {LogEntry.__tablename__} ADD COLUMN log_type VARCHAR'))
+    for index in LogEntry.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+upgrade_schema()
+
+
+def data_directory():
+    if engine.url.database and engine.url.database != ':memory:':
+        return os.path.dirname(os.path.abspath(engine.url.database))
+    return os.getcwd()
 
 
 # --------- Logs --------- #
-def get_logs():
-    with Session() as session:
-        entries = session.query(LogEntry).all()
+def _filter_logs(query, device_id=None, topic=None, log_type=None, start=None, end=None):
+    if device_id is not None:
+        query = query.filter(LogEntry.device_id == device_id)
+    if topic is not None:
+        query = query.filter(LogEntry.topic == topic)
+    if log_type is not None:
+        query = query.filter(LogEntry.log_type == log_type)
+    if start is not None:
+        query = query.filter(LogEntry.time >= start)
+    if end is not None:
+        query = query.filter(LogEntry.time < end)
+    return query
+
+
+def get_logs(before_id=None, limit=None, **filters):
+    with ReadSession() as session:
+        query = _filter_logs(session.query(LogEntry), **filters)
+        if before_id is not None:
+            before_time = session.query(LogEntry.time).filter(LogEntry.id == before_id).scalar()
+            if before_time is not None:
+                query = query.filter(tuple_(LogEntry.time, LogEntry.id) < (before_time, before_id))
+            else:
+                query = query.filter(LogEntry.id < before_id)
+        query = query.order_by(LogEntry.time.desc(), LogEntry.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        entries = query.all()
+        data = [entry.to_dict() for entry in reversed(entries)]
+    return data
+
+
+def get_logs_since(since_id, limit=None, **filters):
+    with ReadSession() as session:
+        query = _filter_logs(session.query(LogEntry), **filters)
+        query = query.filter(LogEntry.id > since_id).order_by(LogEntry.id)
+        if limit is not None:
+            query = query.limit(limit)
+        entries = query.all()
         data = [entry.to_dict() for entry in entries]
     return data
 
 
+def log_device_id(topic, log):
+    if isinstance(log, dict) and log.get('unit_id'):
+        return log['unit_id']
+    if topic and topic.startswith('z-home/log/'):
+        return topic[len('z-home/log/'):]
+    return None
+
+
+def log_entry_values(topic, log):
+    return {
+        "topic": topic,
+        "log": log,
+        "device_id": log_device_id(topic, log),
+        "log_type": log.get('type') if isinstance(log, dict) else None
+    }
+
+
 def add_log(log_entry):
     with Session() as session:
-        new_log = LogEntry(**log_entry)
+        new_log = LogEntry(**{**log_entry_values(log_entry.get('topic'), log_entry.get('log')), **log_entry})
         session.add(new_log)
         session.commit()
         data = new_log.to_dict()
     return data
 
 
+def add_logs(log_entries, returning=False):
+    if not log_entries:
+        return [] if returning else None
+    with Session() as session:
+        if returning:
+            new_logs = session.scalars(insert(LogEntry).returning(LogEntry), log_entries).all()
+            data = [log.to_dict() for log in new_logs]
+        else:
+            session.execute(insert(LogEntry), log_entries)
+            data = None
+        session.commit()
+    return data
+
+
 def delete_log(log_id):
     with Session() as session:
         session.query(LogEntry).filter(LogEntry.id == log_id).delete()
         session.commit()
 
 
+# --------- Log Retention --------- #
+def get_log_retention_cutoff_id(max_rows):
+    with ReadSession() as session:
+        return (session.query(LogEntry.id)
+                .order_by(LogEntry.id.desc())
+                .offset(max_rows)
+                .limit(1)
+                .scalar())
+
+
+def rollup_logs(before_time=None, through_id=None, batch_size=500):
+    conditions = []
+    if before_time is not None:
+        conditions.append(LogEntry.time < before_time)
+    if through_id is not None:
+        conditions.append(LogEntry.id <= through_id)
+    if not conditions:
+        return 0
+
+    with Session() as session:
+        rows = (session.query(LogEntry.id, LogEntry.topic, LogEntry.log, LogEntry.time,
+                              LogEntry.device_id, LogEntry.log_type)
+                .filter(or_(*conditions))
+                .order_by(LogEntry.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            return 0
+
+        counts = {}
+        for row in rows:
+            values = log_entry_values(row.topic, row.log)
+            device_id = row.device_id or values['device_id'] or ''
+            log_type = row.log_type or values['log_type'] or ''
+            hour = row.time.replace(minute=0, second=0, microsecond=0)
+            key = (device_id, log_type, hour)
+            counts[key] = counts.get(key, 0) + 1
+
+        upsert = sqlite_insert(LogRollup).values([
+            {"device_id": device_id, "log_type": log_type, "hour": hour, "count": count}
+            for (device_id, log_type, hour), count in counts.items()
+        ])
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[LogRollup.device_id, LogRollup.log_type, LogRollup.hour],
+            set_={"count": LogRollup.count + upsert.excluded.count}
+        )
+        session.execute(upsert)
+        session.execute(delete(LogEntry).where(LogEntry.id.in_([row.id for row in rows])))
+        session.commit()
+    return len(rows)
+
+
+# --------- Markers --------- #
+def _set_marker(session, name, value):
+    mark = sqlite_insert(Marker).values(name=name, value=value)
+    session.execute(mark.on_conflict_do_update(index_elements=[Marker.name], set_={"value": value}))
+
+
+def _get_marker(name):
+    with ReadSession() as session:
+        return session.query(Marker.value).filter(Marker.name == name).scalar()
+
+
+# the backfill's high-water mark: rows up to this id have been classified once, including the ones that
+# stay NULL because nothing can be derived from them
+LOG_BACKFILL_MARK = 'log_backfill'
+
+
+def _set_log_backfill_id(session, last_id):
+    _set_marker(session, LOG_BACKFILL_MARK, last_id)
+
+
+def get_log_backfill_id():
+    return _get_marker(LOG_BACKFILL_MARK) or 0
+
+
+def backfill_logs(after_id=0, batch_size=500):
+    with Session() as session:
+        rows = (session.query(LogEntry.id, LogEntry.topic, LogEntry.log, LogEntry.device_id, LogEntry.log_type)
+                .filter(LogEntry.id > after_id)
+                .filter(or_(LogEntry.device_id.is_(None), LogEntry.log_type.is_(None)))
+                .order_by(LogEntry.id)
+                .limit(batch_size)
+                .all())
+        if not rows:
+            # nothing left to classify; later starts begin after the newest row
+            last_id = session.query(func.max(LogEntry.id)).scalar()
+            if last_id is not None and last_id > after_id:
+                _set_log_backfill_id(session, last_id)
+                session.commit()
+            return None
+        updates = []
+        for row in rows:
+            values = log_entry_values(row.topic, row.log)
+            device_id = row.device_id or values['device_id']
+            log_type = row.log_type or values['log_type']
+            if device_id != row.device_id or log_type != row.log_type:
+                updates.append({"id": row.id, "device_id": device_id, "log_type": log_type})
+        if updates:
+            session.execute(update(LogEntry), updates)
+        _set_log_backfill_id(session, rows[-1].id)
+        session.commit()
+    return rows[-1].id
+
+
+def get_log_rollups(device_id=None, start=None, end=None):
+    with ReadSession() as session:
+        query = session.query(LogRollup)
+        if device_id is not None:
+            query = query.filter(LogRollup.device_id == device_id)
+        if start is not None:
+            query = query.filter(LogRollup.hour >= start)
+        if end is not None:
+            query = query.filter(LogRollup.hour < end)
+        rollups = query.order_by(LogRollup.hour).all()
+        data = [rollup.to_dict() for rollup in rollups]
+    return data
+
+
+# devices whose per-entity discovery has been handed over to a device-based discovery document, so the
+# hand-over's retained messages go out once per device instead of on every publish
+def _discovery_migration_mark(device_id):
+    return f'discovery_migrated/{device_id}'
+
+
+def is_discovery_migrated(device_id):
+    return _get_marker(_discovery_migration_mark(device_id)) == 1
+
+
+def set_discovery_migrated(device_id, migrated=True):
+    with Session() as session:
+        if migrated:
+            _set_marker(session, _discovery_migration_mark(device_id), 1)
+        else:
+            session.query(Marker).filter(Marker.name == _discovery_migration_mark(device_id)).delete()
+        session.commit()
+
+
+# --------- Device Document Cache --------- #
+ALL_DEVICES = '*'
+device_cache = DocumentCache()
+
+
+def _devices_version(session):
+    return session.query(CacheVersion.version).filter(CacheVersion.name == 'devices').scalar() or 0
+
+
+def _bump_devices_version(session):
+    # runs inside the mutating transaction so other processes see the data and the new version together
+    bump = sqlite_insert(CacheVersion).values(name='devices', version=1)
+    bump = bump.on_conflict_do_update(index_elements=[CacheVersion.name],
+                                      set_={"version": CacheVersion.version + 1})
+    return session.execute(bump.returning(CacheVersion.version)).scalar()
+
+
+def _invalidate_devices(device_ids, version):
+    device_cache.invalidate([ALL_DEVICES, *device_ids], version)
+
+
+def _config_device_ids(session, *conditions):
+    return [row.device_id for row in session.query(DeviceConfig.device_id).filter(*conditions).all()]
+
+
+def _sensor_device_ids(session, sensor_id):
+    return [row.device_id for row in (session.query(DeviceConfig.device_id)
+                                      .join(DeviceSensor, DeviceSensor.device_config_id == DeviceConfig.id)
+                                      .filter(DeviceSensor.id == sensor_id)
+                                      .all())]
+
+
 # --------- Devices --------- #
+def _config_loader_options():
+    # load everything DeviceConfig.to_dict() touches up front instead of lazily per config
+    return (joinedload(DeviceConfig.wifi_network),
+            joinedload(DeviceConfig.ftp_server),
+            joinedload(DeviceConfig.mqtt_broker),
+            selectinload(DeviceConfig.sensors))
+
+
+def _device_loader_options():
+    return (selectinload(HomeDevice.config).options(*_config_loader_options()),)
+
+
 def get_devices():
-    with Session() as session:
-        devices = session.query(HomeDevice).all()
-        data = [device.to_dict() for device in devices]
+    with ReadSession() as session:
+        version = _devices_version(session)
+        data = device_cache.get(ALL_DEVICES, version)
+        if data is MISSING:
+            devices = session.query(HomeDevice).options(*_device_loader_options()).all()
+            data = [device.to_dict() for device in devices]
+            device_cache.set(ALL_DEVICES, data, version)
     return data
 
 
 def get_device(device_id):
-    with Session() as session:
-        try:
-            device = session.query(HomeDevice).filter(HomeDevice.id == device_id).one()
-            data = device.to_dict()
-        except NoResultFound:
-            data = None
+    with ReadSession() as session:
+        version = _devices_version(session)
+        data = device_cache.get(device_id, version)
+        if data is MISSING:
+            try:
+                device = (session.query(HomeDevice)
+                          .options(*_device_loader_options())
+                          .filter(HomeDevice.id == device_id)
+                          .one())
+                data = device.to_dict()
+                device_cache.set(device_id, data, version)
+            except NoResultFound:
+                data = None
     return data
 
 
@@ -62,7 +346,9 @@ def update_display_name(device_id, new_name):
             device_info = {**device.device_info, 'name': new_name}
             device.device_info = device_info
             print(device.device_info)
+            version = _bump_devices_version(session)
             session.commit()
+            _invalidate_devices([device_id], version)
             data = device.to_dict()
         except NoResultFound:
             data = None
@@ -73,7 +359,10 @@ def add_device(device):
     with Session() as session:
         new_device = HomeDevice(**device)
         session.add(new_device)
+        session.flush()
+        version = _bump_devices_version(session)
         session.commit()
+        _invalidate_devices([new_device.id], version)
         data = new_device.to_dict()
     return data
 
@@ -81,18 +370,18 @@ def add_device(device):
 def delete_device(device_id):
     with Session() as session:
         session.query(HomeDevice).filter(HomeDevice.id == device_id).delete()
+        session.query(Marker).filter(Marker.name == _discovery_migration_mark(device_id)).delete()
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices([device_id], version)
 
 
 # --------- Device Configs --------- #
 def get_device_config(device_id):
-    with Session() as session:
-        try:
-            config = session.query(DeviceConfig).filter(DeviceConfig.device_id == device_id).one()
-            data = config.to_dict()
-        except NoResultFound:
-            data = {}
-    return data
+    device = get_device(device_id)
+    if device is None or device['config'] is None:
+        return {}
+    return device['config']
 
 
 def update_device_settings(device_id, settings):
@@ -100,7 +389,9 @@ def update_device_settings(device_id, settings):
         try:
             config = session.query(DeviceConfig).filter(DeviceConfig.device_id == device_id).one()
             config.device_settings = settings
+            version = _bump_devices_version(session)
             session.commit()
+            _invalidate_devices([device_id], version)
             data = config.to_dict()
         except NoResultFound:
             data = {}
@@ -110,13 +401,17 @@ def update_device_settings(device_id, settings):
 def delete_device_config(device_id):
     with Session() as session:
         session.query(DeviceConfig).filter(DeviceConfig.device_id == device_id).delete()
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices([device_id], version)
 
 
 def update_device_config(device_id, new_config):
     with Session() as session:
         session.query(DeviceConfig).filter(DeviceConfig.device_id == device_id).update({"config": new_config})
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices([device_id], version)
 
 
 def add_device_config(device_id, wifi_network_id=None, ftp_server_id=None, mqtt_broker_id=None):
@@ -126,14 +421,17 @@ def add_device_config(device_id, wifi_network_id=None, ftp_server_id=None, mqtt_
                                      ftp_server_id=ftp_server_id,
                                      mqtt_broker_id=mqtt_broker_id)
         session.add(device_config)
+        session.flush()
+        version = _bump_devices_version(session)
         session.commit()
+        _invalidate_devices([device_id], version)
         data = device_config.to_dict()
     return data
 
 
 # --------- Sensors --------- #
 def get_device_sensors(device_config_id):
-    with Session() as session:
+    with ReadSession() as session:
         sensors = session.query(DeviceSensor).filter(DeviceSensor.device_config_id == device_config_id).all()
         data = [sensor.to_dict() for sensor in sensors]
     return data
@@ -143,7 +441,11 @@ def add_sensor(sensor):
     with Session() as session:
         new_sensor = DeviceSensor(**sensor)
         session.add(new_sensor)
+        session.flush()
+        device_ids = _sensor_device_ids(session, new_sensor.id)
+        version = _bump_devices_version(session)
         session.commit()
+        _invalidate_devices(device_ids, version)
         data = new_sensor.to_dict()
     return data
 
@@ -151,17 +453,23 @@ def add_sensor(sensor):
 def update_sensor_config(sensor_id, new_config):
     with Session() as session:
         session.query(DeviceSensor).filter(DeviceSensor.id == sensor_id).update({"sensor_config": new_config})
+        device_ids = _sensor_device_ids(session, sensor_id)
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices(device_ids, version)
 
 
 def delete_sensor(sensor_id):
     with Session() as session:
+        device_ids = _sensor_device_ids(session, sensor_id)
         session.query(DeviceSensor).filter(DeviceSensor.id == sensor_id).delete()
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices(device_ids, version)
 
 
 def get_sensor(sensor_id):
-    with Session() as session:
+    with ReadSession() as session:
         try:
             sensor = session.query(DeviceSensor).filter(DeviceSensor.id == sensor_id).one()
             data = sensor.to_dict()
@@ -183,24 +491,30 @@ def add_wifi_network(wifi_network):
 def update_wifi_network(wifi_network_id, new_wifi_network):
     with Session() as session:
         session.query(WifiNetwork).filter(WifiNetwork.id == wifi_network_id).update(new_wifi_network)
+        device_ids = _config_device_ids(session, DeviceConfig.wifi_network_id == wifi_network_id)
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices(device_ids, version)
 
 
 def delete_wifi_network(wifi_network_id):
     with Session() as session:
         session.query(WifiNetwork).filter(WifiNetwork.id == wifi_network_id).delete()
+        device_ids = _config_device_ids(session, DeviceConfig.wifi_network_id == wifi_network_id)
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices(device_ids, version)
 
 
 def get_all_wifi_networks():
-    with Session() as session:
+    with ReadSession() as session:
         wifi_networks = session.query(WifiNetwork).all()
         data = [network.to_dict() for network in wifi_networks]
     return data
 
 
 def get_wifi_network(wifi_network_id):
-    with Session() as session:
+    with ReadSession() as session:
         try:
             wifi_network = session.query(WifiNetwork).filter(WifiNetwork.id == wifi_network_id).one()
             data = wifi_network
@@ -222,17 +536,23 @@ def add_ftp_server(ftp_server):
 def update_ftp_server(ftp_server_id, new_ftp_server):
     with Session() as session:
         session.query(FTPServer).filter(FTPServer.id == ftp_server_id).update(new_ftp_server)
+        device_ids = _config_device_ids(session, DeviceConfig.ftp_server_id == ftp_server_id)
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices(device_ids, version)
 
 
 def delete_ftp_server(ftp_server_id):
     with Session() as session:
         session.query(FTPServer).filter(FTPServer.id == ftp_server_id).delete()
+        device_ids = _config_device_ids(session, DeviceConfig.ftp_server_id == ftp_server_id)
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices(device_ids, version)
 
 
 def get_ftp_server(ftp_server_id):
-    with Session() as session:
+    with ReadSession() as session:
         try:
             ftp_server = session.query(FTPServer).filter(FTPServer.id == ftp_server_id).one()
             data = ftp_server
@@ -242,7 +562,7 @@ def get_ftp_server(ftp_server_id):
 
 
 def get_all_ftp_servers():
-    with Session() as session:
+    with ReadSession() as session:
         ftp_servers = session.query(FTPServer).all()
         data = [server.to_dict() for server in ftp_servers]
     return data
@@ -261,17 +581,23 @@ def add_mqtt_broker(mqtt_broker):
 def update_mqtt_broker(mqtt_broker_id, new_mqtt_broker):
     with Session() as session:
         session.query(MQTTBroker).filter(MQTTBroker.id == mqtt_broker_id).update(new_mqtt_broker)
+        device_ids = _config_device_ids(session, DeviceConfig.mqtt_broker_id == mqtt_broker_id)
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices(device_ids, version)
 
 
 def delete_mqtt_broker(mqtt_broker_id):
     with Session() as session:
         session.query(MQTTBroker).filter(MQTTBroker.id == mqtt_broker_id).delete()
+        device_ids = _config_device_ids(session, DeviceConfig.mqtt_broker_id == mqtt_broker_id)
+        version = _bump_devices_version(session)
         session.commit()
+    _invalidate_devices(device_ids, version)
 
 
 def get_mqtt_broker(mqtt_broker_id):
-    with Session() as session:
+    with ReadSession() as session:
         try:
             mqtt_broker = session.query(MQTTBroker).filter(MQTTBroker.id == mqtt_broker_id).one()
             data = mqtt_broker
@@ -281,7 +607,7 @@ def get_mqtt_broker(mqtt_broker_id):
 
 
 def get_all_mqtt_brokers():
-    with Session() as session:
+    with ReadSession() as session:
         mqtt_brokers = session.query(MQTTBroker).all()
         data = [broker.to_dict() for broker in mqtt_brokers]
     return data
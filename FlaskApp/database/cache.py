@@ -0,0 +1,52 @@
+from threading import Lock
+
+MISSING = object()
+
+
+class DocumentCache:
+    """
+    Process-local cache of rendered documents, tagged with a shared version number.
+
+    The version lives in the database and is bumped in the same transaction as every change to
+    the cached data. Each lookup passes in the version read alongside it, and when another
+    process has bumped it the whole cache is dropped. Changes made by this process invalidate
+    only the affected keys.
+    """
+
+    def __init__(self):
+        self._documents = {}
+        self._version = None
+        self._lock = Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._documents.clear()
+                self._version = version
+                return MISSING
+            if version < self._version:
+                # read from a snapshot older than the cached documents
+                return MISSING
+            return self._documents.get(key, MISSING)
+
+    def set(self, key, document, version):
+        with self._lock:
+            # a document read before a newer change was committed must not be cached
+            if version == self._version:
+                self._documents[key] = document
+
+    def invalidate(self, keys, version):
+        with self._lock:
+            if self._version is not None and version <= self._version:
+                return
+            if self._version is not None and version == self._version + 1:
+                for key in keys:
+                    self._documents.pop(key, None)
+            else:
+                self._documents.clear()
+            self._version = version
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self._version = None
@@ -0,0 +1,52 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+
+def sqlite_pragmas(busy_timeout_ms, cache_size_kib, mmap_size, wal=True, query_only=False):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if wal:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(cache_size_kib)}")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if query_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return set_pragmas
+
+
+def create_engines(uri, profile='tuned', read_pool_size=8, busy_timeout_ms=5000,
+                   cache_size_kib=16384, mmap_size=64 * 1024 * 1024):
+    """
+    Creates the (write, read) engine pair for the database.
+
+    The ``default`` profile returns one engine with SQLite's stock settings for both.
+    The ``tuned`` profile puts SQLite in WAL mode with synchronous=NORMAL, a busy timeout, a
+    larger page cache and mmap I/O. All writes go through a single pooled connection, so writers
+    queue in the pool instead of fighting over the database lock, while reads use their own
+    query-only pool and aren't blocked by a writer thanks to WAL.
+    """
+    url = make_url(uri)
+    if profile != 'tuned' or url.get_backend_name() != 'sqlite':
+        engine = create_engine(uri)
+        return engine, engine
+
+    connect_args = {"timeout": busy_timeout_ms / 1000, "check_same_thread": False}
+    pragma_args = {"busy_timeout_ms": busy_timeout_ms, "cache_size_kib": cache_size_kib, "mmap_size": mmap_size}
+
+    if url.database in (None, '', ':memory:'):
+        # every connection to an in-memory database is a separate database, so share one engine
+        engine = create_engine(uri, connect_args=connect_args)
+        event.listen(engine, "connect", sqlite_pragmas(wal=False, **pragma_args))
+        return engine, engine
+
+    write_engine = create_engine(uri, pool_size=1, max_overflow=0, pool_timeout=30, connect_args=connect_args)
+    event.listen(write_engine, "connect", sqlite_pragmas(**pragma_args))
+
+    read_engine = create_engine(uri, pool_size=read_pool_size, max_overflow=read_pool_size, connect_args=connect_args)
+    event.listen(read_engine, "connect", sqlite_pragmas(wal=False, query_only=True, **pragma_args))
+    return write_engine, read_engine
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String
+from .ModelBase import ModelBase
+
+
+class CacheVersion(ModelBase):
+    __tablename__ = 'cache-versions'
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<CacheVersion - {self.name} | {self.version}>"
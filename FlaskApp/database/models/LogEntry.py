@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from .ModelBase import ModelBase
 import datetime
@@ -7,10 +7,17 @@ import datetime
 
 class LogEntry(ModelBase):
     __tablename__ = 'log_entries'
+    __table_args__ = (
+        Index('ix_log_entries_time', 'time'),
+        Index('ix_log_entries_device_id_time', 'device_id', 'time'),
+        Index('ix_log_entries_topic_time', 'topic', 'time'),
+        Index('ix_log_entries_log_type_time', 'log_type', 'time'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     topic = Column(String)
     log = Column(JSON)
+    log_type = Column(String)
     time = Column(DateTime, default=datetime.datetime.now)
     device_id = Column(String, ForeignKey('home-devices.id'))
 
@@ -26,6 +33,8 @@ class LogEntry(ModelBase):
             "id": self.id,
             "topic": self.topic,
             "log": self.log,
+            "device_id": self.device_id,
+            "log_type": self.log_type,
             "time": self.time.strftime("%Y|%m|%d %H:%M:%S")
         }
 
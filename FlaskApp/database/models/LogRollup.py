@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from .ModelBase import ModelBase
+
+
+class LogRollup(ModelBase):
+    __tablename__ = 'log_rollups'
+    __table_args__ = (UniqueConstraint('device_id', 'log_type', 'hour'),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String, nullable=False)
+    log_type = Column(String, nullable=False)
+    hour = Column(DateTime, nullable=False)
+    count = Column(Integer, default=0)
+
+    def __repr__(self):
+        return f"<LogRollup - {self.device_id} | {self.log_type} | {self.hour} | {self.count}>"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "device_id": self.device_id,
+            "log_type": self.log_type,
+            "hour": self.hour.strftime("%Y|%m|%d %H:%M:%S"),
+            "count": self.count
+        }
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String
+from .ModelBase import ModelBase
+
+
+class Marker(ModelBase):
+    """
+    Named progress marks for one-time and resumable maintenance work, e.g. how far the log backfill got.
+    """
+    __tablename__ = 'markers'
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<Marker - {self.name} | {self.value}>"
@@ -3,4 +3,7 @@ from .DeviceConfig import DeviceConfig
 from .Connections import WifiNetwork, FTPServer, MQTTBroker
 from .HomeDevice import HomeDevice
 from .LogEntry import LogEntry
+from .LogRollup import LogRollup
+from .CacheVersion import CacheVersion
+from .Marker import Marker
 from .ModelBase import ModelBase
@@ -0,0 +1,267 @@
+import json
+import os
+from database import get_devices, is_discovery_migrated, set_discovery_migrated
+from mqtt import publisher
+
+DISCOVERY_PREFIX = 'homeassistant'
+# 'entity' publishes one retained message per entity, 'device' one device-based discovery message per device
+DISCOVERY_MODE = os.getenv('DISCOVERY_MODE', 'entity')
+DISCOVERY_ORIGIN = {"name": "zHome"}
+# discovery keys that point an entity at a state topic, and the template that reads the value from the packed
+# JSON state message of a device with the json_state setting; light and fan use state_value_template instead
+STATE_TEMPLATE_KEYS = {
+    "state_topic": "value_template",
+    "brightness_state_topic": "brightness_value_template",
+    "percentage_state_topic": "percentage_value_template",
+}
+
+
+def slug(name):
+    return str(name).lower().replace(' ', '_')
+
+
+def weather_names(sensor):
+    sensor_config = sensor.get('sensor_config') or {}
+    name_temp = sensor_config.get('name_temp') or f"{sensor['name']} Temperature"
+    name_humidity = sensor_config.get('name_humidity') or f"{sensor['name']} Humidity"
+    return name_temp, name_humidity
+
+
+def sensor_topics(device_id, sensor):
+    """
+    The topic set a sensor uses, keyed the way the firmware reads ``sensor_config['topics']``.
+    Topics entered by hand in the sensor config take precedence over the generated ones.
+    """
+    sensor_type = sensor.get('sensor_type')
+    topics = {}
+    if sensor_type == 'motion':
+        base = f"{DISCOVERY_PREFIX}/binary_sensor/{device_id}/{slug(sensor['name'])}"
+        topics = {"state_topic": f"{base}/state",
+                  "discovery_topic": f"{base}/config"}
+    elif sensor_type == 'led':
+        base = f"{DISCOVERY_PREFIX}/light/{device_id}/{slug(sensor['name'])}"
+        topics = {"state_topic": f"{base}/state",
+                  "command_topic": f"{base}/set",
+                  "brightness_state_topic": f"{base}/dim",
+                  "brightness_command_topic": f"{base}/dim/set",
+                  "discovery_topic": f"{base}/config"}
+    elif sensor_type == 'fan':
+        base = f"{DISCOVERY_PREFIX}/fan/{device_id}/{slug(sensor['name'])}"
+        topics = {"state_topic": f"{base}/state",
+                  "command_topic": f"{base}/set",
+                  "percentage_state_topic": f"{base}/percentage",
+                  "percentage_command_topic": f"{base}/percentage/set",
+                  "discovery_topic": f"{base}/config"}
+    elif sensor_type == 'weather':
+        base = f"{DISCOVERY_PREFIX}/sensor/{device_id}"
+        name_temp, name_humidity = weather_names(sensor)
+        topics = {"temperature_topic": f"{base}/{slug(name_temp)}",
+                  "temperature_discovery": f"{base}/{slug(name_temp)}/config",
+                  "humidity_topic": f"{base}/{slug(name_humidity)}",
+                  "humidity_discovery": f"{base}/{slug(name_humidity)}/config"}
+    sensor_config = sensor.get('sensor_config') or {}
+    return {**topics, **(sensor_config.get('topics') or {})}
+
+
+def state_topics(device_id, sensor):
+    # what the firmware still needs when the add-on publishes discovery for it
+    return {key: topic for key, topic in sensor_topics(device_id, sensor).items()
+            if key not in ('discovery_topic', 'temperature_discovery', 'humidity_discovery')}
+
+
+def discovery_topics(device_id, sensor):
+    topics = sensor_topics(device_id, sensor)
+    if sensor.get('sensor_type') == 'weather':
+        return [topics.get('temperature_discovery'), topics.get('humidity_discovery')]
+    return [topics.get('discovery_topic')]
+
+
+def sensor_components(device, sensor, sensor_index):
+    """
+    Renders the Home Assistant entities of one sensor as ``(discovery_topic, platform, object_id, config)``.
+    The configs and unique ids match what the sensor classes used to publish themselves, minus the device block.
+    """
+    display_name = device.get('display_name')
+    device_info = device.get('device_info') or {}
+    topics = sensor_topics(device['id'], sensor)
+    name = sensor['name']
+    sensor_type = sensor.get('sensor_type')
+
+    if sensor_type == 'motion':
+        return [(topics['discovery_topic'], 'binary_sensor', slug(name), {
+            "name": name,
+            "device_class": "motion",
+            "unique_id": f"{device_info.get('name')}-{name}",
+            "payload_off": "0",
+            "payload_on": "1",
+            "state_topic": topics['state_topic'],
+        })]
+    if sensor_type == 'led':
+        return [(topics['discovery_topic'], 'light', slug(name), {
+            "name": name,
+            "device_class": "light",
+            "state_topic": topics['state_topic'],
+            "command_topic": topics['command_topic'],
+            "brightness_state_topic": topics['brightness_state_topic'],
+            "brightness_command_topic": topics['brightness_command_topic'],
+            # Home Assistant otherwise sends brightness on a 0..255 scale; the firmware's default scale is 100
+            "brightness_scale": (sensor.get('sensor_config') or {}).get('brightness_scale', 100),
+            "payload_on": "ON",
+            "payload_off": "OFF",
+            "optimistic": False,
+            "unique_id": f"{display_name}-{name}",
+        })]
+    if sensor_type == 'fan':
+        return [(topics['discovery_topic'], 'fan', slug(name), {
+            "name": name,
+            "device_class": "fan",
+            "state_topic": topics['state_topic'],
+            "command_topic": topics['command_topic'],
+            "percentage_state_topic": topics['percentage_state_topic'],
+            "percentage_command_topic": topics['percentage_command_topic'],
+            "payload_on": "ON",
+            "payload_off": "OFF",
+            "optimistic": False,
+            "unique_id": f"{display_name}-{name}",
+        })]
+    if sensor_type == 'weather':
+        name_temp, name_humidity = weather_names(sensor)
+        return [(topics['temperature_discovery'], 'sensor', slug(name_temp), {
+            "name": name_temp,
+            "device_class": "temperature",
+            "unit_of_measurement": chr(176) + "C",
+            "state_topic": topics['temperature_topic'],
+            "unique_id": f"{device['id']}-{sensor_index}_temp",
+        }), (topics['humidity_discovery'], 'sensor', slug(name_humidity), {
+            "name": name_humidity,
+            "device_class": "humidity",
+            "unit_of_measurement": "%",
+            "state_topic": topics['humidity_topic'],
+            "unique_id": f"{device['id']}-{sensor_index}_humidity",
+        })]
+    return []
+
+
+def device_state_topic(device_id):
+    return f"z-home/state/{device_id}"
+
+
+def json_state_config(platform, config, json_topic):
+    """
+    Points an entity at the device's packed JSON state message, keyed by the entity's own state topic.
+    A copy of ``json_state_config`` in the firmware's home/PublishCoalescer.py, which renders the same configs
+    when the device publishes its own discovery; Test_Discovery checks that the two agree.
+    """
+    for key, template_key in STATE_TEMPLATE_KEYS.items():
+        topic = config.get(key)
+        if topic is None:
+            continue
+        if key == "state_topic" and platform in ('light', 'fan'):
+            template_key = "state_value_template"
+        config[key] = json_topic
+        config[template_key] = "{{ value_json['" + topic + "'] }}"
+    return config
+
+
+def json_state(device):
+    config = device.get('config') or {}
+    settings = config.get('device_settings') or {}
+    return bool(settings.get('json_state'))
+
+
+def device_sensors(device):
+    config = device.get('config') or {}
+    return config.get('sensors') or []
+
+
+def device_components(device):
+    components = []
+    for sensor_index, sensor in enumerate(device_sensors(device), 1):
+        components.extend(sensor_components(device, sensor, sensor_index))
+    if json_state(device):
+        for _, platform, _, config in components:
+            json_state_config(platform, config, device_state_topic(device['id']))
+    return components
+
+
+def device_discovery_topic(device_id):
+    return f"{DISCOVERY_PREFIX}/device/{device_id}/config"
+
+
+def device_discovery(device, mode=None):
+    """
+    The retained discovery messages for a device as ``(topic, payload)`` pairs: one per entity in
+    ``entity`` mode, or a single device-based discovery document listing every component in ``device`` mode.
+    """
+    mode = mode or DISCOVERY_MODE
+    device_info = device.get('device_info') or {}
+    components = device_components(device)
+    if mode == 'device':
+        return [(device_discovery_topic(device['id']), {
+            "dev": device_info,
+            "o": DISCOVERY_ORIGIN,
+            "cmps": {object_id: {"p": platform, **config} for _, platform, object_id, config in components},
+        })]
+    return [(topic, {**config, "device": device_info}) for topic, _, _, config in components]
+
+
+def find_sensor_device(sensor):
+    device_config_id = str(sensor.get('device_config_id'))
+    for device in get_devices():
+        config = device.get('config')
+        if config is not None and str(config['id']) == device_config_id:
+            return device
+    return None
+
+
+def publish_device_discovery(device):
+    if not publisher.is_configured:
+        return
+    migrate = DISCOVERY_MODE == 'device' and not is_discovery_migrated(device['id'])
+    if migrate:
+        # hand existing per-entity discovery over to the device document without losing the entities
+        entity_topics = [topic for topic, _, _, _ in device_components(device)]
+        for topic in entity_topics:
+            publisher.publish(topic, json.dumps({"migrate_discovery": True}), retain=True)
+    for topic, payload in device_discovery(device):
+        publisher.publish(topic, json.dumps(payload), retain=True)
+    if migrate:
+        clear_discovery(entity_topics)
+        set_discovery_migrated(device['id'])
+    elif DISCOVERY_MODE != 'device' and is_discovery_migrated(device['id']):
+        # back on per-entity discovery, so switching to device mode again hands the entities over again
+        set_discovery_migrated(device['id'], False)
+
+
+def publish_all_discovery():
+    for device in get_devices():
+        publish_device_discovery(device)
+
+
+def clear_discovery(topics):
+    # an empty retained message removes the entity from Home Assistant and the retained config from the broker
+    if not publisher.is_configured:
+        return
+    for topic in topics:
+        if topic:
+            publisher.publish(topic, '', retain=True)
+
+
+def refresh_sensor_discovery(sensor, previous=None):
+    device = find_sensor_device(sensor)
+    if device is None:
+        return
+    if previous is not None and DISCOVERY_MODE != 'device':
+        current = set(discovery_topics(device['id'], sensor))
+        clear_discovery(t for t in discovery_topics(device['id'], previous) if t not in current)
+    publish_device_discovery(device)
+
+
+def remove_sensor_discovery(sensor):
+    device = find_sensor_device(sensor)
+    if device is not None:
+        if DISCOVERY_MODE != 'device':
+            clear_discovery(discovery_topics(device['id'], sensor))
+        # weather sensor unique ids follow the sensor order, so the remaining sensors are republished;
+        # in device mode that also drops the deleted sensor's components
+        publish_device_discovery(device)
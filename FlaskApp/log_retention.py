@@ -0,0 +1,85 @@
+import datetime
+from threading import Thread, Event
+from database import rollup_logs, backfill_logs, get_log_backfill_id, get_log_retention_cutoff_id
+
+
+class LogRetention:
+    """
+    Periodically compacts old log entries into hourly per-device/per-type counts.
+
+    Rows older than ``retention_days``, and rows beyond the newest ``max_rows``, are rolled up
+    and deleted ``batch_size`` at a time. Each batch is its own short transaction and the thread
+    pauses ``batch_pause_ms`` between batches, so the log writer never waits long on the
+    SQLite write lock.
+
+    On start it also backfills ``device_id`` and ``log_type`` on rows written before those
+    columns were populated, in the same batched way. Each row is looked at once; the last
+    classified id is persisted, so rows that stay NULL aren't rescanned on every start.
+    """
+
+    def __init__(self, retention_days=14, max_rows=200000, batch_size=500, batch_pause_ms=50, interval_s=3600):
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause_ms / 1000
+        self.interval = interval_s
+        self._stopping = Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = Thread(target=self._run, name="log-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        try:
+            backfilled = self.backfill()
+            if backfilled:
+                print(f"log retention: backfilled log entries up to id {backfilled}")
+        except Exception as e:
+            print(f"log backfill error: {e}")
+
+        while not self._stopping.is_set():
+            try:
+                compacted = self.compact()
+                if compacted:
+                    print(f"log retention: rolled up {compacted} log entries")
+            except Exception as e:
+                print(f"log retention error: {e}")
+            self._stopping.wait(self.interval)
+
+    def backfill(self):
+        # resumes after the rows earlier starts already classified
+        start_id = last_id = get_log_backfill_id()
+        while not self._stopping.is_set():
+            next_id = backfill_logs(after_id=last_id, batch_size=self.batch_size)
+            if next_id is None:
+                break
+            last_id = next_id
+            self._stopping.wait(self.batch_pause)
+        return last_id if last_id != start_id else 0
+
+    def compact(self):
+        before_time = None
+        if self.retention_days:
+            before_time = datetime.datetime.now() - datetime.timedelta(days=self.retention_days)
+        through_id = get_log_retention_cutoff_id(self.max_rows) if self.max_rows else None
+        if before_time is None and through_id is None:
+            return 0
+
+        total = 0
+        while not self._stopping.is_set():
+            compacted = rollup_logs(before_time=before_time, through_id=through_id, batch_size=self.batch_size)
+            total += compacted
+            if compacted < self.batch_size:
+                break
+            self._stopping.wait(self.batch_pause)
+        return total
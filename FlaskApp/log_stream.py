@@ -0,0 +1,97 @@
+import json
+from collections import deque, namedtuple
+from threading import Condition
+from database import get_logs_since
+
+StreamEvent = namedtuple('StreamEvent', ['seq', 'log_id', 'payload'])
+
+
+class EventBroadcaster:
+    """
+    Fans out dashboard events to every connected Server-Sent Events client.
+
+    Events are rendered to SSE text once and kept in a fixed-size ring buffer; each client just
+    follows the buffer by sequence number. Log events carry the log id as their SSE ``id``, so a
+    client reconnecting with ``Last-Event-ID`` is replayed the logs it missed from the buffer, or
+    from the database when they have already been pushed out of it.
+    """
+
+    def __init__(self, buffer_size=1000, heartbeat_s=15):
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat_s
+        self._events = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._condition = Condition()
+        self.listeners = 0
+
+    def publish(self, data, log_id=None):
+        payload = f"data: {json.dumps(data)}\n\n"
+        if log_id is not None:
+            payload = f"id: {log_id}\n{payload}"
+        with self._condition:
+            self._seq += 1
+            self._events.append(StreamEvent(self._seq, log_id, payload))
+            self._condition.notify_all()
+
+    def publish_logs(self, logs):
+        for log in logs:
+            self.publish({"type": "log", "log": log}, log_id=log['id'])
+
+    def _events_after(self, seq):
+        # the buffer holds consecutive sequence numbers, so the events after ``seq`` are its tail
+        missed = self._seq - seq
+        if missed <= 0:
+            return [], False
+        events = list(self._events)
+        if missed > len(events):
+            return events, True
+        return events[len(events) - missed:], False
+
+    def _catch_up(self, last_log_id, events):
+        """
+        Yields the payloads of logs newer than ``last_log_id``, reading from the database
+        whatever the buffered ``events`` no longer cover.
+        """
+        oldest = next((e.log_id for e in events if e.log_id is not None), None)
+        if oldest is None or oldest > last_log_id + 1:
+            for log in get_logs_since(last_log_id, limit=self.buffer_size):
+                yield log['id'], f"id: {log['id']}\ndata: {json.dumps({'type': 'log', 'log': log})}\n\n"
+                last_log_id = log['id']
+        for event in events:
+            if event.log_id is None or event.log_id > last_log_id:
+                yield event.log_id, event.payload
+
+    def stream(self, last_event_id=None):
+        with self._condition:
+            self.listeners += 1
+            seq = self._seq
+            buffered = list(self._events)
+        try:
+            last_log_id = last_event_id
+            if last_log_id is not None:
+                for log_id, payload in self._catch_up(last_log_id, [e for e in buffered if e.log_id is not None]):
+                    last_log_id = log_id if log_id is not None else last_log_id
+                    yield payload
+
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._seq > seq, timeout=self.heartbeat)
+                    events, overrun = self._events_after(seq)
+                    seq = self._seq
+                if not events:
+                    yield ": keep-alive\n\n"
+                    continue
+                if overrun and last_log_id is not None:
+                    # this client fell further behind than the buffer holds
+                    stream = self._catch_up(last_log_id, events)
+                else:
+                    stream = ((e.log_id, e.payload) for e in events)
+                for log_id, payload in stream:
+                    last_log_id = log_id if log_id is not None else last_log_id
+                    yield payload
+        finally:
+            with self._condition:
+                self.listeners -= 1
+
+
+broadcaster = EventBroadcaster()
@@ -0,0 +1,139 @@
+import datetime
+import json
+import os
+import queue
+import time
+from threading import Thread, Event, Lock
+from sqlalchemy.exc import OperationalError
+from database import add_logs
+
+
+class LogWriter:
+    """
+    Buffers incoming log entries in a bounded queue and writes them to the database
+    from a single background thread, one transaction per batch.
+
+    A batch is flushed once it reaches ``batch_size`` rows or ``flush_interval_ms`` has passed
+    since its first row arrived. When the queue is full, ``put`` blocks for up to
+    ``put_timeout`` seconds so the caller (the paho network thread) slows down instead of
+    the process growing without bound. Batches that can't be written, or entries that still
+    don't fit in the queue, are appended to a JSON-lines spill file and re-inserted ahead of the
+    next batch, ``batch_size`` rows per transaction.
+
+    If ``on_written`` is given it is called from the writer thread with the serialized rows of
+    every batch once it has been committed.
+    """
+
+    def __init__(self, spill_path, batch_size=500, flush_interval_ms=250, max_queue_size=10000, put_timeout=1.0,
+                 on_written=None):
+        self.spill_path = spill_path
+        self.on_written = on_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stopping = Event()
+        self._spill_lock = Lock()
+        self._thread = None
+        self.written = 0
+        self.spilled = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """
+        Stops the writer thread after everything already queued has been flushed.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def put(self, log_entry):
+        log_entry.setdefault('time', datetime.datetime.now())
+        try:
+            self._queue.put(log_entry, timeout=self.put_timeout)
+        except queue.Full:
+            print("log queue full - spilling entry to disk")
+            self._spill([log_entry])
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            elif os.path.exists(self.spill_path):
+                self._flush([])
+        remaining = self._drain()
+        for i in range(0, len(remaining), self.batch_size):
+            self._flush(remaining[i:i + self.batch_size])
+
+    def _flush(self, batch):
+        rows = self._load_spill() + batch
+        for i in range(0, len(rows), self.batch_size):
+            chunk = rows[i:i + self.batch_size]
+            try:
+                written = add_logs(chunk, returning=self.on_written is not None)
+            except Exception as e:
+                reason = e.orig if isinstance(e, OperationalError) else e
+                print(f"Unable to write {len(rows) - i} log entries, spilling to disk: {reason}")
+                self._spill(rows[i:])
+                return
+            self.written += len(chunk)
+            if self.on_written is not None:
+                try:
+                    self.on_written(written)
+                except Exception as e:
+                    print(f"Error in log writer on_written: {e}")
+
+    def _spill(self, rows):
+        with self._spill_lock:
+            with open(self.spill_path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps({**row, 'time': row['time'].isoformat()}) + '\n')
+            self.spilled += len(rows)
+
+    def _load_spill(self):
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return []
+            rows = []
+            with open(self.spill_path, 'r') as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        continue
+                    row['time'] = datetime.datetime.fromisoformat(row['time'])
+                    rows.append(row)
+            os.remove(self.spill_path)
+        return rows
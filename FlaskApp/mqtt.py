@@ -1,33 +1,100 @@
-import functools
+import json
+from concurrent.futures import Future
+from threading import Lock
 from paho.mqtt import client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 
 
-def mqtt_decorator(func):
-    @functools.wraps(func)
-    def wrapped(*args, **kwargs):
-        mqtt_client = mqtt.Client(CallbackAPIVersion(2))
+class MQTTPublisherError(Exception):
+    pass
 
-        def on_pub(*args):
-            mqtt_client.disconnect()
-            print("disconnected mqtt")
 
-        try:
-            mqtt_client.on_publish = on_pub
-            mqtt_client.username_pw_set(username="Zak", password="935Ravine")
-            mqtt_client.connect(host="homeassistant.local", port=1883, keepalive=60)
-            print("connected mqtt")
-            func(mqtt_client, *args, **kwargs)
-            # mqtt_client.disconnect()
-        except Exception as e:
-            print(f"An error occurred while sending the MQTT message: {e}")
-            # Add additional error handling here as needed
+class MQTTPublisher:
+    """
+    One long-lived MQTT connection shared by every request that publishes.
 
-    return wrapped
+    The paho network loop runs in its own thread and reconnects on its own, so a publish is a
+    single PUBLISH packet instead of a TCP connect and MQTT handshake. ``publish`` returns a
+    ``Future`` that resolves with the message id once the broker has acknowledged it (for QoS 0,
+    once it has been written to the socket).
+    """
 
+    def __init__(self):
+        self._client = None
+        self._lock = Lock()
+        self._pending = {}
 
-@mqtt_decorator
-def send_mqtt_message(mqtt_client, topic, message):
-    mqtt_client.publish(topic, message)
+    @property
+    def is_configured(self):
+        return self._client is not None
 
+    def configure(self, host, port=1883, username=None, password=None, keepalive=60):
+        self.stop()
+        client = mqtt.Client(CallbackAPIVersion(2))
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_publish = self._on_publish
+        if username is not None:
+            client.username_pw_set(username, password)
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+        client.max_queued_messages_set(1000)
+        client.connect_async(host, port, keepalive)
+        client.loop_start()
+        with self._lock:
+            self._client = client
 
+    def stop(self):
+        with self._lock:
+            client = self._client
+            self._client = None
+            pending = self._pending
+            self._pending = {}
+        if client is not None:
+            client.disconnect()
+            client.loop_stop()
+        for future in pending.values():
+            future.set_exception(MQTTPublisherError("publisher stopped before the message was delivered"))
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        future = Future()
+        with self._lock:
+            if self._client is None:
+                future.set_exception(MQTTPublisherError("MQTT publisher is not configured"))
+                return future
+            info = self._client.publish(topic, payload, qos=qos, retain=retain)
+            if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                future.set_exception(MQTTPublisherError(mqtt.error_string(info.rc)))
+            elif qos == 0 and info.rc == mqtt.MQTT_ERR_NO_CONN:
+                future.set_exception(MQTTPublisherError("not connected to broker"))
+            else:
+                # QoS 1/2 messages published while disconnected are sent once paho reconnects
+                self._pending[info.mid] = future
+        return future
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        print(f"MQTT publisher connected with result code {reason_code}")
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        print(f"MQTT publisher disconnected with result code {reason_code}")
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        with self._lock:
+            future = self._pending.pop(mid, None)
+        if future is not None:
+            future.set_result(mid)
+
+
+publisher = MQTTPublisher()
+
+
+def send_mqtt_message(topic, message, **kwargs):
+    future = publisher.publish(topic, message, **kwargs)
+    if future.done() and future.exception() is not None:
+        print(f"An error occurred while sending the MQTT message: {future.exception()}")
+    return future
+
+
+def request_config_reload(device_id):
+    # the device fetches its boot profile again and applies only what changed
+    if publisher.is_configured:
+        return send_mqtt_message(f"command/{device_id}", json.dumps({'command': 'reload-config'}))
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_conditional_requests.db')}"
+
+from flask import Flask
+import database
+import tests.test_data as td
+from blueprints.devices import device_blueprint
+from blueprints.sensors import sensor_blueprint
+
+DEVICE = {**td.device_data1, "id": "conditional_test_device", "display_name": "conditional_test_device"}
+
+
+class ConditionalRequestTestCase(unittest.TestCase):
+    """
+    Device, config, boot profile and sensor GETs carry an ETag and answer a matching If-None-Match with
+    an empty 304, so polling clients and rebooting devices don't download unchanged JSON.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        app = Flask(__name__)
+        app.register_blueprint(device_blueprint, url_prefix='/api/home/devices')
+        app.register_blueprint(sensor_blueprint, url_prefix='/api/home/sensors')
+        cls.client = app.test_client()
+        mqtt_id = database.add_mqtt_broker({"host_address": "mqtt.local", "username": "u", "password": "p"})['id']
+        database.add_device(DEVICE)
+        config = database.add_device_config(DEVICE['id'], mqtt_broker_id=mqtt_id)
+        cls.sensor = database.add_sensor({**td.test_led, "device_config_id": config['id']})
+
+    def urls(self):
+        device_id = DEVICE['id']
+        return [f"/api/home/devices/{device_id}",
+                f"/api/home/devices/{device_id}/config",
+                f"/api/home/devices/{device_id}/boot",
+                f"/api/home/sensors/{self.sensor['id']}"]
+
+    def test_responses_carry_etag(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNotNone(response.headers.get('ETag'))
+                self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+                self.assertTrue(response.get_json())
+
+    def test_matching_etag_gets_304(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                etag = self.client.get(url).headers['ETag']
+                response = self.client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.data, b'')
+                self.assertEqual(response.headers['ETag'], etag)
+
+    def test_stale_etag_gets_body(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url, headers={'If-None-Match': '"stale"'})
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.get_json())
+
+    def test_change_changes_etag(self):
+        url = f"/api/home/devices/{DEVICE['id']}/boot"
+        etag = self.client.get(url).headers['ETag']
+        database.update_display_name(DEVICE['id'], "renamed")
+        self.addCleanup(database.update_display_name, DEVICE['id'], DEVICE['display_name'])
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.get_json()["n"], "renamed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_device_queries.db')}"
+
+from sqlalchemy import event
+import database
+import tests.test_data as td
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+class DeviceQueryCountTestCase(unittest.TestCase):
+    """
+    Loading devices must take a fixed number of SQL statements no matter how many devices,
+    sensors and connections there are.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.wifi_id = database.add_wifi_network({"ssid": "the_interwebs", "password": "pw", "is_default": True})['id']
+        cls.ftp_id = database.add_ftp_server({"host_address": "ftp.local", "username": "u", "password": "p"})['id']
+        cls.mqtt_id = database.add_mqtt_broker({"host_address": "mqtt.local", "username": "u", "password": "p"})['id']
+        cls.device_count = 0
+
+    def add_devices(self, n):
+        for _ in range(n):
+            self.__class__.device_count += 1
+            device_id = f"query_test_device_{self.device_count}"
+            database.add_device({**td.device_data1, "id": device_id, "display_name": device_id})
+            config = database.add_device_config(device_id, wifi_network_id=self.wifi_id,
+                                                ftp_server_id=self.ftp_id, mqtt_broker_id=self.mqtt_id)
+            for sensor in (td.test_weather_sensor, td.test_motion, td.test_led):
+                database.add_sensor({**sensor, "device_config_id": config['id']})
+
+    def count_queries(self, func, *args):
+        with QueryCounter(database.read_engine) as counter:
+            data = func(*args)
+        return counter.count, data
+
+    def test_get_devices_query_count_is_constant(self):
+        self.add_devices(1)
+        small_count, small = self.count_queries(database.get_devices)
+        self.add_devices(10)
+        large_count, large = self.count_queries(database.get_devices)
+
+        self.assertEqual(len(large), len(small) + 10)
+        # other test modules in the same run share the database, so only this test's devices are checked
+        created = [device for device in large if device['id'].startswith("query_test_device_")]
+        self.assertTrue(all(len(device['config']['sensors']) == 3 for device in created))
+        self.assertTrue(all(device['config']['mqtt_broker'] is not None for device in created))
+        self.assertEqual(small_count, large_count)
+        # the cache version lookup plus the three loading queries
+        self.assertLessEqual(large_count, 4)
+
+    def test_get_device_query_count(self):
+        self.add_devices(1)
+        count, device = self.count_queries(database.get_device, f"query_test_device_{self.device_count}")
+        self.assertEqual(len(device['config']['sensors']), 3)
+        self.assertLessEqual(count, 4)
+
+    def test_cached_device_only_reads_version(self):
+        self.add_devices(1)
+        device_id = f"query_test_device_{self.device_count}"
+        database.get_device(device_id)
+        count, device = self.count_queries(database.get_device, device_id)
+        self.assertEqual(count, 1)
+        self.assertEqual(device['id'], device_id)
+
+    def test_changes_invalidate_cached_device(self):
+        self.add_devices(1)
+        device_id = f"query_test_device_{self.device_count}"
+        sensor = database.get_device(device_id)['config']['sensors'][0]
+        database.get_devices()
+
+        database.update_sensor_config(sensor['id'], {"pin": 99})
+        self.assertEqual(database.get_device(device_id)['config']['sensors'][0]['sensor_config'], {"pin": 99})
+        database.update_mqtt_broker(self.mqtt_id, {"port": 1884})
+        self.assertEqual(database.get_device(device_id)['config']['mqtt_broker']['port'], 1884)
+        database.delete_device(device_id)
+        self.assertIsNone(database.get_device(device_id))
+        self.assertNotIn(device_id, [device['id'] for device in database.get_devices()])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_device_settings.db')}"
+
+from flask import Flask
+import database
+import tests.test_data as td
+from blueprints import devices
+from blueprints.devices import device_blueprint
+
+DEVICE_ID = 'settings_test_device'
+
+
+class DeviceSettingsTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app = Flask(__name__)
+        app.register_blueprint(device_blueprint, url_prefix='/api/home/devices')
+        cls.client = app.test_client()
+        database.add_device({**td.device_data1, "id": DEVICE_ID, "display_name": DEVICE_ID})
+        database.add_device_config(DEVICE_ID)
+
+    def setUp(self):
+        database.update_device_settings(DEVICE_ID, {"use_ping": True})
+        patchers = [mock.patch.object(devices, 'publish_device_discovery'),
+                    mock.patch.object(devices, 'request_config_reload')]
+        self.publish_device_discovery, self.request_config_reload = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def put_settings(self, settings):
+        response = self.client.put(f'/api/home/devices/{DEVICE_ID}/settings', json=settings)
+        self.assertEqual(response.status_code, 200)
+        self.request_config_reload.assert_called_with(DEVICE_ID)
+
+    def test_publish_settings_republish_discovery(self):
+        for settings in ({"use_ping": True, "json_state": True}, {"use_ping": True, "json_state": True,
+                                                                  "coalesce_ms": 50}):
+            with self.subTest(settings=settings):
+                self.publish_device_discovery.reset_mock()
+                self.put_settings(settings)
+                self.publish_device_discovery.assert_called_once()
+                device = self.publish_device_discovery.call_args.args[0]
+                self.assertEqual(device['id'], DEVICE_ID)
+                self.assertEqual(device['config']['device_settings'], settings)
+
+    def test_other_settings_leave_discovery_alone(self):
+        self.put_settings({"use_ping": False, "json_state": False})
+        self.publish_device_discovery.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
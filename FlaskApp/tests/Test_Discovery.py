@@ -0,0 +1,150 @@
+import ast
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_discovery.db')}"
+
+import discovery
+from discovery import sensor_topics, state_topics, device_discovery, publish_device_discovery, json_state_config
+from database import is_discovery_migrated
+import tests.test_data as td
+
+FIRMWARE_COALESCER = os.path.join(os.path.dirname(__file__), '..', '..', 'Firmware', 'Firmware', 'src', 'home',
+                                  'PublishCoalescer.py')
+
+
+def make_device(*sensors):
+    return {**td.device_data1,
+            "config": {"id": 1, "sensors": [{**sensor, "device_config_id": "1"} for sensor in sensors]}}
+
+
+class DiscoveryTestCase(unittest.TestCase):
+
+    def test_generated_topics(self):
+        topics = sensor_topics("test_device_1", td.test_led)
+        self.assertEqual(topics['command_topic'], "homeassistant/light/test_device_1/shelf_lights/set")
+        self.assertEqual(topics['discovery_topic'], "homeassistant/light/test_device_1/shelf_lights/config")
+
+    def test_hand_entered_topics_win(self):
+        motion = {**td.test_motion,
+                  "sensor_config": {**td.test_motion['sensor_config'], "topics": {"state_topic": "nook/motion"}}}
+        topics = sensor_topics("test_device_1", motion)
+        self.assertEqual(topics['state_topic'], "nook/motion")
+        self.assertIn('discovery_topic', topics)
+
+    def test_state_topics_leave_out_discovery(self):
+        topics = state_topics("test_device_1", td.test_weather_sensor)
+        self.assertEqual(set(topics), {"temperature_topic", "humidity_topic"})
+
+    def test_device_discovery_payloads(self):
+        messages = dict(device_discovery(make_device(td.test_motion, td.test_weather_sensor)))
+        self.assertEqual(len(messages), 3)
+        motion = messages["homeassistant/binary_sensor/test_device_1/nook_motion/config"]
+        self.assertEqual(motion['state_topic'], "homeassistant/binary_sensor/test_device_1/nook_motion/state")
+        self.assertEqual(motion['unique_id'], "test_device_1-Nook Motion")
+        temperature = messages["homeassistant/sensor/test_device_1/bedroom_weather_temperature/config"]
+        self.assertEqual(temperature['unique_id'], "test_device_1-2_temp")
+        self.assertEqual(temperature['device'], td.device_data1['device_info'])
+
+    def test_device_mode_publishes_one_document(self):
+        entity_messages = dict(device_discovery(make_device(td.test_motion, td.test_weather_sensor), mode='entity'))
+        messages = device_discovery(make_device(td.test_motion, td.test_weather_sensor), mode='device')
+        self.assertEqual(len(messages), 1)
+        topic, document = messages[0]
+        self.assertEqual(topic, "homeassistant/device/test_device_1/config")
+        self.assertEqual(document['dev'], td.device_data1['device_info'])
+        self.assertEqual(set(document['cmps']), {"nook_motion", "bedroom_weather_temperature",
+                                                 "bedroom_weather_humidity"})
+        self.assertEqual(document['cmps']['nook_motion']['p'], "binary_sensor")
+        # same unique ids as per-entity discovery, so existing entities carry over
+        self.assertEqual({c['unique_id'] for c in document['cmps'].values()},
+                         {m['unique_id'] for m in entity_messages.values()})
+
+    def test_json_state_points_entities_at_state_message(self):
+        device = make_device(td.test_led, td.test_weather_sensor)
+        device['config']['device_settings'] = {"json_state": True}
+        messages = dict(device_discovery(device, mode='entity'))
+        led = messages["homeassistant/light/test_device_1/shelf_lights/config"]
+        self.assertEqual(led['state_topic'], "z-home/state/test_device_1")
+        self.assertEqual(led['brightness_state_topic'], "z-home/state/test_device_1")
+        self.assertEqual(led['state_value_template'],
+                         "{{ value_json['homeassistant/light/test_device_1/shelf_lights/state'] }}")
+        self.assertEqual(led['command_topic'], "homeassistant/light/test_device_1/shelf_lights/set")
+        self.assertEqual(led['brightness_scale'], td.test_led['sensor_config']['brightness_scale'])
+        temperature = messages["homeassistant/sensor/test_device_1/bedroom_weather_temperature/config"]
+        self.assertIn('value_template', temperature)
+
+
+class RecordingPublisher:
+    is_configured = True
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        self.published.append((topic, payload))
+
+
+class DiscoveryMigrationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.publisher = RecordingPublisher()
+        patcher = mock.patch.object(discovery, 'publisher', self.publisher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.device = {**make_device(td.test_motion, td.test_weather_sensor), "id": self.id().rsplit('.', 1)[-1]}
+
+    def publish(self, mode):
+        self.publisher.published.clear()
+        with mock.patch.object(discovery, 'DISCOVERY_MODE', mode):
+            publish_device_discovery(self.device)
+        return self.publisher.published
+
+    def test_device_mode_migrates_once(self):
+        first = self.publish('device')
+        # a hand-over and a clear per entity around the device document
+        self.assertEqual(len(first), 2 * 3 + 1)
+        self.assertTrue(is_discovery_migrated(self.device['id']))
+        second = self.publish('device')
+        self.assertEqual([topic for topic, _ in second], [f"homeassistant/device/{self.device['id']}/config"])
+
+    def test_entity_mode_resets_migration(self):
+        self.publish('device')
+        self.assertEqual(len(self.publish('entity')), 3)
+        self.assertFalse(is_discovery_migrated(self.device['id']))
+        self.assertEqual(len(self.publish('device')), 2 * 3 + 1)
+
+
+def firmware_json_state_config():
+    # the firmware module imports MicroPython's machine, so only the function and its constants are compiled
+    with open(FIRMWARE_COALESCER) as f:
+        module = ast.parse(f.read())
+    names = ('STATE_TEMPLATE_KEYS', 'STATE_VALUE_TEMPLATE_PLATFORMS', 'json_state_config')
+    body = [node for node in module.body
+            if isinstance(node, ast.Assign) and node.targets[0].id in names
+            or isinstance(node, ast.FunctionDef) and node.name in names]
+    namespace = {}
+    exec(compile(ast.Module(body=body, type_ignores=[]), FIRMWARE_COALESCER, 'exec'), namespace)
+    return namespace['json_state_config']
+
+
+@unittest.skipUnless(os.path.exists(FIRMWARE_COALESCER), "firmware source not available")
+class JsonStateConfigTestCase(unittest.TestCase):
+
+    def test_matches_firmware(self):
+        firmware = firmware_json_state_config()
+        device = make_device(td.test_motion, td.test_weather_sensor, td.test_led,
+                             {**td.test_led, "sensor_type": "fan", "name": "Ceiling Fan"})
+        device['config']['device_settings'] = {"json_state": False}
+        components = discovery.device_components(device)
+        self.assertEqual({platform for _, platform, _, _ in components}, {"binary_sensor", "sensor", "light", "fan"})
+        for _, platform, _, config in components:
+            with self.subTest(platform=platform, topic=config.get('state_topic')):
+                self.assertEqual(json_state_config(platform, dict(config), "z-home/state/test_device_1"),
+                                 firmware(platform, dict(config), "z-home/state/test_device_1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
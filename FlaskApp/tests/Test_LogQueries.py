@@ -0,0 +1,96 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_log_queries.db')}"
+
+from flask import Flask
+from sqlalchemy import delete
+import database
+from database.models import LogEntry
+from blueprints.logs import log_blueprint
+
+T0 = datetime.datetime(2024, 3, 1, 9)
+
+
+class LogPaginationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with database.Session() as session:
+            session.execute(delete(LogEntry))
+            session.commit()
+        app = Flask(__name__)
+        app.register_blueprint(log_blueprint, url_prefix='/api/home/logs')
+        self.client = app.test_client()
+
+    def add(self, device_id, log_type, time, message=None):
+        return database.add_logs([{
+            **database.log_entry_values(f"z-home/log/{device_id}", {"message": message, "type": log_type}),
+            "time": time,
+        }], returning=True)[0]['id']
+
+    def ids(self, logs):
+        return [log['id'] for log in logs]
+
+    def test_pages_walk_back_through_equal_timestamps(self):
+        # ids are not in time order, and four rows share one timestamp
+        ids = [self.add("deadbeef", "info", T0 + datetime.timedelta(seconds=s)) for s in (5, 1, 3, 3, 3, 3, 0)]
+        expected = [ids[6], ids[1], ids[2], ids[3], ids[4], ids[5], ids[0]]
+
+        pages = []
+        before_id = None
+        while True:
+            page = database.get_logs(before_id=before_id, limit=2)
+            if not page:
+                break
+            pages.append(self.ids(page))
+            before_id = page[0]['id']
+        self.assertEqual(pages, [expected[5:], expected[3:5], expected[1:3], expected[:1]])
+
+    def test_unknown_cursor_falls_back_to_id(self):
+        ids = [self.add("deadbeef", "info", T0 + datetime.timedelta(seconds=s)) for s in range(3)]
+        database.delete_log(ids[2])
+        self.assertEqual(self.ids(database.get_logs(before_id=ids[2])), ids[:2])
+
+    def test_filters_combine(self):
+        self.add("deadbeef", "info", T0)
+        wanted = self.add("deadbeef", "error", T0 + datetime.timedelta(minutes=5))
+        self.add("deadbeef", "error", T0 + datetime.timedelta(hours=2))
+        self.add("cafe", "error", T0 + datetime.timedelta(minutes=5))
+        logs = database.get_logs(device_id="deadbeef", log_type="error",
+                                 start=T0, end=T0 + datetime.timedelta(hours=1))
+        self.assertEqual(self.ids(logs), [wanted])
+        logs = database.get_logs(topic="z-home/log/cafe", log_type="info")
+        self.assertEqual(logs, [])
+
+    def test_since_id_returns_newer_rows_in_id_order(self):
+        ids = [self.add("deadbeef", "info", T0 + datetime.timedelta(seconds=s)) for s in (3, 1, 2)]
+        self.add("cafe", "info", T0)
+        self.assertEqual(self.ids(database.get_logs_since(ids[0], device_id="deadbeef")), ids[1:])
+        self.assertEqual(self.ids(database.get_logs_since(ids[0], limit=1)), ids[1:2])
+
+    def test_endpoint_cursor_headers(self):
+        ids = [self.add("deadbeef", "info", T0) for _ in range(3)]
+        response = self.client.get('/api/home/logs/?limit=2')
+        self.assertEqual(self.ids(response.get_json()), ids[1:])
+        self.assertEqual(response.headers['X-Next-Cursor'], str(ids[1]))
+        self.assertEqual(response.headers['X-Last-Id'], str(ids[2]))
+
+        response = self.client.get(f"/api/home/logs/?limit=2&before_id={response.headers['X-Next-Cursor']}")
+        self.assertEqual(self.ids(response.get_json()), ids[:1])
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
+    def test_endpoint_polling(self):
+        first = self.add("deadbeef", "info", T0)
+        response = self.client.get(f'/api/home/logs/?since_id={first}')
+        self.assertEqual(response.get_json(), [])
+        self.assertEqual(response.headers['X-Last-Id'], str(first))
+        second = self.add("deadbeef", "info", T0)
+        response = self.client.get(f'/api/home/logs/?since_id={first}&type=info')
+        self.assertEqual(self.ids(response.get_json()), [second])
+        self.assertEqual(response.headers['X-Last-Id'], str(second))
+
+
+if __name__ == '__main__':
+    unittest.main()
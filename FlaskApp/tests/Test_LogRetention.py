@@ -0,0 +1,114 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_log_retention.db')}"
+
+from sqlalchemy import delete
+import database
+from database.models import LogEntry, LogRollup, Marker
+from log_retention import LogRetention
+
+HOUR = datetime.datetime(2024, 3, 1, 9)
+
+
+class RollupLogsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with database.Session() as session:
+            session.execute(delete(LogEntry))
+            session.execute(delete(LogRollup))
+            session.commit()
+
+    def add(self, device_id, log_type, time):
+        database.add_logs([{**database.log_entry_values(f"z-home/log/{device_id}", {"message": "m", "type": log_type}),
+                            "time": time}])
+
+    def rollups(self):
+        return {(r['device_id'], r['log_type'], r['hour']): r['count'] for r in database.get_log_rollups()}
+
+    def remaining(self):
+        return database.get_logs()
+
+    def test_rolls_up_old_rows_per_device_type_and_hour(self):
+        for minute in (1, 20, 59):
+            self.add("deadbeef", "info", HOUR + datetime.timedelta(minutes=minute))
+        self.add("deadbeef", "error", HOUR + datetime.timedelta(minutes=5))
+        self.add("cafe", "info", HOUR + datetime.timedelta(hours=1, minutes=5))
+        recent = datetime.datetime.now()
+        self.add("deadbeef", "info", recent)
+
+        compacted = database.rollup_logs(before_time=recent - datetime.timedelta(days=1))
+        self.assertEqual(compacted, 5)
+        self.assertEqual(self.rollups(), {
+            ("deadbeef", "info", "2024|03|01 09:00:00"): 3,
+            ("deadbeef", "error", "2024|03|01 09:00:00"): 1,
+            ("cafe", "info", "2024|03|01 10:00:00"): 1,
+        })
+        # only the recent row is left
+        self.assertEqual([log['time'] for log in self.remaining()], [recent.strftime("%Y|%m|%d %H:%M:%S")])
+
+    def test_later_batches_add_to_existing_rollup(self):
+        for minute in range(4):
+            self.add("deadbeef", "info", HOUR + datetime.timedelta(minutes=minute))
+        cutoff = HOUR + datetime.timedelta(hours=1)
+        self.assertEqual(database.rollup_logs(before_time=cutoff, batch_size=3), 3)
+        self.assertEqual(database.rollup_logs(before_time=cutoff, batch_size=3), 1)
+        self.assertEqual(database.rollup_logs(before_time=cutoff, batch_size=3), 0)
+        self.assertEqual(self.rollups(), {("deadbeef", "info", "2024|03|01 09:00:00"): 4})
+        self.assertEqual(self.remaining(), [])
+
+    def test_rolls_up_rows_beyond_max_rows(self):
+        for minute in range(5):
+            self.add("deadbeef", "info", HOUR + datetime.timedelta(minutes=minute))
+        through_id = database.get_log_retention_cutoff_id(2)
+        self.assertEqual(database.rollup_logs(through_id=through_id), 3)
+        self.assertEqual(len(self.remaining()), 2)
+        self.assertEqual(self.rollups(), {("deadbeef", "info", "2024|03|01 09:00:00"): 3})
+
+    def test_nothing_to_do_without_a_cutoff(self):
+        self.add("deadbeef", "info", HOUR)
+        self.assertEqual(database.rollup_logs(), 0)
+        self.assertEqual(len(self.remaining()), 1)
+
+
+class BackfillLogsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with database.Session() as session:
+            session.execute(delete(LogEntry))
+            session.execute(delete(Marker).where(Marker.name == database.LOG_BACKFILL_MARK))
+            session.commit()
+
+    def add_legacy(self, topic, log):
+        # written before device_id and log_type were populated
+        return database.add_logs([{"topic": topic, "log": log, "device_id": None, "log_type": None,
+                                   "time": HOUR}], returning=True)[0]['id']
+
+    def test_classifies_legacy_rows(self):
+        self.add_legacy("z-home/log/deadbeef", {"message": "m", "type": "info"})
+        self.add_legacy("elsewhere", {"message": "m", "unit_id": "cafe", "type": "error"})
+        self.assertTrue(LogRetention(batch_size=1).backfill())
+        logs = database.get_logs()
+        self.assertEqual([(log['device_id'], log['log_type']) for log in logs],
+                         [("deadbeef", "info"), ("cafe", "error")])
+
+    def test_unclassifiable_rows_are_scanned_once(self):
+        stuck = self.add_legacy("elsewhere", "not a dict")
+        retention = LogRetention()
+        self.assertEqual(retention.backfill(), stuck)
+        self.assertEqual(database.get_log_backfill_id(), stuck)
+        # the next start resumes after the row instead of selecting it again
+        self.assertEqual(retention.backfill(), 0)
+        self.assertIsNone(database.backfill_logs(after_id=database.get_log_backfill_id()))
+
+    def test_mark_skips_rows_written_classified(self):
+        database.add_logs([{**database.log_entry_values("z-home/log/deadbeef", {"type": "info"}), "time": HOUR}])
+        newest = database.get_logs()[-1]['id']
+        self.assertIsNone(database.backfill_logs(after_id=0))
+        self.assertEqual(database.get_log_backfill_id(), newest)
+
+
+if __name__ == '__main__':
+    unittest.main()
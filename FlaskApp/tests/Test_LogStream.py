@@ -0,0 +1,85 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_log_stream.db')}"
+
+from sqlalchemy import delete
+import database
+from database.models import LogEntry
+from log_stream import EventBroadcaster
+
+
+def event_id(payload):
+    first = payload.split('\n', 1)[0]
+    return int(first[len('id: '):]) if first.startswith('id: ') else None
+
+
+class EventBroadcasterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with database.Session() as session:
+            session.execute(delete(LogEntry))
+            session.commit()
+
+    def add_logs(self, count):
+        return database.add_logs([{**database.log_entry_values("z-home/log/deadbeef", {"message": n, "type": "info"}),
+                                   "time": datetime.datetime.now()} for n in range(count)], returning=True)
+
+    def take(self, stream, count):
+        return [next(stream) for _ in range(count)]
+
+    def test_ring_buffer_keeps_newest_events(self):
+        broadcaster = EventBroadcaster(buffer_size=3)
+        for n in range(5):
+            broadcaster.publish({"n": n})
+        self.assertEqual([e.seq for e in broadcaster._events], [3, 4, 5])
+        events, overrun = broadcaster._events_after(3)
+        self.assertEqual([e.seq for e in events], [4, 5])
+        self.assertFalse(overrun)
+        events, overrun = broadcaster._events_after(0)
+        self.assertTrue(overrun)
+
+    def test_live_events_and_keep_alive(self):
+        broadcaster = EventBroadcaster(heartbeat_s=0.01)
+        stream = broadcaster.stream()
+        self.assertEqual(next(stream), ": keep-alive\n\n")
+        self.assertEqual(broadcaster.listeners, 1)
+        broadcaster.publish({"type": "device"})
+        self.assertEqual(json.loads(next(stream)[len('data: '):]), {"type": "device"})
+        stream.close()
+        self.assertEqual(broadcaster.listeners, 0)
+
+    def test_last_event_id_replays_from_buffer(self):
+        broadcaster = EventBroadcaster(heartbeat_s=0.01)
+        logs = self.add_logs(4)
+        broadcaster.publish_logs(logs)
+        stream = broadcaster.stream(last_event_id=logs[1]['id'])
+        self.assertEqual([event_id(p) for p in self.take(stream, 2)], [logs[2]['id'], logs[3]['id']])
+        self.assertEqual(next(stream), ": keep-alive\n\n")
+
+    def test_last_event_id_replays_from_database(self):
+        broadcaster = EventBroadcaster(buffer_size=2, heartbeat_s=0.01)
+        logs = self.add_logs(5)
+        # only the newest two are still buffered
+        broadcaster.publish_logs(logs)
+        stream = broadcaster.stream(last_event_id=logs[0]['id'])
+        replayed = [event_id(p) for p in self.take(stream, 4)]
+        self.assertEqual(replayed, [log['id'] for log in logs[1:]])
+        self.assertEqual(next(stream), ": keep-alive\n\n")
+
+    def test_client_that_falls_behind_catches_up_from_database(self):
+        broadcaster = EventBroadcaster(buffer_size=2, heartbeat_s=0.01)
+        first = self.add_logs(1)
+        broadcaster.publish_logs(first)
+        stream = broadcaster.stream(last_event_id=first[0]['id'] - 1)
+        self.assertEqual(event_id(next(stream)), first[0]['id'])
+        logs = self.add_logs(4)
+        broadcaster.publish_logs(logs)
+        self.assertEqual([event_id(p) for p in self.take(stream, 4)], [log['id'] for log in logs])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import datetime
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_log_writer.db')}"
+
+from sqlalchemy.exc import OperationalError
+import database
+from log_writer import LogWriter
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class LogWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.directory.name, 'log_spill.jsonl')
+        self.topic = f"z-home/log/{self.id().rsplit('.', 1)[-1]}"
+        self.writer = None
+
+    def tearDown(self):
+        if self.writer is not None:
+            self.writer.stop()
+        self.directory.cleanup()
+
+    def entry(self, n):
+        return {**database.log_entry_values(self.topic, {"message": f"entry {n}", "type": "info"}),
+                "time": datetime.datetime.now()}
+
+    def stored(self):
+        return database.get_logs(topic=self.topic)
+
+    def spill_lines(self):
+        if not os.path.exists(self.spill_path):
+            return []
+        with open(self.spill_path) as f:
+            return f.readlines()
+
+    def test_flushes_full_batch_before_interval(self):
+        self.writer = LogWriter(self.spill_path, batch_size=3, flush_interval_ms=1500)
+        self.writer.start()
+        for n in range(3):
+            self.writer.put(self.entry(n))
+        self.assertTrue(wait_for(lambda: self.writer.written == 3, timeout=1.0))
+        self.assertEqual([log['log']['message'] for log in self.stored()], ["entry 0", "entry 1", "entry 2"])
+
+    def test_flushes_partial_batch_after_interval(self):
+        self.writer = LogWriter(self.spill_path, batch_size=500, flush_interval_ms=50)
+        self.writer.start()
+        self.writer.put(self.entry(0))
+        self.writer.put(self.entry(1))
+        self.assertTrue(wait_for(lambda: self.writer.written == 2))
+        self.assertEqual(len(self.stored()), 2)
+
+    def test_full_queue_spills_to_disk(self):
+        writer = LogWriter(self.spill_path, max_queue_size=1, put_timeout=0.01)
+        writer.put(self.entry(0))
+        writer.put(self.entry(1))
+        self.assertEqual(writer.spilled, 1)
+        self.assertEqual(len(self.spill_lines()), 1)
+        self.assertIn("entry 1", self.spill_lines()[0])
+
+    def test_locked_database_spills_and_replays(self):
+        writer = LogWriter(self.spill_path)
+        locked = OperationalError("INSERT INTO log_entries", {}, Exception("database is locked"))
+        with mock.patch('log_writer.add_logs', side_effect=locked):
+            writer._flush([self.entry(0), self.entry(1)])
+        self.assertEqual(len(self.spill_lines()), 2)
+        self.assertEqual(self.stored(), [])
+
+        # the next flush writes the spilled rows first, then the new batch
+        writer._flush([self.entry(2)])
+        self.assertFalse(os.path.exists(self.spill_path))
+        self.assertEqual([log['log']['message'] for log in self.stored()], ["entry 0", "entry 1", "entry 2"])
+        self.assertEqual(writer.written, 3)
+
+    def test_spill_is_replayed_in_batches(self):
+        writer = LogWriter(self.spill_path, batch_size=2)
+        writer._spill([self.entry(n) for n in range(5)])
+        with mock.patch('log_writer.add_logs', wraps=database.add_logs) as add_logs:
+            writer._flush([self.entry(5)])
+        self.assertEqual([len(call.args[0]) for call in add_logs.call_args_list], [2, 2, 2])
+        self.assertEqual(len(self.stored()), 6)
+        self.assertEqual(writer.written, 6)
+
+    def test_failed_batch_is_spilled_not_dropped(self):
+        writer = LogWriter(self.spill_path, batch_size=2)
+        writer._spill([self.entry(n) for n in range(3)])
+        # the second transaction fails with something other than a locked database
+        with mock.patch('log_writer.add_logs', side_effect=[None, ValueError("bad row")]):
+            writer._flush([self.entry(3)])
+        self.assertEqual(writer.written, 2)
+        self.assertEqual(len(self.spill_lines()), 2)
+
+        writer._flush([])
+        self.assertFalse(os.path.exists(self.spill_path))
+        self.assertEqual([log['log']['message'] for log in self.stored()], ["entry 2", "entry 3"])
+
+    def test_idle_writer_replays_spill_file(self):
+        LogWriter(self.spill_path)._spill([self.entry(0)])
+        self.writer = LogWriter(self.spill_path, flush_interval_ms=20)
+        self.writer.start()
+        self.assertTrue(wait_for(lambda: len(self.stored()) == 1))
+        self.assertFalse(os.path.exists(self.spill_path))
+
+    def test_stop_flushes_queued_entries(self):
+        writer = LogWriter(self.spill_path, batch_size=2, flush_interval_ms=200)
+        writer.start()
+        for n in range(5):
+            writer.put(self.entry(n))
+        writer.stop()
+        self.assertEqual(writer.written, 5)
+        self.assertEqual(len(self.stored()), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
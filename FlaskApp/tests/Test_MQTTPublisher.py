@@ -0,0 +1,113 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from paho.mqtt import client as paho
+import mqtt
+from mqtt import MQTTPublisher, MQTTPublisherError
+
+
+class FakeClient:
+    """Stands in for paho's Client: records calls and hands out message ids."""
+    rc = paho.MQTT_ERR_SUCCESS
+
+    def __init__(self, callback_api_version=None):
+        self.published = []
+        self.connected_to = None
+        self.looping = False
+        self.disconnected = False
+        self.mid = 0
+
+    def username_pw_set(self, username, password):
+        self.credentials = (username, password)
+
+    def reconnect_delay_set(self, min_delay, max_delay):
+        pass
+
+    def max_queued_messages_set(self, count):
+        pass
+
+    def connect_async(self, host, port, keepalive):
+        self.connected_to = (host, port)
+
+    def loop_start(self):
+        self.looping = True
+
+    def loop_stop(self):
+        self.looping = False
+
+    def disconnect(self):
+        self.disconnected = True
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.mid += 1
+        self.published.append((topic, payload, qos, retain))
+        return SimpleNamespace(rc=FakeClient.rc, mid=self.mid)
+
+    def acknowledge(self, mid):
+        # what paho's network thread does once the broker has acknowledged the message
+        self.on_publish(self, None, mid, 0, None)
+
+
+class MQTTPublisherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        FakeClient.rc = paho.MQTT_ERR_SUCCESS
+        patcher = mock.patch.object(mqtt.mqtt, 'Client', FakeClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.publisher = MQTTPublisher()
+        self.addCleanup(self.publisher.stop)
+
+    def configure(self):
+        self.publisher.configure(host="homeassistant.local", port=1883, username="u", password="p")
+        return self.publisher._client
+
+    def test_not_configured(self):
+        future = self.publisher.publish("command/deadbeef", "{}")
+        self.assertTrue(future.done())
+        self.assertIsInstance(future.exception(), MQTTPublisherError)
+        self.assertFalse(self.publisher.is_configured)
+
+    def test_future_resolves_on_acknowledgement(self):
+        client = self.configure()
+        self.assertEqual(client.connected_to, ("homeassistant.local", 1883))
+        self.assertTrue(client.looping)
+        future = self.publisher.publish("command/deadbeef", "{}", retain=True)
+        self.assertFalse(future.done())
+        self.assertEqual(client.published, [("command/deadbeef", "{}", 1, True)])
+        client.acknowledge(1)
+        self.assertEqual(future.result(timeout=0), 1)
+
+    def test_acknowledgements_match_message_ids(self):
+        client = self.configure()
+        first = self.publisher.publish("a", "1")
+        second = self.publisher.publish("b", "2")
+        client.acknowledge(2)
+        self.assertTrue(second.done())
+        self.assertFalse(first.done())
+
+    def test_publish_error(self):
+        self.configure()
+        FakeClient.rc = paho.MQTT_ERR_QUEUE_SIZE
+        future = self.publisher.publish("a", "1")
+        self.assertIsInstance(future.exception(timeout=0), MQTTPublisherError)
+
+    def test_qos0_needs_connection(self):
+        self.configure()
+        FakeClient.rc = paho.MQTT_ERR_NO_CONN
+        self.assertIsInstance(self.publisher.publish("a", "1", qos=0).exception(timeout=0), MQTTPublisherError)
+        # QoS 1 messages wait for paho to reconnect
+        self.assertFalse(self.publisher.publish("a", "1", qos=1).done())
+
+    def test_stop_fails_pending_and_disconnects(self):
+        client = self.configure()
+        future = self.publisher.publish("a", "1")
+        self.publisher.stop()
+        self.assertIsInstance(future.exception(timeout=0), MQTTPublisherError)
+        self.assertTrue(client.disconnected)
+        self.assertFalse(client.looping)
+        self.assertFalse(self.publisher.is_configured)
+
+
+if __name__ == '__main__':
+    unittest.main()
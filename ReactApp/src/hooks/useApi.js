@@ -7,9 +7,10 @@ const useApi = () => {
     const [loading, setLoading] = useState(false);
     const baseUrl = config.apiHost
 
-    const fetchLogs = async () => {
+    const fetchLogs = async (sinceId = null) => {
         setLoading(true);
-        const response = await fetch(`${baseUrl}/logs`);
+        const query = sinceId !== null ? `?since_id=${sinceId}` : '';
+        const response = await fetch(`${baseUrl}/logs/${query}`);
         const data = await response.json();
         setLoading(false);
         return data;
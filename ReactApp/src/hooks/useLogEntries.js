@@ -8,17 +8,25 @@ export default function useLogEntries(pollingSeconds=null){
     const dispatch = useDispatch();
     const {fetchLogs} = useApi();
     const shouldUpdateLogs = useSelector(state => state['globalState']['shouldUpdateLogs'])
+    const deviceLogs = useSelector(state => state['globalState']['deviceLogs'])
+    const sseConnected = useSelector(state => state['globalState']['sseConnected'])
 
 
     useEffect(() => {
         let timeout;
         if (shouldUpdateLogs) {
-            fetchLogs().then(data => {
-                dispatch(globalStateActions.updateDeviceLogs(data));
+            const lastId = deviceLogs.length ? deviceLogs[deviceLogs.length - 1].id : null;
+            fetchLogs(lastId).then(data => {
+                if (lastId === null) {
+                    dispatch(globalStateActions.updateDeviceLogs(data));
+                } else if (data.length) {
+                    dispatch(globalStateActions.appendDeviceLogs(data));
+                }
                 dispatch(globalStateActions.updateShouldUpdateLogs(false));
                 // console.log("checked for logs");
             });
-        } else if (pollingSeconds) {
+        } else if (pollingSeconds && !sseConnected) {
+            // new logs arrive over SSE while it's connected
             timeout = setTimeout(
                 () => dispatch(globalStateActions.updateShouldUpdateLogs(true)),
                 pollingSeconds * 1000);
@@ -26,6 +34,6 @@ export default function useLogEntries(pollingSeconds=null){
 
         // Cleanup function to clear the timeout
         return () => clearTimeout(timeout);
-    }, [shouldUpdateLogs]);
+    }, [shouldUpdateLogs, sseConnected]);
 
 };
\ No newline at end of file
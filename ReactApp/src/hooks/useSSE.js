@@ -14,6 +14,16 @@ export default function useSSE() {
 
         const eventSource = new EventSource(url);
 
+        eventSource.onopen = () => {
+            dispatch(globalStateActions.updateSseConnected(true))
+        };
+
+        eventSource.onerror = () => {
+            // EventSource reconnects on its own and resumes from Last-Event-ID; poll until it does
+            dispatch(globalStateActions.updateSseConnected(false))
+            dispatch(globalStateActions.updateShouldUpdateLogs(true))
+        };
+
         eventSource.onmessage = (event) => {
             const data = JSON.parse(event.data);
             if (data.type === 'log') {
@@ -33,6 +43,7 @@ export default function useSSE() {
 
         return () => {
             eventSource.close();
+            dispatch(globalStateActions.updateSseConnected(false))
         };
     }, []);
 
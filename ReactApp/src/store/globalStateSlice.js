@@ -1,5 +1,12 @@
 import {createSlice} from "@reduxjs/toolkit";
 
+// SSE and since_id polling can deliver the same log, so entries are appended once per id
+const appendNewLogs = (logs, newLogs) => {
+    const ids = new Set(logs.map(entry => entry.id))
+    const fresh = newLogs.filter(entry => !ids.has(entry.id))
+    return fresh.length ? [...logs, ...fresh] : logs
+}
+
 const initialState = {
 
     devices: [],
@@ -18,6 +25,7 @@ const initialState = {
     showConnectionForm: 'None',
     shouldUpdateDevices: true,
     shouldUpdateLogs: true,
+    sseConnected: false,
 
 }
 const globalStateSlice = createSlice({
@@ -47,7 +55,10 @@ const globalStateSlice = createSlice({
             state.deviceLogs = action.payload
         },
         addDeviceLog(state, action){
-            state.deviceLogs = [...state.deviceLogs, action.payload]
+            state.deviceLogs = appendNewLogs(state.deviceLogs, [action.payload])
+        },
+        appendDeviceLogs(state, action){
+            state.deviceLogs = appendNewLogs(state.deviceLogs, action.payload)
         },
         deleteDeviceLog(state, action){
             const entryID = action.payload
@@ -86,6 +97,9 @@ const globalStateSlice = createSlice({
         updateShouldUpdateLogs(state, action) {
             state.shouldUpdateLogs = action.payload
         },
+        updateSseConnected(state, action) {
+            state.sseConnected = action.payload
+        },
     }
 })
 